@@ -0,0 +1,143 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import FreeCAD
+from PluginLog import log
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+# Gap between the plates that overflow the bed, in the document
+plateGap = 20.0
+
+class Footprint:
+	'''The XY bound box of one object and where it has been packed'''
+	def __init__(self, obj, w, h):
+		self.obj = obj
+		self.w = w
+		self.h = h
+		self.rotated = False
+		self.plate = None
+		self.x = 0.0
+		self.y = 0.0
+
+	def rotate(self):
+		self.w, self.h = self.h, self.w
+		self.rotated = not self.rotated
+
+class Plate:
+	def __init__(self):
+		self.items = []
+		# [y, height, next free x] of every shelf
+		self.shelves = []
+		self.top = 0.0
+
+def packShelves(items, bedW, bedH, spacing):
+	'''Pack footprints onto as few bed sized plates as possible
+
+	First fit decreasing height shelf packing: items are laid long side
+	along X, sorted tallest first and put on the first shelf of the first
+	plate with room. Returns the plates and the items too big for the bed.'''
+	plates = []
+	unplaced = []
+	for it in items:
+		if it.h > it.w and it.h <= bedW and it.w <= bedH:
+			it.rotate()
+		elif it.w > bedW and it.h <= bedW and it.w <= bedH:
+			it.rotate()
+	for it in sorted(items, key=lambda i: (i.h, i.w), reverse=True):
+		if it.w > bedW or it.h > bedH:
+			unplaced.append(it)
+			continue
+		placed = False
+		for plate in plates:
+			placed = placeOnPlate(plate, it, bedW, bedH, spacing)
+			if placed:
+				break
+		if not placed:
+			plate = Plate()
+			plates.append(plate)
+			placeOnPlate(plate, it, bedW, bedH, spacing)
+	for index, plate in enumerate(plates):
+		for it in plate.items:
+			it.plate = index
+	return (plates, unplaced)
+
+def placeOnPlate(plate, it, bedW, bedH, spacing):
+	for shelf in plate.shelves:
+		if it.h <= shelf[1] and shelf[2] + it.w <= bedW:
+			it.x = shelf[2]
+			it.y = shelf[0]
+			shelf[2] += it.w + spacing
+			plate.items.append(it)
+			return True
+	if plate.top + it.h <= bedH:
+		plate.shelves.append([plate.top, it.h, it.w + spacing])
+		it.x = 0.0
+		it.y = plate.top
+		plate.top += it.h + spacing
+		plate.items.append(it)
+		return True
+	return False
+
+def platePitch(bedH):
+	'''Y distance between consecutive plates in the document'''
+	return bedH + plateGap
+
+def objectBounds(obj):
+	'''Bound box of a Part or Mesh object, None for anything else'''
+	if hasattr(obj, "Shape"):
+		return obj.Shape.BoundBox
+	if hasattr(obj, "Mesh"):
+		return obj.Mesh.BoundBox
+	return None
+
+def arrange(partList, bedW, bedH, offsetX, offsetY, spacing):
+	'''Move the parts onto the bed, spilling onto extra plates along +Y
+
+	Returns a list with the objects of every plate and the objects that
+	don't fit on the bed at all.'''
+	items = []
+	for obj in partList:
+		bb = objectBounds(obj)
+		if bb is None:
+			log.warn("Can't arrange %s, it has no shape or mesh", obj.Label)
+			continue
+		items.append(Footprint(obj, bb.XLength, bb.YLength))
+	plates, unplaced = packShelves(items, bedW, bedH, spacing)
+	pitch = platePitch(bedH)
+	for plate in plates:
+		for it in plate.items:
+			obj = it.obj
+			if it.rotated:
+				center = objectBounds(obj).Center
+				rot = FreeCAD.Placement(FreeCAD.Vector(), FreeCAD.Rotation(FreeCAD.Vector(0, 0, 1), 90), center)
+				obj.Placement = rot.multiply(obj.Placement)
+			bb = objectBounds(obj)
+			dx = offsetX + it.x - bb.XMin
+			dy = offsetY + it.y + it.plate * pitch - bb.YMin
+			pl = obj.Placement
+			pl.Base = pl.Base + FreeCAD.Vector(dx, dy, 0)
+			obj.Placement = pl
+	return ([[it.obj for it in plate.items] for plate in plates], [it.obj for it in unplaced])
@@ -22,8 +22,8 @@
 #***************************************************************************
 
 # import FreeCAD modules
-import FreeCAD, FreeCADGui,inspect
-from FreeCAD import Console
+import FreeCAD, FreeCADGui,inspect,time
+from PluginLog import log
 
 # helper -------------------------------------------------------------------
 
@@ -38,6 +38,27 @@ def addCommand(name,cmdObject):
 		source += list[i+1][pos:]
 	FreeCADGui.addCommand(name,cmdObject,source)
 	
+def loadModule(name):
+	'''Import a plugin module, reloading it in dev mode so edits are picked up'''
+	import UiLoader
+	module = __import__(name)
+	if UiLoader.devMode():
+		reload(module)
+	return module
+
+def showPanel(moduleName, panelName):
+	'''Build and show a task panel, logging how long each step took'''
+	t0 = time.time()
+	module = loadModule(moduleName)
+	t1 = time.time()
+	panel = getattr(module, panelName)()
+	t2 = time.time()
+	FreeCADGui.Control.showDialog(panel)
+	t3 = time.time()
+	log.info("%s shown in %.0f ms (import %.0f ms, build %.0f ms, show %.0f ms)",
+			panelName, (t3 - t0) * 1000, (t1 - t0) * 1000, (t2 - t1) * 1000, (t3 - t2) * 1000)
+	return panel
+
 
 #---------------------------------------------------------------------------
 # The command classes
@@ -46,11 +67,8 @@ def addCommand(name,cmdObject):
 class createMachineDef:
 	"Create a 3D Printer Definition"
 	def Activated(self):
-		import MachineDef
-		reload(MachineDef)
-		panel = MachineDef.PrintBedTaskPanel()
-		FreeCADGui.Control.showDialog(panel)
-		Console.PrintMessage("Activated Machine Definition Command \n")
+		showPanel("MachineDef", "PrintBedTaskPanel")
+		log.debug("Activated Machine Definition Command")
 
 	def GetResources(self):
 		return {'Pixmap'  : 'Std_Tool1', 'MenuText': 'Create 3D Printer Definition', 'ToolTip': 'Define a 3D Printer'}
@@ -58,15 +76,28 @@ class createMachineDef:
 class sliceCuraEngine:
 	"Run the CuraEngine Slicer Tool"
 	def Activated(self):
-		import SlicerPanel
-		reload(SlicerPanel)
-		panel = SlicerPanel.SlicerPanel()
-		FreeCADGui.Control.showDialog(panel)
-		Console.PrintMessage("Activated CuraEngine Tool \n")
+		showPanel("SlicerPanel", "SlicerPanel")
+		log.debug("Activated CuraEngine Tool")
 
 	def GetResources(self):
 		return {'Pixmap'  : 'Std_Tool2', 'MenuText': 'Slice With CuraEngine', 'ToolTip': 'Run the CuraEngine Slicer Tool'}
 
+class previewToolpath:
+	"Show a G-code file in the 3D view"
+	def Activated(self):
+		from PySide import QtGui
+		doc = FreeCAD.ActiveDocument
+		if not doc:
+			FreeCAD.newDocument()
+			doc = FreeCAD.ActiveDocument
+		fileName, _ = QtGui.QFileDialog.getOpenFileName(None, 'Open G-code File', doc.FileName, 'G-code (*.gcode)')
+		if fileName:
+			loadModule("Toolpath").makeToolpath(fileName)
+		log.debug("Activated Toolpath Preview Command")
+
+	def GetResources(self):
+		return {'Pixmap'  : 'Std_Tool3', 'MenuText': 'Preview G-code', 'ToolTip': 'Show the toolpath of a G-code file'}
+
 #---------------------------------------------------------------------------
 # Adds the commands to the FreeCAD command manager
 #---------------------------------------------------------------------------
@@ -74,3 +105,4 @@ class sliceCuraEngine:
 #addCommand('sliceCuraEngine',sliceCuraEngine())
 FreeCADGui.addCommand('createMachineDef',createMachineDef())
 FreeCADGui.addCommand('sliceCuraEngine',sliceCuraEngine())
+FreeCADGui.addCommand('previewToolpath',previewToolpath())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+'''A stand-in for the legacy CuraEngine command line
+
+Takes the same arguments as CuraEngine:
+
+	FakeEngine.py [-v] [-p] [-s key=value ...] -o out.gcode mesh.stl
+
+reports progress on stderr like CuraEngine does with -p and writes
+CuraEngine style G-code: a wall and a zigzag infill filling the mesh's
+bound box on every layer. The extra options set how big and how slow
+the job is:
+
+	--layers N       layers to write, 0 follows the mesh height (default)
+	--moves N        moves per layer (default 500)
+	--layer-time S   seconds spent per layer (default 0.01)
+	--exit-code N    fail with N without writing G-code
+
+Only needs Python and numpy, so the job runners, the cache and the G-code
+parsers can be tested and benchmarked without CuraEngine.'''
+
+import argparse, math, os, sys, time
+import numpy
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+# Default settings, in CuraEngine's units (microns, mm/s, %)
+defaults = {
+	"layerThickness": 100, "initialLayerThickness": 300, "extrusionWidth": 400,
+	"filamentDiameter": 2890, "filamentFlow": 100, "posx": 100000, "posy": 100000,
+	"printSpeed": 50, "infillSpeed": 50, "moveSpeed": 200, "initialLayerSpeed": 20,
+	"fanSpeedMax": 100, "fanFullOnLayerNr": 2, "startCode": "", "endCode": "",
+}
+
+def parseArgs(argv):
+	parser = argparse.ArgumentParser(description="Fake CuraEngine")
+	parser.add_argument("--layers", type=int, default=0)
+	parser.add_argument("--moves", type=int, default=500)
+	parser.add_argument("--layer-time", type=float, default=0.01)
+	parser.add_argument("--exit-code", type=int, default=0)
+	parser.add_argument("-v", action="store_true", dest="verbose")
+	parser.add_argument("-p", action="store_true", dest="progress")
+	parser.add_argument("-s", action="append", default=[], dest="settings")
+	parser.add_argument("-o", dest="output", required=True)
+	parser.add_argument("mesh")
+	return parser.parse_args(argv)
+
+def readSettings(pairs):
+	settings = dict(defaults)
+	for pair in pairs:
+		key, _, value = pair.partition("=")
+		if isinstance(defaults.get(key), str):
+			settings[key] = value
+		else:
+			try:
+				settings[key] = float(value)
+			except ValueError:
+				settings[key] = value
+	return settings
+
+def meshBounds(fileName):
+	'''(min, max) corners of the vertices of a binary or ASCII STL'''
+	size = os.path.getsize(fileName)
+	with open(fileName, "rb") as f:
+		f.seek(80)
+		count = numpy.fromfile(f, dtype="<u4", count=1)
+	if len(count) and size == 84 + 50 * int(count[0]):
+		record = numpy.dtype([("normal", "<f4", (3,)), ("verts", "<f4", (3, 3)), ("attr", "<u2")])
+		with open(fileName, "rb") as f:
+			f.seek(84)
+			verts = numpy.fromfile(f, dtype=record)["verts"].reshape(-1, 3)
+	else:
+		with open(fileName, "rb") as f:
+			verts = numpy.array([[float(v) for v in line.split()[1:4]] for line in f
+								if line.strip().startswith(b"vertex")]).reshape(-1, 3)
+	if not len(verts):
+		raise ValueError("no triangles in " + fileName)
+	return (verts.min(axis=0), verts.max(axis=0))
+
+class Progress:
+	'''Writes the -p progress lines, spending layerTime seconds per layer in all'''
+	stages = ["slice", "layerparts", "inset", "support", "skin", "export"]
+
+	def __init__(self, enabled, layers, layerTime):
+		self.enabled = enabled
+		self.layers = layers
+		self.step = max(1, layers // 50)
+		self.pause = layerTime * self.step / len(self.stages)
+
+	def report(self, stage, layer):
+		'''Called for every layer of every stage'''
+		if (layer + 1) % self.step and layer + 1 != self.layers:
+			return
+		if self.pause > 0:
+			time.sleep(self.pause)
+		if self.enabled:
+			sys.stderr.write("Progress:%s:%d:%d\n" % (stage, layer + 1, self.layers))
+			sys.stderr.flush()
+
+def layerMoves(settings, layer, z, lo, hi, moves):
+	'''The G-code of one layer, E relative to the start of the layer, and the filament it uses'''
+	width = settings["extrusionWidth"] / 1000.0
+	radius = settings["filamentDiameter"] / 2000.0
+	thickness = z if layer == 0 else settings["layerThickness"] / 1000.0
+	ePerMm = width * thickness / (math.pi * radius * radius) * settings["filamentFlow"] / 100.0
+	if layer == 0:
+		speed = settings["initialLayerSpeed"]
+	else:
+		speed = settings["printSpeed"]
+	(x0, y0), (x1, y1) = lo, hi
+	wall = numpy.array([[x1, y0], [x1, y1], [x0, y1], [x0, y0]])
+	# Zigzag infill inside the wall, across X and Y on alternate layers
+	count = max(2, moves - 5) // 2 * 2
+	columns = numpy.repeat(numpy.linspace(0.0, 1.0, count // 2), 2)
+	rows = numpy.resize([0.0, 1.0, 1.0, 0.0], count)
+	if layer % 2:
+		columns, rows = rows, columns
+	inset = width
+	fill = numpy.column_stack([x0 + inset + columns * (x1 - x0 - 2 * inset),
+							y0 + inset + rows * (y1 - y0 - 2 * inset)])
+	start = numpy.array([[x0, y0]])
+	path = numpy.vstack([start, wall, fill])
+	e = numpy.concatenate([[0.0], numpy.cumsum(numpy.hypot(*numpy.diff(path, axis=0).T) * ePerMm)])
+	lines = [";LAYER:%d" % layer]
+	if settings["fanSpeedMax"] > 0 and layer == int(settings["fanFullOnLayerNr"]):
+		lines.append("M106 S%d" % int(settings["fanSpeedMax"] * 255 / 100))
+	lines.append("G0 F%d X%.3f Y%.3f Z%.3f" % (settings["moveSpeed"] * 60, x0, y0, z))
+	lines.append(";TYPE:WALL-OUTER")
+	first = True
+	for i, (x, y) in enumerate(path[1:].tolist()):
+		if i == len(wall):
+			lines.append(";TYPE:FILL")
+			speed = settings["infillSpeed"] if layer else speed
+			first = True
+		if first:
+			lines.append("G1 F%d X%.3f Y%.3f E%%.5f" % (speed * 60, x, y))
+			first = False
+		else:
+			lines.append("G1 X%.3f Y%.3f E%%.5f" % (x, y))
+	return (lines, e[1:], e[-1])
+
+def main(argv):
+	args = parseArgs(argv)
+	settings = readSettings(args.settings)
+	start = time.time()
+	if args.verbose:
+		sys.stderr.write("Loading %s from disk...\n" % args.mesh)
+	try:
+		lo, hi = meshBounds(args.mesh)
+	except (IOError, OSError, ValueError) as e:
+		sys.stderr.write("Failed to load model: %s\n" % e)
+		return 1
+	if args.verbose:
+		sys.stderr.write("Loaded from disk in %5.3fs\n" % (time.time() - start))
+	# Centered on posx/posy with the bottom on the bed, like CuraEngine places it
+	size = hi - lo
+	center = numpy.array([settings["posx"], settings["posy"]]) / 1000.0
+	lo2 = center - size[:2] / 2
+	hi2 = center + size[:2] / 2
+	first = settings["initialLayerThickness"] / 1000.0
+	thickness = settings["layerThickness"] / 1000.0
+	layers = args.layers
+	if layers <= 0:
+		layers = max(1, int(math.ceil((size[2] - first) / thickness)) + 1)
+	progress = Progress(args.progress, layers, args.layer_time)
+	for stage in progress.stages[:-1]:
+		for layer in range(layers):
+			progress.report(stage, layer)
+	if args.exit_code:
+		sys.stderr.write("Fake engine failing with exit code %d\n" % args.exit_code)
+		return args.exit_code
+	out = open(args.output, "wb")
+	try:
+		out.write((";Generated with Cura_SteamEngine 14.12.1 (FakeEngine)\n" +
+				settings["startCode"] + "\n;Layer count: %d\n" % layers).encode("latin-1"))
+		e = 0.0
+		for layer in range(layers):
+			z = first + layer * thickness
+			lines, eValues, used = layerMoves(settings, layer, z, lo2, hi2, args.moves)
+			text = "\n".join(lines) + "\n"
+			out.write((text % tuple((eValues + e).tolist())).encode("latin-1"))
+			e += used
+			progress.report("export", layer)
+		out.write(("M107\n;End GCode\n" + settings["endCode"] + "\n").encode("latin-1"))
+	finally:
+		out.close()
+	if args.verbose:
+		sys.stderr.write("Wrote %d layers, %.1f mm of filament in %5.3fs\n" % (layers, e, time.time() - start))
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,371 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import os, mmap, time
+from math import pi
+import numpy
+from numpy.lib.stride_tricks import as_strided
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+# The file is analyzed this many bytes at a time, cut at a line end
+chunkSize = 16 << 20
+
+# Longest number read after a word letter, eg "-12345.67890"
+numberWidth = 12
+
+layerMarker = numpy.frombuffer(b";LAYER:", dtype=numpy.uint8)
+# Byte -> digit value, and whether the byte can be part of a number
+digitValue = numpy.zeros(256, dtype=numpy.uint8)
+digitValue[48:58] = numpy.arange(10)
+numberChar = numpy.zeros(256, dtype=bool)
+numberChar[48:58] = True
+numberChar[[45, 46]] = True
+# Place values of a right aligned number window
+placeValues = 10.0 ** numpy.arange(numberWidth - 1, -1, -1)
+pow10 = 10 ** numpy.arange(numberWidth + 1, dtype=numpy.int64)
+
+def parseNumbers(buf, starts):
+	'''Parse the decimal numbers starting at every offset in starts, all at once
+
+	buf has to be padded with numberWidth spaces on both ends. Every number
+	is read through a numberWidth byte window, right aligned so its digits
+	line up with placeValues. Whatever is left of the number in the window
+	and the dot are taken out with integer arithmetic afterwards. Gives NaN
+	where there is no number.'''
+	w = numberWidth
+	rows = as_strided(buf, (len(buf) - w + 1, w), (buf.strides[0], buf.strides[0]))
+	num = numberChar[rows[starts]]
+	length = numpy.where(num.all(axis=1), w, numpy.argmin(num, axis=1))
+	win = rows[starts + length - w]
+	# The digits of the window as one integer, dot and sign read as 0
+	digits = digitValue[win].astype(numpy.float64).dot(placeValues).astype(numpy.int64)
+	digits %= pow10[length]
+	# The rightmost dot is the number's if it is within its length
+	dots = win[:, ::-1] == 46
+	frac = dots.argmax(axis=1)
+	hasDot = dots[numpy.arange(len(frac)), frac] & (frac < length)
+	frac[~hasDot] = 0
+	# Digits left of the dot are one place too high
+	right = digits % pow10[frac]
+	mantissa = numpy.where(hasDot, (digits - right) // 10 + right, digits)
+	val = mantissa / pow10[frac].astype(numpy.float64)
+	val[buf[starts] == 45] *= -1
+	val[length == 0] = numpy.nan
+	return val
+
+def ffill(values, initial):
+	'''Replace every NaN with the last value before it, initial before the first one'''
+	values = numpy.concatenate(([initial], values))
+	idx = numpy.where(numpy.isnan(values), 0, numpy.arange(len(values)))
+	numpy.maximum.accumulate(idx, out=idx)
+	return values[idx][1:]
+
+def previous(values, initial):
+	'''values shifted one place down, initial first'''
+	return numpy.concatenate(([initial], values[:-1]))
+
+class GcodeStats:
+	'''What analyzeFile found in a G-code file
+
+	Times are in seconds, filament length in mm, volume in mm^3 and mass in
+	grams. layerTimes[0] is everything before the first ;LAYER: marker
+	(homing, heating and priming), layerTimes[n] is layer n-1.'''
+	def __init__(self, filamentDiameter, density, acceleration):
+		self.filamentDiameter = filamentDiameter
+		self.density = density
+		self.acceleration = acceleration
+		self.lines = 0
+		self.moves = 0
+		self.layers = 0
+		self.time = 0.0
+		self.filament = 0.0
+		self.layerTimes = numpy.zeros(1)
+		self.elapsed = 0.0
+
+	def volume(self):
+		return self.filament * pi * (self.filamentDiameter / 2.0) ** 2
+
+	def mass(self):
+		# density is in g/cm^3
+		return self.volume() / 1000.0 * self.density
+
+	def summary(self):
+		h, rest = divmod(int(self.time + 0.5), 3600)
+		lines = ["Print time: %dh %02dm %02ds" % (h, rest // 60, rest % 60),
+				"Filament: %.2f m, %.1f cm3, %.1f g" % (self.filament / 1000.0, self.volume() / 1000.0, self.mass()),
+				"Layers: %d" % self.layers,
+				"Moves: %d of %d lines, analyzed in %.2fs" % (self.moves, self.lines, self.elapsed)]
+		return '\n'.join(lines) + '\n'
+
+	def writeReport(self, fileName):
+		'''Write the summary and the time of every layer to fileName'''
+		f = open(fileName, 'w')
+		f.write(self.summary())
+		f.write("\nFilament diameter: %.3f mm, density: %.3f g/cm3, acceleration: %.0f mm/s2\n" %
+				(self.filamentDiameter, self.density, self.acceleration))
+		f.write("\nStart: %.1fs\n" % self.layerTimes[0])
+		for n, t in enumerate(self.layerTimes[1:]):
+			f.write("Layer %d: %.1fs\n" % (n, t))
+		f.close()
+
+class GcodeAnalyzer:
+	'''Vectorized G-code analysis, a chunk of the file at a time
+
+	Each chunk is tokenized with numpy: the word letters outside comments
+	are found with byte masks, the numbers after them are parsed in bulk
+	and scattered into per line X/Y/Z/E/F columns. The modal state (position,
+	feedrate, extruder, layer) is carried from one chunk to the next.
+
+	Move times assume every move starts and ends at rest with a trapezoidal
+	speed profile, so the estimate is on the slow side for short moves.'''
+	def __init__(self, filamentDiameter=3.0, density=1.24, acceleration=3000.0, keepSegments=False, keepLayers=False):
+		self.stats = GcodeStats(filamentDiameter, density, acceleration)
+		# (start points, end points, extruding, layer) of the moves of every chunk
+		if keepSegments:
+			self.segments = []
+		else:
+			self.segments = None
+		# layerFields arrays of the ;LAYER: markers of every chunk
+		if keepLayers:
+			self.layerMarks = []
+		else:
+			self.layerMarks = None
+		# Position, feedrate (mm/min), last E and the G91 and M83 modes carried between chunks
+		self.pos = numpy.zeros(3)
+		self.feed = 3000.0
+		self.lastE = 0.0
+		self.relativeMoves = 0.0
+		self.relative = 0.0
+		# Fan speed, only followed for the layer marks
+		self.fan = 0.0
+
+	def analyzeChunk(self, buf, offset=0):
+		'''Add a uint8 array of whole lines (ending with a newline) to the stats
+
+		offset is where buf starts in the file.'''
+		nlPos = numpy.flatnonzero(buf == 10)
+		nLines = len(nlPos)
+		# Word letters are capitals at the start of a line or after a blank,
+		# buf[-1] is a line end so the first byte needs no special case
+		wpos = numpy.flatnonzero((buf - numpy.uint8(65)) < 26)
+		before = buf[wpos - 1]
+		wpos = wpos[(before == 32) | (before == 10) | (before == 9)]
+		wline = numpy.searchsorted(nlPos, wpos)
+		# Drop the letters after the first ; of their line
+		semis = numpy.flatnonzero(buf == 59)
+		semiLine = numpy.searchsorted(nlPos, semis)
+		firstSemi = numpy.empty(nLines, dtype=numpy.int64)
+		firstSemi.fill(len(buf))
+		first = numpy.concatenate(([True], semiLine[1:] != semiLine[:-1]))[:len(semis)]
+		firstSemi[semiLine[first]] = semis[first]
+		code = wpos < firstSemi[wline]
+		wpos = wpos[code]
+		wline = wline[code]
+		letters = buf[wpos]
+		pad = numpy.empty(numberWidth, dtype=numpy.uint8)
+		pad.fill(32)
+		values = parseNumbers(numpy.concatenate((pad, buf, pad)), wpos + 1 + numberWidth)
+
+		cols = {}
+		for letter in "GMXYZEFPS":
+			col = numpy.empty(nLines)
+			col.fill(numpy.nan)
+			sel = letters == ord(letter)
+			col[wline[sel]] = values[sel]
+			cols[letter] = col
+		G = cols["G"]
+		M = cols["M"]
+		isMove = (G == 0) | (G == 1)
+		isSet = G == 92
+		isHome = G == 28
+
+		# Layer markers at the start of a line
+		markers = semis[buf[semis - 1] == 10]
+		idx = numpy.minimum(markers[:, numpy.newaxis] + numpy.arange(len(layerMarker)), len(buf) - 1)
+		isLayer = numpy.zeros(nLines, dtype=bool)
+		isLayer[numpy.searchsorted(nlPos, markers[(buf[idx] == layerMarker).all(axis=1)])] = True
+		layerOf = self.stats.layers + numpy.cumsum(isLayer)
+		self.stats.layers += int(isLayer.sum())
+
+		# Modal position, homing puts the axes it doesn't name at 0. G91
+		# moves only count as steps, the position isn't tracked through them
+		relativeMoves = ffill(numpy.where(G == 91, 1.0, numpy.where(G == 90, 0.0, numpy.nan)), self.relativeMoves)
+		self.relativeMoves = relativeMoves[-1]
+		stepped = isMove & (relativeMoves > 0)
+		positioned = (isMove | isSet | isHome) & ~stepped
+		steps = []
+		axes = []
+		for i, letter in enumerate("XYZ"):
+			col = numpy.where(positioned, cols[letter], numpy.nan)
+			col[isHome & numpy.isnan(col)] = 0.0
+			col = ffill(col, self.pos[i])
+			step = col - previous(col, self.pos[i])
+			step[stepped] = numpy.nan_to_num(cols[letter][stepped])
+			steps.append(step)
+			axes.append(col)
+			self.pos[i] = col[-1]
+		feed = ffill(numpy.where(isMove, cols["F"], numpy.nan), self.feed)
+		self.feed = feed[-1]
+
+		# Extrusion, M82/M83 switch between absolute and relative E, so do G90/G91
+		mode = numpy.where((M == 82) | (G == 90), 0.0, numpy.where((M == 83) | (G == 91), 1.0, numpy.nan))
+		relative = ffill(mode, self.relative)
+		eLine = numpy.flatnonzero((isMove | isSet) & ~numpy.isnan(cols["E"]))
+		e = cols["E"][eLine]
+		delta = numpy.where(relative[eLine] > 0, e, e - previous(e, self.lastE))
+		delta[isSet[eLine]] = 0.0
+		lastE = self.lastE
+		if len(e):
+			self.lastE = e[-1]
+		self.relative = relative[-1]
+		eDelta = numpy.zeros(nLines)
+		eDelta[eLine] = delta
+
+		# Move times
+		moves = numpy.flatnonzero(isMove)
+		d2 = numpy.zeros(len(moves))
+		for step in steps:
+			d2 += step[moves] ** 2
+		dist = numpy.sqrt(d2)
+		dist = numpy.where(dist > 0, dist, numpy.abs(eDelta[moves]))
+		v = numpy.maximum(feed[moves] / 60.0, 1e-3)
+		a = self.stats.acceleration
+		t = numpy.where(dist >= v * v / a, dist / v + v / a, 2.0 * numpy.sqrt(dist / a))
+		lineTime = numpy.zeros(nLines)
+		lineTime[moves] = t
+		# G4 dwell, P in ms or S in seconds
+		dwell = G == 4
+		lineTime[dwell] = numpy.nan_to_num(cols["P"][dwell]) / 1000.0 + numpy.nan_to_num(cols["S"][dwell])
+
+		perLayer = numpy.bincount(layerOf, weights=lineTime, minlength=self.stats.layers + 1)
+		if len(perLayer) > len(self.stats.layerTimes):
+			self.stats.layerTimes = numpy.concatenate((self.stats.layerTimes, numpy.zeros(len(perLayer) - len(self.stats.layerTimes))))
+		self.stats.layerTimes[:len(perLayer)] += perLayer
+		if self.layerMarks is not None:
+			self.markLayers(numpy.flatnonzero(isLayer), nlPos, offset, axes, moves, eLine, e, lastE, eDelta,
+							cols, feed, relative)
+		self.stats.time += float(lineTime.sum())
+		self.stats.filament += float(eDelta[moves].sum())
+		self.stats.moves += len(moves)
+		self.stats.lines += nLines
+
+		if self.segments is not None:
+			end = numpy.column_stack([col[moves] for col in axes])
+			start = end - numpy.column_stack([step[moves] for step in steps])
+			self.segments.append((start.astype(numpy.float32), end.astype(numpy.float32),
+								eDelta[moves] > 0, (layerOf[moves] - 1).astype(numpy.int32)))
+
+	def markLayers(self, marks, nlPos, offset, axes, moves, eLine, e, lastE, eDelta, cols, feed, relative):
+		'''Record where the layers of a chunk start and the machine state there
+
+		marks are the line numbers of the markers in the chunk. Marker lines
+		aren't moves, so the values carried to them are the state before the
+		layer. The layer's Z is the Z after its first move.'''
+		# M106 without S is full speed
+		M = cols["M"]
+		fan = numpy.where(M == 106, numpy.where(numpy.isnan(cols["S"]), 255.0, cols["S"]),
+						numpy.where(M == 107, 0.0, numpy.nan))
+		fan = ffill(fan, self.fan)
+		self.fan = fan[-1]
+		eRegister = numpy.empty(len(nlPos))
+		eRegister.fill(numpy.nan)
+		eRegister[eLine] = e
+		eRegister = ffill(eRegister, lastE)
+		eTotal = self.stats.filament + numpy.cumsum(eDelta)
+		z = numpy.empty(len(marks))
+		z.fill(numpy.nan)
+		if len(moves):
+			# Layers of the last chunk that had no move in it yet
+			for fields in self.layerMarks:
+				if len(fields["z"]) and numpy.isnan(fields["z"][-1]):
+					fields["z"][numpy.isnan(fields["z"])] = axes[2][moves[0]]
+			firstMove = numpy.searchsorted(moves, marks)
+			found = firstMove < len(moves)
+			z[found] = axes[2][moves[firstMove[found]]]
+		starts = numpy.concatenate(([0], nlPos[:-1] + 1))
+		self.layerMarks.append({
+			"offset": offset + starts[marks],
+			"line": self.stats.lines + marks,
+			"x": axes[0][marks],
+			"y": axes[1][marks],
+			"z0": axes[2][marks],
+			"z": z,
+			"e": eRegister[marks],
+			"eTotal": eTotal[marks],
+			"feed": feed[marks],
+			"relative": relative[marks],
+			"fan": fan[marks]})
+
+	def analyzeFile(self, fileName):
+		start = time.time()
+		size = os.path.getsize(fileName)
+		if size:
+			f = open(fileName, 'rb')
+			mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			try:
+				offset = 0
+				while offset < size:
+					end = mm.rfind(b"\n", offset, min(offset + chunkSize, size)) + 1
+					if end <= offset:
+						# A line longer than a chunk, or the last line
+						end = mm.find(b"\n", offset) + 1 or size
+					buf = chunkArray(mm, offset, end)
+					self.analyzeChunk(buf, offset)
+					# No views of the map may be left when it is closed
+					del buf
+					offset = end
+			finally:
+				mm.close()
+				f.close()
+		self.stats.elapsed = time.time() - start
+		return self.stats
+
+def chunkArray(mm, start, end):
+	'''The bytes start to end of a mapped file as a uint8 array ending with a line end'''
+	buf = numpy.frombuffer(mm, dtype=numpy.uint8, count=end - start, offset=start)
+	if buf[-1] != 10:
+		buf = numpy.append(buf, numpy.uint8(10))
+	return buf
+
+def analyzeFile(fileName, filamentDiameter=3.0, density=1.24, acceleration=3000.0):
+	'''Print time, filament and layer statistics of a G-code file'''
+	return GcodeAnalyzer(filamentDiameter, density, acceleration).analyzeFile(fileName)
+
+def readSegments(fileName):
+	'''The moves of a G-code file as (start points, end points, extruding, layer) arrays
+
+	Points are (N, 3) float32 arrays, layer is -1 for the moves before the
+	first ;LAYER: marker.'''
+	analyzer = GcodeAnalyzer(keepSegments=True)
+	analyzer.analyzeFile(fileName)
+	if not analyzer.segments:
+		return (numpy.zeros((0, 3), numpy.float32), numpy.zeros((0, 3), numpy.float32),
+				numpy.zeros(0, bool), numpy.zeros(0, numpy.int32))
+	return tuple([numpy.concatenate(parts) for parts in zip(*analyzer.segments)])
+
+def reportFile(logFile):
+	'''The statistics are written next to the slice log'''
+	return os.path.splitext(logFile)[0] + ".stats"
@@ -0,0 +1,506 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import LayerIndex
+import os, io, time
+import numpy
+from PluginLog import log
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+# Merging the G-code of parts that were sliced on their own
+#
+# Every engine output is split at its ;LAYER: markers and the layers of all
+# of them are merged by Z, so layer n of the print has every part that has
+# a layer at that height. Within a layer the parts (islands) are printed in
+# nearest neighbour order with a travel move between them.
+#
+# The E axis of every part is read as steps and written out again as one
+# continuous axis, in the mode the start code left the printer in. A part
+# can be retracted where its G-code stops and unretracted where it goes on,
+# so the retraction still pending on the printer is brought to what the
+# next part expects before it starts.
+#
+# Fan and temperature commands are taken out of the layers and set once at
+# the start of every merged layer: the fan at the highest speed a part of
+# the layer asks for, the temperatures as the first part sets them.
+# Commands after the last extrusion of a layer count for the part's next
+# layer, that is where CuraEngine turns the fan off before the end code.
+#
+# The start code comes from the first file, the end code (from ;End GCode
+# on) from the part that ends highest.
+#
+# A file can stand for several copies of a part that only differ by where
+# they are on the plate. Each of its layers is then written once per copy,
+# with the copy's XY offset added to the moves and E renumbered on.
+
+endMarker = ";End GCode"
+
+# Fan and temperature commands -> the state they set
+stateCodes = {"M104": "nozzle", "M109": "nozzle", "M140": "bed", "M190": "bed", "M106": "fan", "M107": "fan"}
+
+# Feedrate of the moves that prime after a travel when there is no retraction setting, mm/s
+primeSpeed = 25.0
+
+axisIndex = {"X": 0, "Y": 1, "Z": 2}
+
+def layerKey(z):
+	'''Layers within a micron of each other are merged'''
+	return int(round(z * 1000))
+
+def splitComment(line):
+	'''(the code words of line, the comment and line end to put after them)'''
+	body = line.rstrip("\r\n")
+	end = line[len(body):]
+	semi = body.find(";")
+	if semi >= 0:
+		return (body[:semi].split(), " " + body[semi:] + end)
+	return (body.split(), end)
+
+class Island:
+	'''One part's G-code in a merged layer'''
+	def __init__(self, source, z, lines, state, entry, exit, pending, feed, copy=0, offset=(0.0, 0.0)):
+		self.source = source
+		self.z = z
+		# str lines are written as they are, moves are (words, X at, x, Y at, y, E at, delta, after)
+		# tuples that get the copy's offset added and their E renumbered
+		self.lines = lines
+		self.state = state
+		# Where the first move goes and the last one ends, None without moves
+		self.entry = entry
+		self.exit = exit
+		# Retraction the part's G-code expects to be pending when it starts, and its feedrate word
+		self.pending = pending
+		self.feed = feed
+		self.copy = copy
+		self.offset = offset
+
+	def key(self):
+		return (self.source.number, self.copy)
+
+	def copies(self):
+		'''The island at every offset of its source'''
+		islands = []
+		for n, (dx, dy) in enumerate(self.source.offsets):
+			entry = self.entry
+			exit = self.exit
+			if entry is not None:
+				entry = (entry[0] + dx, entry[1] + dy)
+				exit = (exit[0] + dx, exit[1] + dy)
+			islands.append(Island(self.source, self.z, self.lines, self.state, entry, exit,
+								self.pending, self.feed, n, (dx, dy)))
+		return islands
+
+class MergeSource:
+	'''One engine's G-code and its machine state, read a layer at a time
+
+	offsets are the XY offsets of the copies the file stands for.'''
+	def __init__(self, gcodeFile, number, offsets=None):
+		self.gcodeFile = gcodeFile
+		self.number = number
+		self.offsets = offsets or [(0.0, 0.0)]
+		self.index = LayerIndex.build(gcodeFile)
+		self.next = 0
+		self.pos = [0.0, 0.0, 0.0]
+		self.feed = None
+		self.e = 0.0
+		self.maxE = 0.0
+		self.relative = False
+		self.state = {}
+		self.deferred = {}
+		self.tail = u""
+		self.head = self.index.readHead().decode("latin-1")
+		_lines, changes, _last, _entry = self.scan(self.head.splitlines(True))
+		for _at, key, value in changes:
+			self.state[key] = value
+
+	def pending(self):
+		return self.maxE - self.e
+
+	def nextKey(self):
+		if self.next < self.index.count:
+			return layerKey(self.index.layerZ(self.next))
+		return None
+
+	def lastZ(self):
+		if self.index.count:
+			return self.index.layerZ(self.index.count - 1)
+		return 0.0
+
+	def scan(self, lines):
+		'''Follow the machine state through lines, returns what to write of them
+
+		Returns (lines, changes, last extrusion, entry). Moves with X, Y or
+		E come back as tuples to be moved and renumbered. Layer markers,
+		G92 E and M82/M83 are dropped, so are the fan and temperature
+		commands, which are listed in changes as (where, key, value).'''
+		out = []
+		changes = []
+		lastExtrusion = -1
+		entry = None
+		for line in lines:
+			c = line[:1]
+			if c != "G" and c != "M":
+				if not line.startswith(";LAYER:"):
+					out.append(line)
+				continue
+			code, after = splitComment(line)
+			if not code:
+				out.append(line)
+				continue
+			cmd = code[0]
+			if cmd == "G0" or cmd == "G1":
+				xAt = yAt = eAt = None
+				for i in range(1, len(code)):
+					letter = code[i][0]
+					if letter == "E":
+						eAt = i
+					elif letter == "F":
+						self.feed = code[i]
+					elif letter == "X":
+						xAt = i
+						self.pos[0] = float(code[i][1:])
+					elif letter == "Y":
+						yAt = i
+						self.pos[1] = float(code[i][1:])
+					elif letter == "Z":
+						self.pos[2] = float(code[i][1:])
+				moved = xAt is not None or yAt is not None
+				if moved and entry is None:
+					entry = (self.pos[0], self.pos[1])
+				delta = 0.0
+				if eAt is not None:
+					value = float(code[eAt][1:])
+					if self.relative:
+						delta = value
+					else:
+						delta = value - self.e
+					self.e += delta
+					self.maxE = max(self.maxE, self.e)
+					if moved and delta > 0:
+						lastExtrusion = len(out)
+				elif not moved:
+					out.append(line)
+					continue
+				out.append((code, xAt, self.pos[0], yAt, self.pos[1], eAt, delta, after))
+			elif cmd == "G92":
+				kept = [cmd]
+				for word in code[1:]:
+					if word[0] == "E":
+						pending = self.pending()
+						self.e = float(word[1:])
+						self.maxE = self.e + pending
+					else:
+						if word[0] in axisIndex:
+							self.pos[axisIndex[word[0]]] = float(word[1:])
+						kept.append(word)
+				if len(kept) > 1:
+					out.append(u" ".join(kept) + after)
+			elif cmd == "M82" or cmd == "M83":
+				self.relative = cmd == "M83"
+			elif cmd in stateCodes:
+				key = stateCodes[cmd]
+				value = None
+				for word in code[1:]:
+					if word[0] == "S":
+						value = word[1:]
+				if cmd == "M107":
+					value = 0.0
+				elif key == "fan":
+					value = float(value) if value is not None else 255.0
+				changes.append((len(out), key, value))
+			else:
+				out.append(line)
+		return (out, changes, lastExtrusion, entry)
+
+	def readIsland(self, key):
+		'''Read the source's layers at key, the end code is kept aside'''
+		first = self.next
+		while self.next < self.index.count and layerKey(self.index.layerZ(self.next)) == key:
+			self.next += 1
+		text = self.index.readLayers(first, self.next - 1).decode("latin-1")
+		if self.next == self.index.count:
+			end = text.find("\n" + endMarker)
+			if end >= 0:
+				self.tail = text[end + 1:]
+				text = text[:end + 1]
+		pending = self.pending()
+		feed = self.feed
+		self.state.update(self.deferred)
+		self.deferred = {}
+		lines, changes, lastExtrusion, entry = self.scan(text.splitlines(True))
+		for at, key, value in changes:
+			if at > lastExtrusion:
+				self.deferred[key] = value
+			else:
+				self.state[key] = value
+		exit = None
+		if entry is not None:
+			exit = (self.pos[0], self.pos[1])
+		return Island(self, self.index.layerZ(first), lines, dict(self.state), entry, exit, pending, feed)
+
+def nearestOrder(islands, pos):
+	'''Each island nearest to where the last one ended, starting from pos'''
+	order = []
+	rest = list(islands)
+	while rest:
+		best = min(rest, key=lambda i: (i.entry[0] - pos[0]) ** 2 + (i.entry[1] - pos[1]) ** 2)
+		rest.remove(best)
+		order.append(best)
+		pos = best.exit
+	return order
+
+def planOrder(islands, pos, passes=10):
+	'''The nearest neighbour order of islands, shortened by 2-opt
+
+	A segment of the order is reversed whenever that makes the travels
+	from exits to entries shorter, until no reversal helps.'''
+	order = nearestOrder(islands, pos)
+	n = len(order)
+	if n < 3:
+		return order
+	entries = numpy.array([i.entry for i in order])
+	exits = numpy.array([i.exit for i in order])
+	dist = numpy.hypot(*(entries[numpy.newaxis, :, :] - exits[:, numpy.newaxis, :]).transpose(2, 0, 1))
+	start = numpy.hypot(*(entries - numpy.array(pos)).T)
+	def cost(idx):
+		return start[idx[0]] + dist[idx[:-1], idx[1:]].sum()
+	idx = numpy.arange(n)
+	best = cost(idx)
+	for _pass in range(passes):
+		improved = False
+		for i in range(n - 1):
+			for j in range(i + 1, n):
+				trial = numpy.concatenate((idx[:i], idx[i:j + 1][::-1], idx[j + 1:]))
+				c = cost(trial)
+				if c < best - 1e-6:
+					idx, best = trial, c
+					improved = True
+		if not improved:
+			break
+	return [order[k] for k in idx]
+
+def mergedState(islands):
+	'''The fan at the fastest an island asks for, the temperatures of the first island'''
+	state = {}
+	for island in sorted(islands, key=lambda i: i.source.number):
+		for key, value in island.state.items():
+			if key == "fan":
+				state[key] = max(value, state.get(key, 0.0))
+			elif key not in state:
+				state[key] = value
+	return state
+
+class GcodeMerge:
+	'''Merges the G-code of parts sliced on their own into one print
+
+	moveSpeed is the speed of the travels between the parts in mm/s.
+	retraction is (amount in mm, speed in mm/s) to retract before those
+	travels, or None.'''
+	def __init__(self, gcodeFiles, moveSpeed=150.0, retraction=None, copies=None):
+		if copies is None:
+			copies = [None] * len(gcodeFiles)
+		self.sources = [MergeSource(f, n, offsets) for n, (f, offsets) in enumerate(zip(gcodeFiles, copies))]
+		self.moveSpeed = moveSpeed
+		self.retraction = retraction
+		# Island keys -> the planned order of a set of islands
+		self.orders = {}
+		self.layers = 0
+		self.islands = 0
+		self.elapsed = 0.0
+
+	def countLayers(self):
+		keys = set()
+		for source in self.sources:
+			for layer in range(source.index.count):
+				keys.add(layerKey(source.index.layerZ(layer)))
+		return len(keys)
+
+	def write(self, text):
+		self.out.write(text)
+
+	def setState(self, state):
+		'''Write the commands that take the printer from its state to state'''
+		for key, value in sorted(state.items()):
+			if value is None or self.state.get(key) == value:
+				continue
+			if key == "fan":
+				if value > 0:
+					self.write(u"M106 S%d\n" % value)
+				else:
+					self.write(u"M107\n")
+			elif key == "nozzle":
+				self.write(u"M104 S%s\n" % value)
+			else:
+				self.write(u"M140 S%s\n" % value)
+			self.state[key] = value
+
+	def moveE(self, delta, speed):
+		'''Retract (delta < 0) or prime on the merged E axis'''
+		if abs(delta) < 1e-6:
+			return
+		self.e += delta
+		self.maxE = max(self.maxE, self.e)
+		if self.relative:
+			value = delta
+		else:
+			value = self.e
+		self.write(u"G1 F%d E%.5f\n" % (speed * 60, value))
+
+	def orderIslands(self, islands):
+		'''Islands without moves first, then the others in a planned order
+
+		The order is planned the first time a set of islands comes up.
+		Later layers with the same islands print it forwards or backwards,
+		whichever starts nearer to the nozzle.'''
+		order = [i for i in islands if i.entry is None]
+		rest = [i for i in islands if i.entry is not None]
+		if not rest:
+			return order
+		key = tuple(sorted([i.key() for i in rest]))
+		if key not in self.orders:
+			self.orders[key] = [i.key() for i in planOrder(rest, self.pos)]
+		byKey = dict([(i.key(), i) for i in rest])
+		planned = [byKey[k] for k in self.orders[key]]
+		first, last = planned[0].entry, planned[-1].entry
+		if (last[0] - self.pos[0]) ** 2 + (last[1] - self.pos[1]) ** 2 < (first[0] - self.pos[0]) ** 2 + (first[1] - self.pos[1]) ** 2:
+			planned.reverse()
+		return order + planned
+
+	def switchTo(self, island, travel=True):
+		'''Take the printer from the island printed before to island'''
+		if self.retraction:
+			amount, speed = self.retraction
+		else:
+			amount, speed = (0.0, primeSpeed)
+		pending = self.maxE - self.e
+		if travel and island.entry is not None:
+			if pending < amount:
+				self.moveE(pending - amount, speed)
+			self.write(u"G0 F%d X%.3f Y%.3f Z%.3f\n" % (self.moveSpeed * 60, island.entry[0], island.entry[1], island.z))
+			self.pos = island.entry
+		self.moveE((self.maxE - self.e) - island.pending, speed)
+		if island.feed:
+			self.write(u"G1 %s\n" % island.feed)
+
+	def writeIsland(self, island):
+		if island.key() != self.current:
+			self.switchTo(island)
+			self.current = island.key()
+		dx, dy = island.offset
+		for line in island.lines:
+			if isinstance(line, tuple):
+				words, xAt, x, yAt, y, eAt, delta, after = line
+				if dx or dy or eAt is not None:
+					words = list(words)
+					if dx and xAt is not None:
+						words[xAt] = u"X%.3f" % (x + dx)
+					if dy and yAt is not None:
+						words[yAt] = u"Y%.3f" % (y + dy)
+					if eAt is not None:
+						self.e += delta
+						self.maxE = max(self.maxE, self.e)
+						if self.relative:
+							words[eAt] = u"E%.5f" % delta
+						else:
+							words[eAt] = u"E%.5f" % self.e
+				self.write(u" ".join(words) + after)
+			else:
+				self.write(line)
+		if island.exit is not None:
+			self.pos = island.exit
+		self.islands += 1
+
+	def writeHead(self, count):
+		first = self.sources[0]
+		for line in first.head.splitlines(True):
+			if line.startswith(";Layer count:"):
+				line = u";Layer count: %d\n" % count
+			self.write(line)
+		# The printer is where the first file's start code leaves it
+		self.current = (first.number, 0)
+		self.pos = (first.pos[0], first.pos[1])
+		self.e = first.e
+		self.maxE = first.maxE
+		self.relative = first.relative
+		self.state = dict(first.state)
+
+	def writeTail(self):
+		'''The end code of the part that ends highest, in its own E coordinates'''
+		last = max(self.sources, key=lambda s: (s.lastZ(), -s.number))
+		island = Island(last, last.lastZ(), [], dict(last.state), None, None, last.pending(), None)
+		if last.number != self.current[0]:
+			self.switchTo(island, travel=False)
+		state = dict(last.state)
+		state.update(last.deferred)
+		self.setState(state)
+		if last.relative != self.relative:
+			self.write(u"M83\n" if last.relative else u"M82\n")
+		if not last.relative and abs(self.e - last.e) > 1e-6:
+			self.write(u"G92 E%.5f\n" % last.e)
+		self.write(last.tail)
+
+	def run(self, outFile):
+		'''Write the merged G-code to outFile, atomically, returns the number of layers'''
+		start = time.time()
+		tmpFile = outFile + ".tmp"
+		self.out = io.open(tmpFile, 'w', encoding="latin-1", newline="")
+		try:
+			try:
+				self.writeHead(self.countLayers())
+				while True:
+					keys = [s.nextKey() for s in self.sources if s.nextKey() is not None]
+					if not keys:
+						break
+					key = min(keys)
+					islands = []
+					for s in self.sources:
+						if s.nextKey() == key:
+							islands.extend(s.readIsland(key).copies())
+					self.write(u";LAYER:%d\n" % self.layers)
+					self.setState(mergedState(islands))
+					for island in self.orderIslands(islands):
+						self.writeIsland(island)
+					self.layers += 1
+				self.writeTail()
+			finally:
+				self.out.close()
+		except:
+			os.remove(tmpFile)
+			raise
+		if os.name == "nt" and os.path.exists(outFile):
+			os.remove(outFile)
+		os.rename(tmpFile, outFile)
+		self.elapsed = time.time() - start
+		log.info("Merged %d files into %d layers, %d islands, of %s in %.2fs", len(self.sources),
+				self.layers, self.islands, outFile, self.elapsed)
+		return self.layers
+
+def mergeFiles(gcodeFiles, outFile, moveSpeed=150.0, retraction=None, copies=None):
+	'''Merge the G-code of parts sliced on their own into outFile, see GcodeMerge
+
+	copies has a list of (dx, dy) offsets for every file, or None for a
+	file that is printed once where it was sliced.'''
+	return GcodeMerge(gcodeFiles, moveSpeed, retraction, copies).run(outFile)
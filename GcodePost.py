@@ -0,0 +1,162 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import os, io, re, glob, imp, time
+from PluginLog import log
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+# A post-processing stage is a generator function stage(lines, context) that
+# takes an iterator of G-code lines (unicode, with their line endings) and
+# yields the lines to write. Stages are chained, so the file is streamed through all of
+# them one line at a time.
+#
+# context is a dict with at least:
+#   "values"  - placeholder name -> value for {name} substitution
+#   "stats"   - what scanStats() found in the engine output
+#   "gcode"   - the final file name
+
+placeholderRe = re.compile(u"\\{(\\w+)\\}")
+
+try:
+	textType = unicode
+except NameError:
+	textType = str
+
+def substitutePlaceholders(lines, context):
+	'''Replace {name} with context["values"][name], unknown names are left alone'''
+	values = context["values"]
+	def repl(m):
+		if m.group(1) in values:
+			return u"%s" % values[m.group(1)]
+		return m.group(0)
+	for line in lines:
+		if u"{" in line:
+			line = placeholderRe.sub(repl, line)
+		yield line
+
+def injectHeader(lines, context):
+	'''Put a comment block with the print statistics at the top of the file'''
+	stats = context["stats"]
+	# CuraEngine writes its own ;Layer count: line
+	yield u";Generated with the FreeCAD CuraEngine plugin on %s\n" % time.strftime("%Y-%m-%d %H:%M:%S")
+	yield u";Filament used: %.1f mm\n" % stats["filament"]
+	yield u";G-code lines: %d\n" % stats["lines"]
+	for line in lines:
+		yield line
+
+def scanStats(fileName):
+	'''One streaming pass over the engine output for the header statistics'''
+	layers = 0
+	lines = 0
+	filament = 0.0
+	lastE = 0.0
+	relative = False
+	f = io.open(fileName, 'r', encoding="latin-1")
+	for line in f:
+		lines += 1
+		if line.startswith(";LAYER:"):
+			layers += 1
+			continue
+		code = line.split(";", 1)[0].split()
+		if not code:
+			continue
+		if code[0] == "M82":
+			relative = False
+		elif code[0] == "M83":
+			relative = True
+		elif code[0] in ("G0", "G1", "G92"):
+			for word in code[1:]:
+				if word[0] != "E":
+					continue
+				e = float(word[1:])
+				if code[0] == "G92":
+					lastE = e
+				elif relative:
+					if e > 0:
+						filament += e
+				else:
+					if e > lastE:
+						filament += e - lastE
+					lastE = e
+	f.close()
+	return {"layers": layers, "lines": lines, "filament": filament}
+
+def loadPlugins(pluginDir):
+	'''Load the process(lines, context) stages of the .py files in pluginDir, sorted by name'''
+	stages = []
+	if not pluginDir or not os.path.isdir(pluginDir):
+		return stages
+	for path in sorted(glob.glob(os.path.join(pluginDir, "*.py"))):
+		name = "cepost_" + os.path.splitext(os.path.basename(path))[0]
+		try:
+			module = imp.load_source(name, path)
+		except Exception as e:
+			log.warn("Can't load post-processing plugin %s: %s", path, e)
+			continue
+		if hasattr(module, "process"):
+			stages.append(module.process)
+		else:
+			log.warn("Post-processing plugin %s has no process(lines, context)", path)
+	return stages
+
+def defaultStages(pluginDir=None):
+	return [substitutePlaceholders, injectHeader] + loadPlugins(pluginDir)
+
+def process(gcodeFile, values, stages=None, outFile=None):
+	'''Stream gcodeFile through the stages and atomically replace outFile
+
+	outFile defaults to gcodeFile, the result is written to a temp file in
+	the same directory and renamed over it, so readers never see a half
+	written file. Memory use doesn't depend on the file size.'''
+	if stages is None:
+		stages = defaultStages()
+	if outFile is None:
+		outFile = gcodeFile
+	context = {"values": values, "stats": scanStats(gcodeFile), "gcode": outFile}
+	src = io.open(gcodeFile, 'r', encoding="latin-1", newline="")
+	lines = iter(src)
+	for stage in stages:
+		lines = stage(lines, context)
+	tmpFile = outFile + ".tmp"
+	out = io.open(tmpFile, 'w', encoding="latin-1", newline="")
+	try:
+		try:
+			for line in lines:
+				if not isinstance(line, textType):
+					# plugins may still yield byte strings
+					line = line.decode("latin-1")
+				out.write(line)
+		finally:
+			out.close()
+			src.close()
+	except:
+		os.remove(tmpFile)
+		raise
+	if os.name == "nt" and os.path.exists(outFile):
+		# rename doesn't replace on Windows
+		os.remove(outFile)
+	os.rename(tmpFile, outFile)
+	return context
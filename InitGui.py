@@ -55,7 +55,7 @@ class TDPrinting ( Workbench ):
 	def Initialize(self):
 		#import myModule1, myModule2
 		import Commands
-		list = ["createMachineDef", "sliceCuraEngine"]
+		list = ["createMachineDef", "sliceCuraEngine", "previewToolpath"]
 		self.appendToolbar("3D Printing", list)
 		self.appendMenu("3D Printing", list)
 		self.appendCommandbar("PyModuleCommands",list)
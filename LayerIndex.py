@@ -0,0 +1,225 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import GcodeAnalyzer
+import os, mmap
+import numpy
+from PluginLog import log
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+# What is kept for every ;LAYER: marker:
+#   offset  - byte offset of the marker line
+#   line    - line number of the marker
+#   x, y    - position before the layer
+#   z0      - Z before the layer
+#   z       - Z of the layer, after its first move
+#   e       - E register before the layer
+#   eTotal  - filament extruded before the layer
+#   feed    - feedrate (mm/min) before the layer
+#   relative - 1 if E is relative (M83) before the layer, 0 if absolute (M82)
+#   fan     - fan speed (0-255) before the layer
+layerFields = ("offset", "line", "x", "y", "z0", "z", "e", "eTotal", "feed", "relative", "fan")
+
+# Bytes copied at a time when writing parts of a file
+copyBlock = 1 << 20
+
+def indexFile(gcodeFile):
+	'''The index is kept next to the G-code'''
+	return os.path.splitext(gcodeFile)[0] + ".layers.npz"
+
+class LayerIndex:
+	'''Where every layer of a G-code file starts and the machine state there
+
+	With it any layer can be read straight out of the mapped file, without
+	parsing the layers before it. The file is only mapped while it is being
+	read, so it can be replaced by a new slice at any time.'''
+	def __init__(self, gcodeFile, layers):
+		self.gcodeFile = gcodeFile
+		self.layers = layers
+		self.count = len(layers["offset"])
+		self.size = os.path.getsize(gcodeFile)
+
+	def save(self):
+		st = os.stat(self.gcodeFile)
+		fileName = indexFile(self.gcodeFile)
+		tmpFile = fileName + ".tmp.npz"
+		arrays = dict(self.layers)
+		arrays["source"] = numpy.array([st.st_size, st.st_mtime])
+		numpy.savez(tmpFile, **arrays)
+		if os.name == "nt" and os.path.exists(fileName):
+			os.remove(fileName)
+		os.rename(tmpFile, fileName)
+
+	def layerRange(self, first, last=None):
+		'''Byte range of layers first to last, the last layer runs to the end of the file'''
+		if last is None:
+			last = first
+		start = int(self.layers["offset"][first])
+		if last + 1 < self.count:
+			end = int(self.layers["offset"][last + 1])
+		else:
+			end = self.size
+		return (start, end)
+
+	def layerZ(self, layer):
+		z = self.layers["z"][layer]
+		if numpy.isnan(z):
+			z = self.layers["z0"][layer]
+		return float(z)
+
+	def _map(self):
+		f = open(self.gcodeFile, 'rb')
+		try:
+			mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except Exception:
+			f.close()
+			raise
+		return (f, mm)
+
+	def readLayers(self, first, last=None):
+		'''The text of layers first to last'''
+		start, end = self.layerRange(first, last)
+		f, mm = self._map()
+		try:
+			return mm[start:end]
+		finally:
+			mm.close()
+			f.close()
+
+	def readHead(self):
+		'''The text before the first layer, the whole file if it has no layers'''
+		f, mm = self._map()
+		try:
+			if self.count:
+				return mm[0:int(self.layers["offset"][0])]
+			return mm[0:self.size]
+		finally:
+			mm.close()
+			f.close()
+
+	def segments(self, first, last):
+		'''The moves of layers first to last, as GcodeAnalyzer.readSegments returns them'''
+		start, end = self.layerRange(first, last)
+		analyzer = GcodeAnalyzer.GcodeAnalyzer(keepSegments=True)
+		analyzer.pos = numpy.array([self.layers["x"][first], self.layers["y"][first], self.layers["z0"][first]])
+		analyzer.lastE = float(self.layers["e"][first])
+		analyzer.feed = float(self.layers["feed"][first])
+		analyzer.relative = float(self.layers["relative"][first])
+		analyzer.stats.layers = first
+		f, mm = self._map()
+		try:
+			buf = GcodeAnalyzer.chunkArray(mm, start, end)
+			analyzer.analyzeChunk(buf, start)
+			del buf
+		finally:
+			mm.close()
+			f.close()
+		return tuple([numpy.concatenate(parts) for parts in zip(*analyzer.segments)])
+
+	def _writeFile(self, outFile, head, ranges):
+		'''Write head and then the byte ranges of the G-code to outFile, atomically'''
+		tmpFile = outFile + ".tmp"
+		out = open(tmpFile, 'wb')
+		f, mm = self._map()
+		try:
+			out.write(head)
+			for start, end in ranges:
+				for pos in range(start, end, copyBlock):
+					out.write(mm[pos:min(pos + copyBlock, end)])
+		finally:
+			mm.close()
+			f.close()
+			out.close()
+		if os.name == "nt" and os.path.exists(outFile):
+			os.remove(outFile)
+		os.rename(tmpFile, outFile)
+
+	def extractLayers(self, first, last, outFile):
+		'''Write layers first to last to outFile'''
+		self._writeFile(outFile, b"", [self.layerRange(first, last)])
+
+	def writeResume(self, layer, outFile, lift=2.0):
+		'''Write a file that prints the layers from layer on
+
+		It starts with everything before the first layer (heating, homing and
+		priming), then sets the E register to its value at the layer and
+		lifts the nozzle clear of the print before the layer's first move.
+		The E mode, fan and feedrate are set to what they were at the layer.'''
+		z = self.layerZ(layer)
+		fan = int(self.layers["fan"][layer])
+		head = (";Resumed at layer %d, Z %.3f\n" % (layer, z) +
+				("M83\n" if self.layers["relative"][layer] > 0 else "M82\n") +
+				"G92 E%.5f\n" % self.layers["e"][layer] +
+				("M106 S%d\n" % fan if fan > 0 else "M107\n") +
+				"G0 F%d Z%.3f\n" % (self.layers["feed"][layer], z + lift)).encode("ascii")
+		head = self.readHead() + head
+		self._writeFile(outFile, head, [(self.layerRange(layer)[0], self.size)])
+
+def fromAnalyzer(gcodeFile, analyzer):
+	'''Save the index of what a GcodeAnalyzer with keepLayers found in gcodeFile'''
+	layers = {}
+	for name in layerFields:
+		parts = [marks[name] for marks in analyzer.layerMarks]
+		if parts:
+			layers[name] = numpy.concatenate(parts)
+		else:
+			layers[name] = numpy.zeros(0)
+	index = LayerIndex(gcodeFile, layers)
+	index.save()
+	return index
+
+def build(gcodeFile):
+	'''Index gcodeFile in one pass over it'''
+	analyzer = GcodeAnalyzer.GcodeAnalyzer(keepLayers=True)
+	analyzer.analyzeFile(gcodeFile)
+	log.info("Indexed %d layers of %s in %.2fs", analyzer.stats.layers, gcodeFile, analyzer.stats.elapsed)
+	return fromAnalyzer(gcodeFile, analyzer)
+
+def load(gcodeFile):
+	'''The saved index of gcodeFile, None if there is none or the file changed since'''
+	fileName = indexFile(gcodeFile)
+	if not os.path.exists(fileName):
+		return None
+	st = os.stat(gcodeFile)
+	npz = numpy.load(fileName)
+	try:
+		source = npz["source"]
+		if source[0] != st.st_size or source[1] != st.st_mtime:
+			return None
+		# Indexes saved before a field was added are built again
+		for name in layerFields:
+			if name not in npz.files:
+				return None
+		layers = dict([(name, npz[name]) for name in layerFields])
+	finally:
+		npz.close()
+	return LayerIndex(gcodeFile, layers)
+
+def getIndex(gcodeFile):
+	index = load(gcodeFile)
+	if index is None:
+		index = build(gcodeFile)
+	return index
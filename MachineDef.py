@@ -23,12 +23,15 @@
 
 import FreeCAD
 from SliceVars import *
+from PluginLog import log
 from pivy import coin
 
 if FreeCAD.GuiUp:
 	import FreeCADGui
-	from FreeCADGui import PySideUic as uic
 	from PySide import QtCore, QtGui
+	import UiLoader
+
+mdPath = "User parameter:BaseApp/Preferences/Mod/3DPrinting/MachineDef"
 
 # Default Values
 defaultVals = {"machinex":100, "machiney":100, "machinez":100, "offsetx":20, "offsety":20, "bedx":100, "bedy":100}
@@ -73,10 +76,10 @@ class PrintBed:
 		self.Type = "PrintBed"
 
 	def onChanged(self, fp, prop):
-		FreeCAD.Console.PrintMessage("Change property: " + str(prop) + "\n")
+		log.debug("Change property: %s", prop)
 
 	def execute(self, fp):
-		FreeCAD.Console.PrintMessage("Recompute PrintBed feature\n")
+		log.debug("Recompute PrintBed feature")
 
 class ViewProviderPrintBed:
 	'The PrintBed View Provider Object'
@@ -141,7 +144,7 @@ class ViewProviderPrintBed:
 
 	def onChanged(self, vp, prop):
 		"'''Here we can do something when a single property got changed'''"
-		FreeCAD.Console.PrintMessage("Change property: " + str(prop) + "\n")
+		log.debug("Change property: %s", prop)
 		if prop == "Color":
 			c = vp.getPropertyByName("Color")
 			self.color.rgb.setValue(c[0],c[1],c[2])
@@ -165,10 +168,10 @@ class PrintVolume:
 		self.Type = "Machine"
 
 	def onChanged(self, fp, prop):
-		FreeCAD.Console.PrintMessage("Change property: " + str(prop) + "\n")
+		log.debug("Change property: %s", prop)
 
 	def execute(self, fp):
-		FreeCAD.Console.PrintMessage("Recompute Machine feature\n")
+		log.debug("Recompute Machine feature")
 
 class ViewProviderPrintVolume:
 	'The StrokeLimit View Provider Object'
@@ -223,7 +226,7 @@ class ViewProviderPrintVolume:
 
 	def onChanged(self, vp, prop):
 		"'''Here we can do something when a single property got changed'''"
-		FreeCAD.Console.PrintMessage("Change property: " + str(prop) + "\n")
+		log.debug("Change property: %s", prop)
 #		if prop == "Color":
 #			c = vp.getPropertyByName("Color")
 #			self.color.rgb.setValue(c[0],c[1],c[2])
@@ -242,8 +245,8 @@ class PrintBedTaskPanel:
 		# Get the user's home directory.
 		self.homeDir = os.path.expanduser("~")
 
-		# Load the qt uic form. It _must_ be in ~/.FreeCAD/Mod/FreeCAD-CuraEngine-Plugin, Perhaps there is a better way...
-		self.form = uic.loadUi(self.homeDir + "/.FreeCAD/Mod/FreeCAD-CuraEngine-Plugin/MachineDef.ui")
+		# Load the qt form from next to the plugin modules, precompiled when possible
+		self.form = UiLoader.loadForm("MachineDef")
 
 		self.form.doubleSpinBox_1.setValue(readSetting("machinex"))
 		self.form.doubleSpinBox_2.setValue(readSetting("machiney"))
@@ -262,10 +265,12 @@ class PrintBedTaskPanel:
 		self.form.doubleSpinBox_5.valueChanged.connect(self._bedYSize)
 
 	def accept(self):
+		flushSettings()
 		makePrintBedGrp()
 		FreeCADGui.Control.closeDialog()
 
 	def reject(self):
+		flushSettings()
 		FreeCADGui.Control.closeDialog()
 
 	def getStandardButtons(self):
@@ -294,15 +299,16 @@ class PrintBedTaskPanel:
 
 def readSetting(key):
 	global defaultVals
-	grp = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/3DPrinting/MachineDef")
-	val = grp.GetFloat(key, defaultVals[key])
-	FreeCAD.Console.PrintMessage("Reading Key: " + key + " Value: " + str(val) + "\n")
+	val = getStore(mdPath).get(key, defaultVals[key])
+	log.debug("Reading Key: %s Value: %s", key, val)
 	return val
 
 def writeSetting(key, val):
-	grp = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/3DPrinting/MachineDef")
-	FreeCAD.Console.PrintMessage("Setting " + key + " to " + str(val) + '\n')
-	grp.SetFloat(key, val)
+	log.debug("Setting %s to %s", key, val)
+	getStore(mdPath).set(key, val, "float")
+
+def flushSettings():
+	getStore(mdPath).flush()
 
 # Run as macro
 #panel=PrintBedTaskPanel()
@@ -0,0 +1,289 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import FreeCAD, MeshPart
+from PluginLog import log
+import os, hashlib, tempfile, time
+from math import radians
+import numpy
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+# Name of the per object property that overrides the linear deviation
+overrideProperty = "SliceDeviation"
+
+def defaultDeviation():
+	'''The mesh export tolerance set in FreeCAD's Mesh preferences, with the default angular deviation'''
+	grp = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/Mesh")
+	return (grp.GetFloat("MaxDeviationExport", 0.1), 28.5)
+
+def autoDeviation(nozzleDiameter, layerThickness):
+	'''Linear deviation matched to what the printer can resolve
+
+	Chord errors well under the layer height and the extrusion width are
+	invisible in the print, anything finer only slows down slicing.'''
+	return max(min(nozzleDiameter / 4.0, layerThickness / 2.0), 0.001)
+
+def objectDeviation(obj, deviation):
+	'''Apply the object's SliceDeviation override, if it has one'''
+	override = getattr(obj, overrideProperty, 0)
+	if override > 0:
+		return (override, deviation[1])
+	return deviation
+
+def addDeviationOverride(obj, linear):
+	if not hasattr(obj, overrideProperty):
+		obj.addProperty("App::PropertyFloat", overrideProperty, "Slicer", "Linear mesh deviation used when slicing this object, 0 uses the slicer setting")
+	setattr(obj, overrideProperty, linear)
+
+def geometryKey(shape):
+	'''Fingerprint a shape's geometry, ignoring its placement
+
+	Two shapes with the same key tessellate to the same triangles in their
+	local coordinates, so copies of a part share one cache entry.'''
+	shape = shape.copy()
+	shape.Placement = FreeCAD.Placement()
+	h = hashlib.sha1()
+	parts = [shape.ShapeType, len(shape.Faces), len(shape.Edges), len(shape.Vertexes), "%.6f" % shape.Area]
+	if shape.Solids:
+		parts.append("%.6f" % shape.Volume)
+	for face in shape.Faces:
+		parts.append(face.Surface.__class__.__name__ + ":%.6f" % face.Area)
+	for v in shape.Vertexes:
+		parts.append("%.6f,%.6f,%.6f" % (v.Point.x, v.Point.y, v.Point.z))
+	h.update(";".join([str(p) for p in parts]).encode("utf-8"))
+	return h.hexdigest()
+
+def objectKey(obj, deviation):
+	'''Fingerprint of what exporting obj would write, placement and deviation included'''
+	if not hasattr(obj, "Shape") and hasattr(obj, "Mesh"):
+		mesh = obj.Mesh
+		return "mesh:%d:%d:%.6f:%s" % (mesh.CountPoints, mesh.CountFacets, mesh.Area, mesh.BoundBox)
+	return "%s:%r:%s" % (geometryKey(obj.Shape), objectDeviation(obj, deviation), obj.Shape.Placement)
+
+def copyKey(obj, deviation):
+	'''Fingerprint of what slicing obj on its own gives, wherever it is on the plate
+
+	Objects with the same key slice to the same toolpath moved by the
+	difference of their copyOrigin(). For a shape that is its geometry,
+	deviation and rotation, for a mesh its points relative to its bound
+	box corner.'''
+	if not hasattr(obj, "Shape") and hasattr(obj, "Mesh"):
+		points, facets = toArrays(*obj.Mesh.Topology)
+		h = hashlib.sha1()
+		if len(points):
+			h.update(numpy.round(points - points.min(axis=0), 6).tobytes())
+		h.update(facets.tobytes())
+		return "mesh:" + h.hexdigest()
+	q = obj.Shape.Placement.Rotation.Q
+	return "%s:%r:%.9f,%.9f,%.9f,%.9f" % ((geometryKey(obj.Shape), objectDeviation(obj, deviation)) + tuple(q))
+
+def copyOrigin(obj):
+	'''The point that copies of obj are moved by, see copyKey'''
+	if not hasattr(obj, "Shape") and hasattr(obj, "Mesh"):
+		bb = obj.Mesh.BoundBox
+		return FreeCAD.Vector(bb.XMin, bb.YMin, bb.ZMin)
+	return obj.Shape.Placement.Base
+
+def toArrays(points, facets):
+	'''Convert FreeCAD points and facet index tuples to numpy arrays'''
+	pts = numpy.array([(p.x, p.y, p.z) for p in points], dtype=numpy.float64).reshape(-1, 3)
+	fcs = numpy.array(facets, dtype=numpy.int32).reshape(-1, 3)
+	return (pts, fcs)
+
+def transformPoints(points, placement):
+	'''Apply a placement to an (N, 3) array of points'''
+	m = placement.toMatrix()
+	rot = numpy.array([[m.A11, m.A12, m.A13], [m.A21, m.A22, m.A23], [m.A31, m.A32, m.A33]])
+	return numpy.dot(points, rot.T) + numpy.array([m.A14, m.A24, m.A34])
+
+# Binary STL facet record: normal, three vertices and the attribute byte count
+stlFacet = numpy.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attr", "<u2")])
+
+def stlRecords(points, facets):
+	'''Build the binary STL records of one mesh in bulk'''
+	tris = points[facets]
+	normals = numpy.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+	lengths = numpy.sqrt((normals * normals).sum(axis=1))
+	lengths[lengths == 0] = 1.0
+	records = numpy.zeros(len(facets), dtype=stlFacet)
+	records["normal"] = normals / lengths[:, numpy.newaxis]
+	records["vertices"] = tris
+	return records
+
+def writeBinaryStl(out, meshes, chunk=1 << 20):
+	'''Write a list of (points, facets) arrays as one binary STL
+
+	out is a file name or any binary file object, eg a pipe to the engine.
+	Facets are converted chunk at a time so peak memory stays bounded.'''
+	count = 0
+	for points, facets in meshes:
+		count += len(facets)
+	if hasattr(out, "write"):
+		f = out
+	else:
+		f = open(out, 'wb')
+	header = numpy.zeros(1, dtype=[("text", "S80"), ("count", "<u4")])
+	header["text"] = b"FreeCAD CuraEngine Plugin"
+	header["count"] = count
+	f.write(header.tobytes())
+	for points, facets in meshes:
+		for start in range(0, len(facets), chunk):
+			f.write(stlRecords(points, facets[start:start + chunk]).tobytes())
+	if f is not out:
+		f.close()
+	return count
+
+def meshBounds(meshes):
+	'''Exact bound box of the vertices of a list of (points, facets) arrays'''
+	lo = None
+	hi = None
+	for points, facets in meshes:
+		if not len(points):
+			continue
+		if lo is None:
+			lo = points.min(axis=0)
+			hi = points.max(axis=0)
+		else:
+			lo = numpy.minimum(lo, points.min(axis=0))
+			hi = numpy.maximum(hi, points.max(axis=0))
+	if lo is None:
+		return None
+	return FreeCAD.BoundBox(lo[0], lo[1], lo[2], hi[0], hi[1], hi[2])
+
+def stlTempDir():
+	'''Directory for exported meshes, RAM backed where the system has one'''
+	if os.path.isdir("/dev/shm"):
+		base = "/dev/shm"
+	else:
+		base = tempfile.gettempdir()
+	path = os.path.join(base, "FreeCAD-CuraEngine")
+	if not os.path.isdir(path):
+		os.makedirs(path)
+	return path
+
+def stlTempFile(name):
+	'''Create an empty file for an exported mesh, unique even when names repeat'''
+	prefix = "%s_%d_" % (name.replace(os.sep, "_"), os.getpid())
+	fd, path = tempfile.mkstemp(suffix=".stl", prefix=prefix, dir=stlTempDir())
+	os.close(fd)
+	return path
+
+class TessellationCache:
+	'''Keeps the triangles of every exported shape between slices
+
+	Meshes are stored per (geometry key, deviation) in the shape's local
+	coordinates. Only objects whose geometry changed since the last export
+	are tessellated again, the placement is applied when the STL is written.'''
+	def __init__(self):
+		# (doc name, obj name) -> geometry key of the last export
+		self.objects = {}
+		# (geometry key, deviation) -> (points, facets)
+		self.meshes = {}
+		self.tessellated = 0
+		self.reused = 0
+		# (label, triangles, seconds, reused) of every object in the last export
+		self.report = []
+		# Bound box of the vertices in the last export
+		self.bounds = None
+
+	def getMesh(self, obj, deviation):
+		'''Return the triangles of obj in global coordinates
+
+		deviation is a (linear mm, angular degrees) pair.'''
+		start = time.time()
+		if not hasattr(obj, "Shape") and hasattr(obj, "Mesh"):
+			# Mesh features are already triangles
+			points, facets = obj.Mesh.Topology
+			mesh = toArrays(points, facets)
+			self.report.append((obj.Label, len(mesh[1]), time.time() - start, False))
+			return mesh
+		shape = obj.Shape
+		deviation = objectDeviation(obj, deviation)
+		key = (geometryKey(shape), deviation)
+		self.objects[(obj.Document.Name, obj.Name)] = key
+		reused = key in self.meshes
+		if reused:
+			self.reused += 1
+		else:
+			local = shape.copy()
+			local.Placement = FreeCAD.Placement()
+			mesh = MeshPart.meshFromShape(Shape=local, LinearDeflection=deviation[0],
+										AngularDeflection=radians(deviation[1]), Relative=False)
+			points, facets = mesh.Topology
+			self.meshes[key] = toArrays(points, facets)
+			self.tessellated += 1
+		points, facets = self.meshes[key]
+		self.report.append((obj.Label, len(facets), time.time() - start, reused))
+		return (transformPoints(points, shape.Placement), facets)
+
+	def prune(self):
+		'''Forget meshes no longer used by any exported object'''
+		used = set(self.objects.values())
+		for key in list(self.meshes.keys()):
+			if key not in used:
+				del self.meshes[key]
+
+	def exportStl(self, partList, fileName, deviation=None):
+		'''Write partList to fileName, deviation is (linear mm, angular degrees)'''
+		if deviation is None:
+			deviation = defaultDeviation()
+		self.tessellated = 0
+		self.reused = 0
+		self.report = []
+		meshes = []
+		for obj in partList:
+			meshes.append(self.getMesh(obj, deviation))
+		self.prune()
+		self.bounds = meshBounds(meshes)
+		return writeBinaryStl(fileName, meshes)
+
+# Module level so the cache outlives the task panels
+tessCache = TessellationCache()
+
+def exportParts(partList, fileName, deviation=None):
+	'''Write partList to a binary STL, reusing cached tessellations'''
+	count = tessCache.exportStl(partList, fileName, deviation)
+	log.info("Exported %d triangles, %d objects meshed, %d reused", count, tessCache.tessellated, tessCache.reused)
+	if log.isEnabledFor(log.DEBUG):
+		log.debug("%s", exportReport().rstrip())
+	return count
+
+def exportReport():
+	'''Triangle count and export time of every object in the last export'''
+	lines = []
+	total = 0
+	seconds = 0.0
+	for label, triangles, t, reused in tessCache.report:
+		if reused:
+			state = "cached"
+		else:
+			state = "meshed"
+		lines.append("%-30s %10d triangles %8.3fs %s" % (label, triangles, t, state))
+		total += triangles
+		seconds += t
+	lines.append("Exported %d triangles in %.3fs, %d objects meshed, %d reused" %
+				(total, seconds, tessCache.tessellated, tessCache.reused))
+	return '\n'.join(lines) + '\n'
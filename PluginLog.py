@@ -0,0 +1,134 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import FreeCAD
+import os, time, threading, collections
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+DEBUG = 10
+INFO = 20
+WARN = 30
+levelNames = {DEBUG: "DEBUG", INFO: "INFO", WARN: "WARN"}
+
+class PluginLog:
+	'''Leveled log for the plugin
+
+	Messages are only formatted when some sink wants them. The log file and
+	the report view get INFO and up unless the FileLogLevel and
+	ConsoleLogLevel parameters say otherwise. The file is rolled over to
+	CuraEnginePlugin.log.1 once it reaches LogFileSize KiB.
+
+	The report view may only be written from the main thread. Messages
+	logged by other threads (batch workers, farm connections) are queued
+	and written by the next log call on the main thread or by
+	flushQueued().'''
+	DEBUG = DEBUG
+	INFO = INFO
+	WARN = WARN
+
+	def __init__(self):
+		grp = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/CuraEngine")
+		self.consoleLevel = grp.GetInt("ConsoleLogLevel", INFO)
+		self.fileLevel = grp.GetInt("FileLogLevel", INFO)
+		self.maxFileSize = grp.GetInt("LogFileSize", 1024) * 1024
+		self.logPath = os.path.join(os.path.expanduser("~"), ".FreeCAD", "CuraEnginePlugin.log")
+		self._file = None
+		# Every thread writes to the file
+		self._fileLock = threading.Lock()
+		self._mainThread = threading.current_thread()
+		self._queued = collections.deque()
+
+	def isEnabledFor(self, level):
+		return level >= self.consoleLevel or level >= self.fileLevel
+
+	def debug(self, fmt, *args):
+		self.log(DEBUG, fmt, *args)
+
+	def info(self, fmt, *args):
+		self.log(INFO, fmt, *args)
+
+	def warn(self, fmt, *args):
+		self.log(WARN, fmt, *args)
+
+	def log(self, level, fmt, *args):
+		if not self.isEnabledFor(level):
+			return
+		if args:
+			msg = fmt % args
+		else:
+			msg = fmt
+		if level >= self.fileLevel:
+			self._writeFile(level, msg)
+		if level >= self.consoleLevel:
+			if threading.current_thread() is not self._mainThread:
+				self._queued.append((level, msg))
+				return
+			self.flushQueued()
+			self._writeConsole(level, msg)
+
+	def flushQueued(self):
+		'''Write the messages other threads logged to the report view, main thread only'''
+		while True:
+			try:
+				level, msg = self._queued.popleft()
+			except IndexError:
+				return
+			self._writeConsole(level, msg)
+
+	def _writeConsole(self, level, msg):
+		if level >= WARN:
+			FreeCAD.Console.PrintWarning(msg + '\n')
+		else:
+			FreeCAD.Console.PrintMessage(msg + '\n')
+
+	def _writeFile(self, level, msg):
+		line = "%s %-5s %s\n" % (time.strftime("%Y-%m-%d %H:%M:%S"), levelNames[level], msg)
+		with self._fileLock:
+			if self._file is None:
+				try:
+					self._file = open(self.logPath, 'a', 1)
+				except IOError:
+					# No file sink, don't try again
+					self.fileLevel = WARN + 1
+					return
+			self._file.write(line)
+			if os.fstat(self._file.fileno()).st_size >= self.maxFileSize:
+				self._rollOver()
+
+	def _rollOver(self):
+		'''Keep the full file as the .1 backup, the next write starts a new one'''
+		self._file.close()
+		self._file = None
+		backup = self.logPath + ".1"
+		try:
+			if os.path.exists(backup):
+				os.remove(backup)
+			os.rename(self.logPath, backup)
+		except OSError:
+			pass
+
+# The plugin wide log
+log = PluginLog()
@@ -0,0 +1,175 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import os, sys, time, json
+from PluginLog import log
+
+try:
+	import resource
+except ImportError:
+	# Not on Windows, the peak memory is left out there
+	resource = None
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+def reportFile(gcodeFile):
+	'''The run report is kept next to the G-code'''
+	return os.path.splitext(gcodeFile)[0] + ".run.json"
+
+def peakRss():
+	'''(this process, largest finished child) peak resident memory in bytes, None if unknown'''
+	if resource is None:
+		return (None, None)
+	# Linux counts kilobytes, macOS bytes
+	scale = 1 if sys.platform == "darwin" else 1024
+	return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+			resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+def fileSize(fileName):
+	try:
+		return os.path.getsize(fileName)
+	except OSError:
+		return None
+
+class Span:
+	'''Wall and CPU time of one stage of a slice
+
+	cpu is this process, childCpu the child processes that finished during
+	the span (the engine). The peak memory figures are the process peaks
+	when the span ended. bytes is what the stage wrote, if it is known.
+	Use it as a context manager or call stop().'''
+	def __init__(self, name):
+		self.name = name
+		self.bytes = None
+		self.wall = None
+		self._start = (time.time(), os.times())
+
+	def stop(self, bytes=None):
+		if self.wall is not None:
+			return
+		if bytes is not None:
+			self.bytes = bytes
+		wall, times = self._start
+		now = os.times()
+		self.wall = time.time() - wall
+		self.cpu = (now[0] - times[0]) + (now[1] - times[1])
+		self.childCpu = (now[2] - times[2]) + (now[3] - times[3])
+		self.peakRss, self.childPeakRss = peakRss()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, exc, tb):
+		self.stop()
+		return False
+
+	def toDict(self):
+		return {"name": self.name, "wall": self.wall, "cpu": self.cpu, "childCpu": self.childCpu,
+				"peakRss": self.peakRss, "childPeakRss": self.childPeakRss, "bytes": self.bytes}
+
+class RunReport:
+	'''The timing spans of one slice, from the export to the analysis
+
+	Written as JSON next to the G-code when the slice ends, and appended as
+	one line to a history file when one is set, so runs can be compared.'''
+	def __init__(self, name, engine=None):
+		self.name = name
+		self.engine = engine
+		self.started = time.time()
+		self.spans = []
+		self.result = None
+		# Anything else worth keeping with the run, eg the triangle count
+		self.info = {}
+
+	def span(self, name):
+		'''Start timing a stage, the span ends when stop() is called or its with block is left'''
+		span = Span(name)
+		self.spans.append(span)
+		return span
+
+	def toDict(self):
+		spans = [s.toDict() for s in self.spans if s.wall is not None]
+		return {"name": self.name, "engine": self.engine, "started": self.started,
+				"wall": sum([s["wall"] for s in spans]), "result": self.result,
+				"info": self.info, "spans": spans}
+
+	def summary(self):
+		lines = []
+		for s in self.spans:
+			if s.wall is None:
+				continue
+			line = "%-10s %7.2fs wall %7.2fs cpu" % (s.name, s.wall, s.cpu + s.childCpu)
+			if s.bytes is not None:
+				line += " %10.1f kB" % (s.bytes / 1024.0)
+			lines.append(line)
+		return '\n'.join(lines) + '\n'
+
+	def finish(self, result, gcodeFile, historyFile=None, historySize=500):
+		'''Write the report next to gcodeFile and append it to historyFile'''
+		self.result = result
+		data = self.toDict()
+		fileName = reportFile(gcodeFile)
+		try:
+			writeJson(fileName, data)
+			if historyFile:
+				appendHistory(historyFile, data, historySize)
+		except (IOError, OSError) as e:
+			log.warn("Can't write the run report %s: %s", fileName, e)
+		return data
+
+def replaceFile(fileName, text):
+	'''Write text to fileName through a temp file, readers never see half of it'''
+	tmpFile = fileName + ".tmp"
+	f = open(tmpFile, 'w')
+	try:
+		f.write(text)
+	finally:
+		f.close()
+	if os.name == "nt" and os.path.exists(fileName):
+		os.remove(fileName)
+	os.rename(tmpFile, fileName)
+
+def writeJson(fileName, data):
+	replaceFile(fileName, json.dumps(data, indent=1, sort_keys=True) + '\n')
+
+def appendHistory(fileName, data, maxRuns):
+	'''Add one JSON line per run, dropping the oldest runs past maxRuns'''
+	lines = []
+	if os.path.exists(fileName):
+		f = open(fileName)
+		lines = f.readlines()
+		f.close()
+	lines.append(json.dumps(data, sort_keys=True) + '\n')
+	replaceFile(fileName, "".join(lines[-max(1, int(maxRuns)):]))
+
+def readHistory(fileName):
+	'''The runs in a history file, oldest first'''
+	runs = []
+	f = open(fileName)
+	for line in f:
+		if line.strip():
+			runs.append(json.loads(line))
+	f.close()
+	return runs
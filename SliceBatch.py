@@ -0,0 +1,240 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import os, tempfile, threading, time, subprocess
+from SliceVars import writeLogHeader
+from SliceEngine import EngineError
+
+try:
+	import Queue as queue
+except ImportError:
+	import queue
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+def cpuCount():
+	try:
+		import multiprocessing
+		return multiprocessing.cpu_count()
+	except (ImportError, NotImplementedError):
+		return 1
+
+class BatchJob:
+	'''One engine run in a batch, engine is the SliceEngine that cmdList came from'''
+	def __init__(self, name, cmdList, logFile, gcodeFile=None, engine=None):
+		self.name = name
+		self.cmdList = cmdList
+		self.logFile = logFile
+		self.gcodeFile = gcodeFile
+		self.engine = engine
+		# queued, running, done, failed or cancelled
+		self.status = "queued"
+		self.attempts = 0
+		self.exitCode = None
+		self.elapsed = 0.0
+		# Print statistics, filled in by the post-processing
+		self.stats = None
+
+class SliceBatch:
+	'''Runs a list of BatchJobs over a bounded pool of engine processes
+
+	onStatus(job) is called from the worker threads every time a job changes
+	state. GUI code must hand it over to the GUI thread (eg with a Qt signal).
+	postProcess(job) is run in the worker thread after a successful slice,
+	an exception fails the job.'''
+	def __init__(self, jobs, workers=None, retries=0, onStatus=None, postProcess=None):
+		self.jobs = jobs
+		self.workers = max(1, int(workers or cpuCount()))
+		self.retries = max(0, int(retries))
+		self.onStatus = onStatus
+		self.postProcess = postProcess
+		self.cancelled = False
+		self.elapsed = 0.0
+		self._procs = {}
+		self._lock = threading.Lock()
+		self._thread = None
+		self._onDone = None
+		self._finished = False
+
+	def run(self):
+		'''Run every job and block until the batch is finished'''
+		start = time.time()
+		q = queue.Queue()
+		for job in self.jobs:
+			q.put(job)
+		threads = []
+		for i in range(min(self.workers, len(self.jobs))):
+			t = threading.Thread(target=self._worker, args=(q,))
+			t.daemon = True
+			t.start()
+			threads.append(t)
+		for t in threads:
+			t.join()
+		self.elapsed = time.time() - start
+		return self.succeeded()
+
+	def start(self, onDone=None):
+		'''Run the batch in a background thread. onDone(batch) is called from that thread'''
+		self._onDone = onDone
+		def _run():
+			self.run()
+			with self._lock:
+				self._finished = True
+				done = self._onDone
+			if done:
+				done(self)
+		self._thread = threading.Thread(target=_run)
+		self._thread.daemon = True
+		self._thread.start()
+
+	def isRunning(self):
+		return self._thread is not None and self._thread.is_alive()
+
+	def cancel(self, onDone=None):
+		'''Kill the running engines and skip the queued jobs
+
+		onDone(batch) replaces the one given to start, for when whoever
+		started the batch goes away before it ends. It is called right away
+		if the batch has finished already.'''
+		self.cancelled = True
+		with self._lock:
+			for proc in self._procs.values():
+				try:
+					proc.kill()
+				except OSError:
+					pass
+			finished = self._finished
+			if onDone and not finished:
+				self._onDone = onDone
+		if onDone and finished:
+			onDone(self)
+
+	def succeeded(self):
+		for job in self.jobs:
+			if job.status != "done":
+				return False
+		return True
+
+	def _setStatus(self, job, status):
+		job.status = status
+		if self.onStatus:
+			self.onStatus(job)
+
+	def _worker(self, q):
+		while True:
+			try:
+				job = q.get_nowait()
+			except queue.Empty:
+				return
+			if self.cancelled:
+				self._setStatus(job, "cancelled")
+				continue
+			self._runJob(job)
+
+	def _runJob(self, job):
+		start = time.time()
+		while job.attempts <= self.retries and not self.cancelled:
+			job.attempts += 1
+			self._setStatus(job, "running")
+			f = open(job.logFile, 'w')
+			writeLogHeader(f, job.cmdList)
+			f.flush()
+			try:
+				proc = subprocess.Popen(job.cmdList, stderr=f)
+			except OSError as e:
+				f.write("Failed to start " + job.cmdList[0] + ": " + str(e) + '\n')
+				f.close()
+				job.exitCode = -1
+				# Retrying won't help if the binary can't be started
+				break
+			with self._lock:
+				self._procs[id(job)] = proc
+			job.exitCode = proc.wait()
+			with self._lock:
+				del self._procs[id(job)]
+			if job.exitCode == 0 and job.engine and job.gcodeFile:
+				try:
+					job.engine.collectOutputs(job.gcodeFile)
+				except EngineError as e:
+					f.write(str(e) + '\n')
+					job.exitCode = -1
+			f.close()
+			if job.exitCode == 0:
+				break
+		if job.exitCode == 0 and self.postProcess and not self.cancelled:
+			try:
+				self.postProcess(job)
+			except Exception as e:
+				f = open(job.logFile, 'a')
+				f.write("Post-processing failed: " + str(e) + '\n')
+				f.close()
+				job.exitCode = -1
+		job.elapsed = time.time() - start
+		if self.cancelled and job.exitCode != 0:
+			self._setStatus(job, "cancelled")
+		elif job.exitCode == 0:
+			self._setStatus(job, "done")
+		else:
+			self._setStatus(job, "failed")
+
+	def report(self):
+		'''Return a plain text summary of the batch'''
+		return batchReport(self.jobs, self.workers, self.elapsed)
+
+def batchReport(jobs, workers, elapsed):
+	'''A line per job and a summary line'''
+	lines = []
+	counts = {}
+	for job in jobs:
+		counts[job.status] = counts.get(job.status, 0) + 1
+		lines.append("%-10s %-30s attempts: %d  time: %.1fs  log: %s" %
+					(job.status, job.name, job.attempts, job.elapsed, job.logFile))
+	summary = ", ".join(["%d %s" % (n, s) for s, n in sorted(counts.items())])
+	lines.append("Batch of %d jobs on %d workers finished in %.1fs: %s" %
+				(len(jobs), workers, elapsed, summary))
+	return '\n'.join(lines) + '\n'
+
+def benchBatch(meshFile, count=8, workers=None, engine=None, outDir=None):
+	'''Load test: slice meshFile count times and analyze every result
+
+	engine defaults to a FakeEngine, so this runs without CuraEngine. The
+	G-code goes to outDir (a temp dir by default). Returns the finished
+	batch, its report() has the times.'''
+	import GcodeAnalyzer
+	from SliceEngine import FakeEngine
+	if engine is None:
+		engine = FakeEngine()
+	if outDir is None:
+		outDir = tempfile.mkdtemp(prefix="slicebench")
+	jobs = []
+	for i in range(count):
+		outBase = os.path.join(outDir, "bench%d" % i)
+		cmdList = engine.command([], meshFile, outBase + ".gcode")
+		jobs.append(BatchJob("bench%d" % i, cmdList, outBase + ".log", outBase + ".gcode", engine))
+	def analyze(job):
+		job.stats = GcodeAnalyzer.analyzeFile(job.gcodeFile)
+	batch = SliceBatch(jobs, workers, 0, postProcess=analyze)
+	batch.run()
+	return batch
@@ -0,0 +1,152 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import os, shutil, hashlib, json
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+def hashFile(h, fileName):
+	f = open(fileName, 'rb')
+	while True:
+		chunk = f.read(1 << 20)
+		if not chunk:
+			break
+		h.update(chunk)
+	f.close()
+
+class SliceCache:
+	'''Content addressed store of CuraEngine results
+
+	Entries are keyed on the mesh bytes, the engine arguments and the engine
+	binary. The modification time of an entry's .gcode file is its last use,
+	the least recently used entries are evicted once the cache is over maxBytes.'''
+	def __init__(self, cacheDir, maxBytes):
+		self.cacheDir = cacheDir
+		self.maxBytes = maxBytes
+		if not os.path.isdir(cacheDir):
+			os.makedirs(cacheDir)
+		self.statsFile = os.path.join(cacheDir, "stats.json")
+		self.stats = {"hits": 0, "misses": 0}
+		if os.path.exists(self.statsFile):
+			try:
+				self.stats.update(json.load(open(self.statsFile)))
+			except ValueError:
+				pass
+
+	def makeKey(self, stlFile, cmdArgs, curaBin):
+		'''Hash the mesh, the argument list (without file names) and the engine identity'''
+		h = hashlib.sha1()
+		hashFile(h, stlFile)
+		h.update("\0".join(cmdArgs).encode("utf-8"))
+		try:
+			st = os.stat(curaBin)
+			binId = "%s\0%d\0%d" % (os.path.realpath(curaBin), int(st.st_mtime), st.st_size)
+		except OSError:
+			binId = curaBin
+		h.update(binId.encode("utf-8"))
+		return h.hexdigest()
+
+	def _entry(self, key, ext):
+		return os.path.join(self.cacheDir, key + ext)
+
+	def lookup(self, key, gcodeFile, logFile):
+		'''Copy a cached result to gcodeFile and logFile. Returns False on a miss'''
+		cached = self._entry(key, ".gcode")
+		if not os.path.exists(cached):
+			self._count("misses")
+			return False
+		shutil.copyfile(cached, gcodeFile)
+		shutil.copyfile(self._entry(key, ".log"), logFile)
+		# Mark the entry as recently used
+		os.utime(cached, None)
+		self._count("hits")
+		return True
+
+	def store(self, key, gcodeFile, logFile):
+		'''Add a finished slice to the cache and evict old entries'''
+		for src, ext in [(logFile, ".log"), (gcodeFile, ".gcode")]:
+			dst = self._entry(key, ext)
+			# Copy to a temp file first so readers never see half an entry
+			shutil.copyfile(src, dst + ".tmp")
+			os.rename(dst + ".tmp", dst)
+		self.evict()
+
+	def entries(self):
+		'''Return (last use, size, key) for every entry, oldest first'''
+		result = []
+		for name in os.listdir(self.cacheDir):
+			if not name.endswith(".gcode"):
+				continue
+			key = name[:-len(".gcode")]
+			try:
+				st = os.stat(self._entry(key, ".gcode"))
+				size = st.st_size + os.path.getsize(self._entry(key, ".log"))
+			except OSError:
+				continue
+			result.append((st.st_mtime, size, key))
+		result.sort()
+		return result
+
+	def size(self):
+		total = 0
+		for used, size, key in self.entries():
+			total += size
+		return total
+
+	def evict(self):
+		entries = self.entries()
+		total = 0
+		for used, size, key in entries:
+			total += size
+		for used, size, key in entries:
+			if total <= self.maxBytes:
+				break
+			self.remove(key)
+			total -= size
+
+	def remove(self, key):
+		for ext in [".gcode", ".log"]:
+			try:
+				os.remove(self._entry(key, ext))
+			except OSError:
+				pass
+
+	def clear(self):
+		for used, size, key in self.entries():
+			self.remove(key)
+		self.stats = {"hits": 0, "misses": 0}
+		self._saveStats()
+
+	def _count(self, name):
+		self.stats[name] += 1
+		self._saveStats()
+
+	def _saveStats(self):
+		f = open(self.statsFile, 'w')
+		json.dump(self.stats, f)
+		f.close()
+
+	def summary(self):
+		return "Cache: %d hits, %d misses, %.1f MB" % (self.stats["hits"], self.stats["misses"], self.size() / 1048576.0)
@@ -0,0 +1,302 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+'''Slice FreeCAD documents from the command line, without the GUI
+
+Runs under FreeCADCmd, eg for nightly re-slices on a build server:
+
+	FreeCADCmd -c "import sys, SliceCli; sys.exit(SliceCli.main(['--profile', 'pla.ces', 'parts/']))"
+
+or under a Python that can import FreeCAD:
+
+	python SliceCli.py --profile pla.ces --group Printable parts/
+
+Every given .FCStd file, and every one found under a given directory, is
+opened and the objects picked by --name, --label and --group (shell style
+patterns) are sliced. Without any of those the finished solids and meshes
+of each document are sliced, the ones no other object is built from.
+Each document is one job unless --each gives every object a job of its
+own. With --split the objects of a document are sliced in parallel and
+their G-code is merged layer by layer into one print. --replicate slices
+only one of every set of identical objects and copies its toolpath to
+the others. The jobs run through the same export, engine, post-processing and
+analysis as the task panel, with the saved settings or a profile written
+by Export Settings. A profile is used for the run only, the saved
+settings stay as they are.'''
+
+import FreeCAD
+import argparse, fnmatch, os, sys
+from PluginLog import log
+from SliceVars import SliceDef, MemoryStore, cePath
+from SliceBatch import SliceBatch, BatchJob
+from SlicePipeline import SlicePipeline, groupType, groupMembers, splitIslands
+import SliceEngine, SliceFarm
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+# Exit codes
+exitOk = 0
+exitFailed = 1
+exitUsage = 2
+exitNothing = 3
+
+def parseArgs(argv):
+	parser = argparse.ArgumentParser(prog="SliceCli", description="Slice FreeCAD documents with CuraEngine")
+	parser.add_argument("paths", nargs="+", help=".FCStd files, or directories to search for them")
+	parser.add_argument("--name", action="append", default=[], help="slice objects whose Name matches")
+	parser.add_argument("--label", action="append", default=[], help="slice objects whose Label matches")
+	parser.add_argument("--group", action="append", default=[], help="slice the objects in groups whose Label matches")
+	parser.add_argument("--each", action="store_true", help="slice every object on its own")
+	parser.add_argument("--split", action="store_true",
+						help="slice the objects of a document in parallel and merge them into one print")
+	parser.add_argument("--replicate", action="store_true",
+						help="slice identical objects once and copy the toolpath to the others")
+	parser.add_argument("--profile", help="settings file to slice with")
+	parser.add_argument("--out", help="directory for the G-code, next to the document by default")
+	parser.add_argument("--engine", choices=SliceEngine.engineNames, help="slicing engine")
+	parser.add_argument("--workers", type=int, help="engine processes at a time")
+	parser.add_argument("--retries", type=int, help="times a failed slice is run again")
+	parser.add_argument("--recompute", action="store_true", help="recompute each document before slicing")
+	parser.add_argument("--serve", metavar="HOST:PORT", help="hand the jobs to SliceFarm workers instead of slicing here")
+	parser.add_argument("--local-workers", type=int, default=0, help="with --serve, also run this many workers here")
+	parser.add_argument("-q", "--quiet", action="store_true", help="only report failures")
+	return parser.parse_args(argv)
+
+def findDocuments(paths):
+	'''The .FCStd files in paths, directories are searched recursively'''
+	files = []
+	for path in paths:
+		if os.path.isdir(path):
+			for root, dirs, names in os.walk(path):
+				dirs.sort()
+				for name in sorted(names):
+					if name.lower().endswith(".fcstd"):
+						files.append(os.path.join(root, name))
+		elif os.path.isfile(path):
+			files.append(path)
+		else:
+			raise IOError("No such file or directory: " + path)
+	return files
+
+def uniqueBase(outBase, fileName, used):
+	'''outBase, or a variant of it that no other job of the run writes to
+
+	Documents with the same name in different directories get their
+	directory name in front, anything else that still clashes a number.'''
+	base = outBase
+	if base in used:
+		parent = os.path.basename(os.path.dirname(os.path.abspath(fileName)))
+		base = os.path.join(os.path.dirname(outBase), parent + "_" + os.path.basename(outBase))
+	n = 2
+	unique = base
+	while unique in used:
+		unique = "%s_%d" % (base, n)
+		n += 1
+	used.add(unique)
+	return unique
+
+def sliceable(obj):
+	return (hasattr(obj, "Shape") and not obj.Shape.isNull()) or obj.isDerivedFrom("Mesh::Feature")
+
+def defaultParts(doc):
+	'''The solids and meshes of doc that no other object is built from'''
+	parts = []
+	for obj in doc.Objects:
+		if obj.isDerivedFrom(groupType):
+			continue
+		users = [o for o in obj.InList if not o.isDerivedFrom(groupType)]
+		if users:
+			continue
+		if obj.isDerivedFrom("Mesh::Feature") or (hasattr(obj, "Shape") and obj.Shape.Solids):
+			parts.append(obj)
+	return parts
+
+def selectParts(doc, names, labels, groups):
+	'''The objects of doc picked by the name, label and group patterns'''
+	if not (names or labels or groups):
+		return defaultParts(doc)
+	picked = []
+	for obj in doc.Objects:
+		if obj.isDerivedFrom(groupType):
+			for pattern in groups:
+				if fnmatch.fnmatchcase(obj.Label, pattern):
+					picked.extend(groupMembers(obj))
+		else:
+			for attr, patterns in [("Name", names), ("Label", labels)]:
+				for pattern in patterns:
+					if fnmatch.fnmatchcase(getattr(obj, attr), pattern):
+						picked.append(obj)
+	parts = []
+	for obj in picked:
+		if obj not in parts and sliceable(obj):
+			parts.append(obj)
+	return parts
+
+def serveJobs(args, pipeline, jobs, retries, status, say):
+	'''Slice jobs on SliceFarm workers, returns (succeeded, report)'''
+	host, port = SliceFarm.parseAddress(args.serve)
+	server = SliceFarm.SliceServer(host, port, retries, onStatus=status, postProcess=pipeline.batchPost())
+	server.start()
+	say("Serving %d jobs on %s:%d\n" % (len(jobs), server.address[0], server.address[1]))
+	for job in jobs:
+		server.submit(job)
+	if args.local_workers:
+		local = server.address
+		if local[0] in ("", "0.0.0.0"):
+			local = ("127.0.0.1", local[1])
+		SliceFarm.startWorkers(local, args.local_workers, pipeline.getEngine(), "local")
+	succeeded = server.wait(jobs)
+	server.stop()
+	log.flushQueued()
+	return (succeeded, server.report(jobs))
+
+def mergeSplits(pipeline, splits, say):
+	'''Merge, post-process and analyze the split slices, False if any of them failed'''
+	post = pipeline.batchPost()
+	ok = True
+	for name, outBase, islandJobs in splits:
+		merged = BatchJob(name, [], outBase + ".log", outBase + ".gcode")
+		merged.island = False
+		pipeline.writeSplitLog(islandJobs, merged.logFile)
+		try:
+			if [job for job in islandJobs if job.status != "done"]:
+				raise RuntimeError("not every island was sliced")
+			layers = pipeline.mergeSplit(islandJobs, merged.gcodeFile)
+			post(merged)
+			copies = sum([len(job.copies) for job in islandJobs])
+			say("%s: merged %d islands (%d sliced) into %d layers\n" % (name, copies, len(islandJobs), layers))
+			if merged.stats:
+				say(name + ":\n" + merged.stats.summary())
+		except Exception as e:
+			sys.stderr.write("%s: merge failed, %s, see %s\n" % (name, e, merged.logFile))
+			ok = False
+		pipeline.removeSplit(islandJobs)
+	return ok
+
+def main(argv=None):
+	'''Slice what argv asks for, returns one of the exit codes'''
+	if argv is None:
+		argv = sys.argv[1:]
+	try:
+		args = parseArgs(argv)
+	except SystemExit as e:
+		return exitUsage if e.code else exitOk
+	say = (lambda text: None) if args.quiet else sys.stdout.write
+
+	# The run's settings live in memory, a profile is never saved
+	Vars = SliceDef(MemoryStore(cePath))
+	if args.profile:
+		try:
+			Vars.applyProfile(args.profile)
+		except Exception as e:
+			sys.stderr.write("Can't read the profile %s: %s\n" % (args.profile, e))
+			return exitUsage
+	if args.engine:
+		Vars.writeMisc("SliceEngine", args.engine)
+	pipeline = SlicePipeline(Vars)
+	try:
+		files = findDocuments(args.paths)
+	except IOError as e:
+		sys.stderr.write(str(e) + '\n')
+		return exitUsage
+	if args.out and not os.path.isdir(args.out):
+		os.makedirs(args.out)
+
+	jobs = []
+	# (name, output path without extension, island jobs) of the split slices
+	splits = []
+	failedDocs = []
+	# Output paths already taken, so no two jobs write the same files
+	usedBases = set()
+	for fileName in files:
+		try:
+			doc = FreeCAD.openDocument(fileName)
+		except Exception as e:
+			sys.stderr.write("Can't open %s: %s\n" % (fileName, e))
+			failedDocs.append(fileName)
+			continue
+		try:
+			if args.recompute:
+				doc.recompute()
+			parts = selectParts(doc, args.name, args.label, args.group)
+			base = os.path.splitext(os.path.basename(fileName))[0]
+			outBase = os.path.join(args.out or os.path.dirname(os.path.abspath(fileName)), base)
+			if not parts:
+				say("%s: nothing to slice\n" % fileName)
+			elif args.each:
+				for part in parts:
+					jobs.append(pipeline.makeBatchJob(doc, [part], base + "_" + part.Label,
+													outBase=uniqueBase(outBase + "_" + part.Label, fileName, usedBases)))
+			else:
+				islands = splitIslands(parts)
+				sets = pipeline.copySets(islands, args.replicate)
+				if (args.split and len(islands) > 1) or len(sets) < len(islands):
+					islandJobs = pipeline.makeSplitJobs(doc, sets, base)
+					jobs.extend(islandJobs)
+					splits.append((base, uniqueBase(outBase, fileName, usedBases), islandJobs))
+				else:
+					jobs.append(pipeline.makeBatchJob(doc, parts, base, outBase=uniqueBase(outBase, fileName, usedBases)))
+			say("%s: %d objects\n" % (fileName, len(parts)))
+		except Exception as e:
+			sys.stderr.write("Can't export %s: %s\n" % (fileName, e))
+			failedDocs.append(fileName)
+		finally:
+			# The jobs only need the exported meshes
+			FreeCAD.closeDocument(doc.Name)
+	if not jobs:
+		sys.stderr.write("Nothing to slice\n")
+		return exitFailed if failedDocs else exitNothing
+
+	def status(job):
+		if job.status == "failed":
+			sys.stderr.write("%s: failed, see %s\n" % (job.name, job.logFile))
+		else:
+			say("%s: %s\n" % (job.name, job.status))
+	workers = args.workers or Vars.readMisc("BatchWorkers")
+	retries = args.retries if args.retries is not None else Vars.readMisc("BatchRetries")
+	if args.serve:
+		succeeded, report = serveJobs(args, pipeline, jobs, retries, status, say)
+	else:
+		batch = SliceBatch(jobs, workers, retries, status, pipeline.batchPost())
+		batch.run()
+		succeeded, report = batch.succeeded(), batch.report()
+	log.flushQueued()
+	if splits and not mergeSplits(pipeline, splits, say):
+		succeeded = False
+	for job in jobs:
+		try:
+			os.remove(job.stlFile)
+		except OSError:
+			pass
+		if job.stats:
+			say(job.name + ":\n" + job.stats.summary())
+	say(report)
+	log.info("%s", report.rstrip())
+	if failedDocs or not succeeded:
+		return exitFailed
+	return exitOk
+
+if __name__ == "__main__":
+	sys.exit(main())
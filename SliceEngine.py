@@ -0,0 +1,138 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import os, re, sys
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+# CuraEngine reports "Progress:<stage>:<value>:<max>" on stderr when run with -p.
+# The stages are reported in this order, each one gets an equal share of the bar.
+progressStages = ["slice", "layerparts", "inset", "support", "skin", "export"]
+progressRe = re.compile(r"Progress:(\w+):(\d+):(\d+)")
+
+def parseProgress(line):
+	'''Return overall progress (0-100) and stage name for a CuraEngine line, or None'''
+	m = progressRe.search(line)
+	if not m:
+		return None
+	stage = m.group(1)
+	val = int(m.group(2))
+	maxVal = int(m.group(3))
+	if maxVal <= 0:
+		return None
+	if stage in progressStages:
+		index = progressStages.index(stage)
+	else:
+		index = len(progressStages) - 1
+	frac = min(float(val) / maxVal, 1.0)
+	percent = int(100 * (index + frac) / len(progressStages))
+	return (percent, stage)
+
+class EngineError(Exception):
+	pass
+
+class SliceEngine:
+	'''A slicing engine as the plugin drives it
+
+	A slice is four steps: prepareMesh writes the parts to the mesh file the
+	engine reads, command gives the process that slices it, parseProgress
+	turns the lines the process writes on stderr into progress and
+	collectOutputs checks what the process left behind. The process itself
+	is run by SliceJob or SliceBatch, so every engine gets cancelling,
+	retries, logging and caching for free.
+
+	This class is abstract, subclasses must override command. Use one of
+	the engines in engineNames, getEngine picks the configured one.'''
+	name = "Engine"
+
+	def prepareMesh(self, partList, meshFile, deviation=None):
+		'''Write partList to meshFile, return the triangle count'''
+		# Imported here so the engines can be driven outside of FreeCAD
+		import MeshExport
+		return MeshExport.exportParts(partList, meshFile, deviation)
+
+	def command(self, args, meshFile, gcodeFile):
+		'''The command list that slices meshFile to gcodeFile, args are the "-s key=value" settings
+
+		Every subclass must override this.'''
+		raise NotImplementedError
+
+	def parseProgress(self, line):
+		'''(percent, stage) for a line of the engine's stderr, or None'''
+		return parseProgress(line)
+
+	def collectOutputs(self, gcodeFile):
+		'''The files a successful run produced, raises EngineError if the G-code is missing'''
+		if not os.path.exists(gcodeFile) or os.path.getsize(gcodeFile) == 0:
+			raise EngineError(self.name + " wrote no G-code to " + gcodeFile)
+		return [gcodeFile]
+
+class CuraEngine(SliceEngine):
+	'''The legacy CuraEngine command line'''
+	name = "CuraEngine"
+
+	def __init__(self, binary):
+		self.binary = binary
+
+	def command(self, args, meshFile, gcodeFile):
+		# -v for verbose output, -p for the progress lines used by the progress bar
+		return [self.binary, "-v", "-p"] + args + ["-o", gcodeFile, meshFile]
+
+def defaultPython():
+	'''An interpreter to run FakeEngine.py with, FreeCAD's own executable won't do'''
+	if os.path.basename(sys.executable or "").lower().startswith("python"):
+		return sys.executable
+	return "python"
+
+class FakeEngine(SliceEngine):
+	'''FakeEngine.py, a stand-in for CuraEngine for tests and benchmarks
+
+	It takes CuraEngine's arguments, reports progress the same way and
+	writes CuraEngine style G-code filling the bound box of the mesh.
+	layers (0 follows the mesh height), moves per layer and the seconds
+	spent per layer set its size and speed.'''
+	name = "Fake"
+	script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "FakeEngine.py")
+
+	def __init__(self, layers=0, moves=500, layerTime=0.01, exitCode=0, python=None):
+		self.layers = int(layers)
+		self.moves = int(moves)
+		self.layerTime = layerTime
+		self.exitCode = int(exitCode)
+		self.python = python or defaultPython()
+
+	def command(self, args, meshFile, gcodeFile):
+		return ([self.python, self.script, "--layers", str(self.layers), "--moves", str(self.moves),
+				"--layer-time", str(self.layerTime), "--exit-code", str(self.exitCode), "-v", "-p"] +
+				args + ["-o", gcodeFile, meshFile])
+
+engineNames = ["CuraEngine", "Fake"]
+
+def getEngine(misc):
+	'''The engine chosen by the SliceEngine setting, misc holds the Misc settings'''
+	if misc["SliceEngine"] == "Fake":
+		return FakeEngine(misc["FakeLayers"], misc["FakeMoves"], misc["FakeLayerTime"],
+						python=misc["FakePython"] or None)
+	return CuraEngine(misc["CuraPath"])
@@ -0,0 +1,547 @@
+#!/usr/bin/env python
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+'''Slicing on several machines: a job server and the workers it feeds
+
+The server (SliceServer) runs where the documents are. It takes
+BatchJobs from SlicePipeline and hands their mesh and engine arguments
+to any worker that asks for work. It collects the G-code and log back,
+then post-processes and analyzes them like SliceBatch does. Workers
+(SliceWorker) only need Python and an engine, and are started on each
+machine with
+
+	python SliceFarm.py SERVERHOST:PORT [--engine CuraEngine --cura /path/to/CuraEngine] [--workers N]
+
+The protocol is plain TCP. Every message is a 4 byte big endian length,
+a JSON header and then the files listed by size in the header's "sizes".
+A worker says hello, then asks for work with "get". The answer is a
+"job" (args and the mesh), "wait" or "stop". While the engine runs the
+worker sends a "heartbeat" every few seconds, and is told to "cancel" if
+the job was taken away from it. It ends with a "result" carrying the
+exit code, the log and the G-code. A job whose worker disconnects or
+misses heartbeats for the timeout goes back into the queue. Jobs with
+the same mesh and arguments are sliced once, the others get a copy of
+the result.
+
+Workers run whatever arguments the server sends, so only point them at
+a server you trust.'''
+
+import os, sys, time, json, struct, socket, shutil, hashlib, tempfile, threading, subprocess
+import collections
+import SliceEngine
+from SliceCache import hashFile
+
+try:
+	import socketserver
+except ImportError:
+	import SocketServer as socketserver
+
+try:
+	from PluginLog import log
+except ImportError:
+	# Workers don't need FreeCAD
+	import logging
+	log = logging.getLogger("SliceFarm")
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+protocolVersion = 1
+blockSize = 1 << 16
+finalStates = ("done", "failed", "cancelled")
+
+def sendMessage(sock, header, files=()):
+	'''Send header and then the contents of files'''
+	header = dict(header)
+	header["sizes"] = [os.path.getsize(f) for f in files]
+	data = json.dumps(header).encode("utf-8")
+	sock.sendall(struct.pack("!I", len(data)) + data)
+	for fileName in files:
+		f = open(fileName, 'rb')
+		try:
+			while True:
+				block = f.read(blockSize)
+				if not block:
+					break
+				sock.sendall(block)
+		finally:
+			f.close()
+
+def recvExactly(sock, size):
+	parts = []
+	while size > 0:
+		block = sock.recv(min(size, blockSize))
+		if not block:
+			raise EOFError("Connection closed")
+		parts.append(block)
+		size -= len(block)
+	return b"".join(parts)
+
+def recvMessage(sock):
+	'''The next header, None if the other side closed the connection'''
+	try:
+		size = struct.unpack("!I", recvExactly(sock, 4))[0]
+	except EOFError:
+		return None
+	return json.loads(recvExactly(sock, size).decode("utf-8"))
+
+def recvFiles(sock, header, fileNames):
+	'''Write the files that follow header to fileNames, None skips a file'''
+	fileNames = list(fileNames) + [None] * (len(header["sizes"]) - len(fileNames))
+	for size, fileName in zip(header["sizes"], fileNames):
+		out = open(fileName, 'wb') if fileName else None
+		try:
+			while size > 0:
+				block = sock.recv(min(size, blockSize))
+				if not block:
+					raise EOFError("Connection closed")
+				if out:
+					out.write(block)
+				size -= len(block)
+		finally:
+			if out:
+				out.close()
+
+def contentKey(meshFile, args):
+	'''Jobs with the same key give the same G-code'''
+	h = hashlib.sha1()
+	hashFile(h, meshFile)
+	h.update("\0".join(args).encode("utf-8"))
+	return h.hexdigest()
+
+def parseAddress(text):
+	'''"host:port" to a (host, port) pair'''
+	host, _, port = text.rpartition(":")
+	return (host or "127.0.0.1", int(port))
+
+def removeFile(fileName):
+	try:
+		os.remove(fileName)
+	except OSError:
+		pass
+
+class FarmHandler(socketserver.BaseRequestHandler):
+	def handle(self):
+		self.server.farm.serve(self.request, "%s:%d" % self.client_address[:2])
+
+class FarmTCPServer(socketserver.ThreadingTCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+class SliceServer:
+	'''Hands BatchJobs out to SliceWorkers and collects their results
+
+	Jobs need the stlFile and args that SlicePipeline.makeBatchJob gives
+	them. onStatus(job) and postProcess(job) work as for SliceBatch, both
+	are called from the connection threads. A job is retried up to retries
+	times, whether its engine failed or its worker went missing.'''
+	# Seconds a worker waits before asking again when there is no work
+	idleDelay = 0.5
+
+	def __init__(self, host="127.0.0.1", port=0, retries=1, timeout=10.0, onStatus=None, postProcess=None):
+		self.retries = max(0, int(retries))
+		self.timeout = timeout
+		self.onStatus = onStatus
+		self.postProcess = postProcess
+		self.tcp = FarmTCPServer((host, port), FarmHandler)
+		self.tcp.farm = self
+		self.address = self.tcp.server_address
+		self.lock = threading.Condition()
+		self.jobs = {}
+		self.queue = collections.deque()
+		# content key -> the job slicing it, the finished job, the jobs waiting for it
+		self.leaders = {}
+		self.results = {}
+		self.followers = {}
+		self.nextId = 1
+		self.workers = set()
+		self.stopping = False
+		self.started = None
+
+	def start(self):
+		'''Accept workers in the background'''
+		self.started = time.time()
+		for target in (self.tcp.serve_forever, self._monitor):
+			t = threading.Thread(target=target)
+			t.daemon = True
+			t.start()
+		log.info("Slice server listening on %s:%d", self.address[0], self.address[1])
+
+	def stop(self):
+		'''Stop handing out work and close the listening socket'''
+		with self.lock:
+			self.stopping = True
+			self.lock.notify_all()
+		self.tcp.shutdown()
+		self.tcp.server_close()
+
+	def _setStatus(self, job, status):
+		job.status = status
+		if self.onStatus:
+			self.onStatus(job)
+
+	def submit(self, job):
+		'''Queue a job, or resolve it at once from an identical finished one'''
+		job.key = contentKey(job.stlFile, job.args)
+		with self.lock:
+			job.farmId = self.nextId
+			self.nextId += 1
+			job.worker = None
+			job.started = time.time()
+			self.jobs[job.farmId] = job
+			if job.key in self.results:
+				self._copyResult(self.results[job.key], job)
+			elif job.key in self.leaders:
+				self.followers.setdefault(job.key, []).append(job)
+				self._setStatus(job, "queued")
+			else:
+				self.leaders[job.key] = job
+				self.queue.append(job)
+				self._setStatus(job, "queued")
+		return job
+
+	def cancel(self):
+		with self.lock:
+			for job in self.jobs.values():
+				if job.status not in finalStates:
+					job.worker = None
+					self._setStatus(job, "cancelled")
+			self.lock.notify_all()
+
+	def wait(self, jobs=None, timeout=None):
+		'''Block until jobs (default all) are finished, True if they all succeeded'''
+		end = None if timeout is None else time.time() + timeout
+		with self.lock:
+			if jobs is None:
+				jobs = list(self.jobs.values())
+			while [j for j in jobs if j.status not in finalStates]:
+				if end is not None and time.time() >= end:
+					return False
+				self.lock.wait(0.5)
+		return not [j for j in jobs if j.status != "done"]
+
+	def report(self, jobs=None):
+		# SliceBatch needs FreeCAD, the workers import this module without it
+		from SliceBatch import batchReport
+		if jobs is None:
+			jobs = sorted(self.jobs.values(), key=lambda j: j.farmId)
+		return batchReport(jobs, len(self.workers), time.time() - (self.started or time.time()))
+
+	def _assign(self, worker):
+		with self.lock:
+			while self.queue:
+				job = self.queue.popleft()
+				if job.status == "queued":
+					job.attempts += 1
+					job.worker = worker
+					job.lastBeat = time.time()
+					self._setStatus(job, "running")
+					return job
+			return None
+
+	def _beat(self, jobId, worker):
+		with self.lock:
+			job = self.jobs.get(jobId)
+			if job and job.worker == worker and job.status == "running":
+				job.lastBeat = time.time()
+				return True
+			return False
+
+	def _requeue(self, job, reason):
+		'''Give a job back to the queue, or fail it once it is out of retries'''
+		job.worker = None
+		f = open(job.logFile, 'a')
+		f.write(reason + '\n')
+		f.close()
+		if job.attempts <= self.retries and not self.stopping:
+			log.info("%s: %s, queued again", job.name, reason)
+			self.queue.append(job)
+			self._setStatus(job, "queued")
+		else:
+			job.exitCode = -1
+			self._finish(job)
+
+	def _workerLost(self, worker):
+		with self.lock:
+			for job in self.jobs.values():
+				if job.worker == worker and job.status == "running":
+					self._requeue(job, "Lost worker " + worker)
+
+	def _monitor(self):
+		'''Requeue the jobs of workers that stopped sending heartbeats'''
+		while not self.stopping:
+			time.sleep(min(1.0, self.timeout / 4.0))
+			with self.lock:
+				now = time.time()
+				for job in self.jobs.values():
+					if job.worker and job.status == "running" and now - job.lastBeat > self.timeout:
+						self._requeue(job, "No heartbeat from worker " + job.worker)
+
+	def _copyResult(self, source, job):
+		'''Finish job with the files of the identical job source'''
+		job.exitCode = source.exitCode
+		try:
+			if source.exitCode == 0:
+				shutil.copyfile(source.gcodeFile, job.gcodeFile)
+			shutil.copyfile(source.logFile, job.logFile)
+		except (IOError, OSError) as e:
+			log.warn("Can't copy the result of %s to %s: %s", source.name, job.name, e)
+			job.exitCode = -1
+		job.stats = source.stats
+		self._finish(job)
+
+	def _finish(self, job):
+		'''Called with the lock held once job has its exit code'''
+		job.elapsed = time.time() - job.started
+		if job.status == "cancelled":
+			pass
+		elif job.exitCode == 0:
+			self._setStatus(job, "done")
+		else:
+			self._setStatus(job, "failed")
+		if self.leaders.get(job.key) is job:
+			del self.leaders[job.key]
+			if job.exitCode == 0:
+				self.results[job.key] = job
+			for follower in self.followers.pop(job.key, []):
+				if follower.status != "cancelled":
+					self._copyResult(job, follower)
+		self.lock.notify_all()
+
+	def _receive(self, sock, msg, worker):
+		'''Read a result into part files, they only replace the job's files if it is still this worker's'''
+		job = self.jobs.get(msg["id"])
+		if job is None:
+			recvFiles(sock, msg, [])
+			return
+		suffix = ".%d.part" % msg["attempt"]
+		parts = [job.logFile + suffix, job.gcodeFile + suffix]
+		recvFiles(sock, msg, parts)
+		with self.lock:
+			current = job.worker == worker and job.status == "running" and job.attempts == msg["attempt"]
+			if current:
+				job.worker = None
+		if not current:
+			for part in parts:
+				removeFile(part)
+			return
+		shutil.move(parts[0], job.logFile)
+		exitCode = msg["exitCode"]
+		if exitCode == 0:
+			shutil.move(parts[1], job.gcodeFile)
+			if self.postProcess:
+				try:
+					self.postProcess(job)
+				except Exception as e:
+					f = open(job.logFile, 'a')
+					f.write("Post-processing failed: " + str(e) + '\n')
+					f.close()
+					exitCode = -1
+		with self.lock:
+			if job.status != "running":
+				return
+			if exitCode != 0 and job.attempts <= self.retries and not self.stopping:
+				self._requeue(job, "Sliced by %s with exit code %d" % (worker, exitCode))
+				return
+			job.exitCode = exitCode
+			self._finish(job)
+
+	def serve(self, sock, address):
+		'''Talk to one worker until it disconnects'''
+		worker = address
+		try:
+			while True:
+				msg = recvMessage(sock)
+				if msg is None:
+					break
+				kind = msg.get("type")
+				if kind == "hello":
+					worker = "%s@%s" % (msg.get("worker"), address)
+					with self.lock:
+						self.workers.add(worker)
+					log.info("Worker %s connected", worker)
+					# Workers beat a few times per timeout
+					sendMessage(sock, {"type": "ok", "version": protocolVersion, "heartbeat": self.timeout / 3.0})
+				elif kind == "get":
+					job = None if self.stopping else self._assign(worker)
+					if job:
+						sendMessage(sock, {"type": "job", "id": job.farmId, "attempt": job.attempts,
+										"name": job.name, "args": job.args}, [job.stlFile])
+					elif self.stopping:
+						sendMessage(sock, {"type": "stop"})
+					else:
+						sendMessage(sock, {"type": "wait", "delay": self.idleDelay})
+				elif kind == "heartbeat":
+					if self._beat(msg["id"], worker):
+						sendMessage(sock, {"type": "ok"})
+					else:
+						sendMessage(sock, {"type": "cancel"})
+				elif kind == "result":
+					self._receive(sock, msg, worker)
+					sendMessage(sock, {"type": "ok"})
+				else:
+					raise ValueError("Unknown message " + str(kind))
+		except (socket.error, EOFError, ValueError, KeyError) as e:
+			log.warn("Worker %s: %s", worker, e)
+		finally:
+			self._workerLost(worker)
+			log.info("Worker %s disconnected", worker)
+
+class SliceWorker:
+	'''Slices the jobs a SliceServer hands out with a local engine
+
+	engine is a SliceEngine, its command line is built here from the
+	arguments the server sends.'''
+	def __init__(self, address, engine, workDir=None, name=None, heartbeat=2.0):
+		self.address = address
+		self.engine = engine
+		self.workDir = workDir or tempfile.mkdtemp(prefix="sliceworker")
+		self.name = name or socket.gethostname()
+		self.heartbeat = heartbeat
+		self.stopped = False
+		self.sliced = 0
+
+	def stop(self):
+		'''Leave after the current job'''
+		self.stopped = True
+
+	def run(self):
+		'''Work until the server says stop or goes away'''
+		sock = socket.create_connection(self.address)
+		try:
+			sendMessage(sock, {"type": "hello", "worker": self.name, "version": protocolVersion})
+			reply = recvMessage(sock)
+			if reply is None:
+				return
+			self.heartbeat = min(self.heartbeat, reply.get("heartbeat", self.heartbeat))
+			while not self.stopped:
+				sendMessage(sock, {"type": "get"})
+				msg = recvMessage(sock)
+				if msg is None or msg["type"] == "stop":
+					break
+				if msg["type"] == "wait":
+					time.sleep(msg["delay"])
+					continue
+				self.runJob(sock, msg)
+		except (socket.error, EOFError) as e:
+			log.warn("Worker %s lost the server: %s", self.name, e)
+		finally:
+			sock.close()
+
+	def runJob(self, sock, msg):
+		base = os.path.join(self.workDir, "job%d_%d" % (msg["id"], msg["attempt"]))
+		meshFile, gcodeFile, logFile = base + ".stl", base + ".gcode", base + ".log"
+		recvFiles(sock, msg, [meshFile])
+		cmdList = self.engine.command(msg["args"], meshFile, gcodeFile)
+		f = open(logFile, 'w')
+		try:
+			f.write("Sliced by %s:\n%s\n" % (self.name, "\n".join(cmdList)))
+			f.flush()
+			try:
+				proc = subprocess.Popen(cmdList, stderr=f)
+			except OSError as e:
+				f.write("Failed to start " + cmdList[0] + ": " + str(e) + '\n')
+				exitCode = -1
+			else:
+				exitCode = self._wait(sock, msg["id"], proc)
+			if exitCode == 0:
+				try:
+					self.engine.collectOutputs(gcodeFile)
+				except SliceEngine.EngineError as e:
+					f.write(str(e) + '\n')
+					exitCode = -1
+		finally:
+			f.close()
+		try:
+			files = [logFile, gcodeFile] if exitCode == 0 else [logFile]
+			sendMessage(sock, {"type": "result", "id": msg["id"], "attempt": msg["attempt"], "exitCode": exitCode}, files)
+			recvMessage(sock)
+			self.sliced += 1
+		finally:
+			for fileName in (meshFile, gcodeFile, logFile):
+				removeFile(fileName)
+
+	def _wait(self, sock, jobId, proc):
+		'''Wait for the engine, sending heartbeats. It is killed if the server takes the job away'''
+		nextBeat = time.time() + self.heartbeat
+		try:
+			while proc.poll() is None:
+				time.sleep(0.05)
+				if time.time() < nextBeat:
+					continue
+				nextBeat += self.heartbeat
+				sendMessage(sock, {"type": "heartbeat", "id": jobId})
+				reply = recvMessage(sock)
+				if reply is None:
+					raise EOFError("Connection closed")
+				if reply["type"] == "cancel":
+					proc.kill()
+					proc.wait()
+					return -1
+		except BaseException:
+			if proc.poll() is None:
+				proc.kill()
+				proc.wait()
+			raise
+		return proc.returncode
+
+def startWorkers(address, count, engine, name=None):
+	'''Run count workers in threads of this process, eg for a server on localhost'''
+	workers = []
+	for i in range(count):
+		worker = SliceWorker(address, engine, name="%s-%d" % (name or socket.gethostname(), i + 1))
+		t = threading.Thread(target=worker.run)
+		t.daemon = True
+		t.start()
+		worker.thread = t
+		workers.append(worker)
+	return workers
+
+def main(argv=None):
+	import argparse
+	parser = argparse.ArgumentParser(prog="SliceFarm", description="Slice the jobs of a SliceServer")
+	parser.add_argument("server", help="HOST:PORT of the server")
+	parser.add_argument("--engine", choices=SliceEngine.engineNames, default="CuraEngine")
+	parser.add_argument("--cura", default="/usr/share/cura/CuraEngine", help="CuraEngine binary")
+	parser.add_argument("--workers", type=int, default=1, help="jobs to run at a time")
+	parser.add_argument("--name", help="worker name, the host name by default")
+	args = parser.parse_args(argv)
+	if args.engine == "Fake":
+		engine = SliceEngine.FakeEngine()
+	else:
+		engine = SliceEngine.CuraEngine(args.cura)
+	workers = startWorkers(parseAddress(args.server), args.workers, engine, args.name)
+	for worker in workers:
+		while worker.thread.is_alive():
+			worker.thread.join(1.0)
+			# PluginLog queues what the worker threads log for this thread
+			if hasattr(log, "flushQueued"):
+				log.flushQueued()
+	return 0
+
+if __name__ == "__main__":
+	import logging
+	logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+	sys.exit(main())
@@ -0,0 +1,110 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+from PySide import QtCore
+from SliceVars import writeLogHeader
+from SliceEngine import CuraEngine
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+class SliceJob(QtCore.QObject):
+	'''Runs a slicing engine in the background so the GUI stays responsive
+
+	engine is the SliceEngine that cmdList came from, it reads the progress.'''
+	progress = QtCore.Signal(int, str)
+	logText = QtCore.Signal(str)
+	finished = QtCore.Signal(int)
+
+	def __init__(self, cmdList, logFile, parent=None, engine=None):
+		QtCore.QObject.__init__(self, parent)
+		self.cmdList = cmdList
+		self.engine = engine or CuraEngine(cmdList[0])
+		self.logFile = logFile
+		self.cancelled = False
+		self.exitCode = None
+		self._log = None
+		self._partial = ""
+		self.proc = QtCore.QProcess(self)
+		self.proc.readyReadStandardError.connect(self._readStderr)
+		self.proc.finished.connect(self._finished)
+		self.proc.error.connect(self._error)
+
+	def start(self):
+		self._log = open(self.logFile, 'w')
+		writeLogHeader(self._log, self.cmdList)
+		self._log.flush()
+		self.proc.start(self.cmdList[0], self.cmdList[1:])
+
+	def isRunning(self):
+		return self.proc.state() != QtCore.QProcess.NotRunning
+
+	def cancel(self):
+		if self.isRunning():
+			self.cancelled = True
+			self.proc.kill()
+
+	def _readStderr(self):
+		data = self.proc.readAllStandardError().data()
+		if not isinstance(data, str):
+			data = data.decode("utf-8", "replace")
+		if not data:
+			return
+		self._log.write(data)
+		self._log.flush()
+		self.logText.emit(data)
+		# Only parse complete lines, keep the rest for the next chunk
+		lines = (self._partial + data).split('\n')
+		self._partial = lines.pop()
+		for line in lines:
+			prog = self.engine.parseProgress(line)
+			if prog:
+				self.progress.emit(prog[0], prog[1])
+
+	def _error(self, err):
+		# FailedToStart never emits finished(), so close out the job here
+		if err == QtCore.QProcess.FailedToStart:
+			self._finish(-1, "Failed to start " + self.cmdList[0] + '\n')
+
+	def _finished(self, exitCode, exitStatus=None):
+		self._readStderr()
+		if self.cancelled:
+			self._finish(-1, "Slice cancelled\n")
+		elif exitStatus == QtCore.QProcess.CrashExit:
+			self._finish(-1, self.engine.name + " crashed\n")
+		else:
+			self._finish(exitCode, "")
+
+	def _finish(self, exitCode, msg):
+		if self.exitCode is not None:
+			return
+		self.exitCode = exitCode
+		if self._log:
+			if msg:
+				self._log.write(msg)
+			self._log.close()
+			self._log = None
+		if msg:
+			self.logText.emit(msg)
+		self.finished.emit(exitCode)
@@ -0,0 +1,283 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import FreeCAD, MeshExport, GcodePost, GcodeAnalyzer, GcodeMerge, LayerIndex, SliceEngine
+import os, shutil, tempfile
+from PluginLog import log
+from SliceVars import argBuilder
+from SliceBatch import BatchJob
+from SliceCache import SliceCache
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+groupType = "App::DocumentObjectGroup"
+
+def groupMembers(group):
+	members = []
+	for obj in group.Group:
+		if obj.isDerivedFrom(groupType):
+			members.extend(groupMembers(obj))
+		else:
+			members.append(obj)
+	return members
+
+def splitIslands(partList):
+	'''The islands of a split slice, a group is one island and every other object one of its own'''
+	islands = []
+	for obj in partList:
+		if obj.isDerivedFrom(groupType):
+			members = groupMembers(obj)
+			if members:
+				islands.append(members)
+		else:
+			islands.append([obj])
+	return islands
+
+class SlicePipeline:
+	'''The steps of a slice that don't need the GUI
+
+	Everything is read from a SliceDef, so the task panel and the command
+	line slicer (SliceCli) export, place, slice and post-process the same
+	way.'''
+	def __init__(self, Vars):
+		self.Vars = Vars
+
+	def getEngine(self):
+		return SliceEngine.getEngine(self.Vars.copyMisc())
+
+	def getCache(self):
+		'''Return the result cache, or None if it is disabled'''
+		if not self.Vars.readMisc("CACHEMODE"):
+			return None
+		return SliceCache(self.Vars.readMisc("CachePath"), self.Vars.readMisc("CacheSize") * 1048576)
+
+	def getDeviation(self):
+		'''Return the (linear, angular) mesh deviation to export with'''
+		linear = self.Vars.readMisc("LinearDeviation")
+		if self.Vars.readMisc("AUTODEVIATION"):
+			linear = MeshExport.autoDeviation(self.Vars.readMisc("NozzleDiameter"), self.Vars.readSetting("layerThickness"))
+		return (linear, self.Vars.readMisc("AngularDeviation"))
+
+	def partPosition(self, partsList, bb=None):
+		'''Return the center of the parts, with the minimum Z as z
+
+		bb is the exact bound box of the exported mesh if it is known,
+		otherwise the bound boxes of the parts are merged. Nothing in the
+		document is changed or recomputed.'''
+		if bb is None:
+			bb = FreeCAD.BoundBox()
+			for p in partsList:
+				if hasattr(p, "Shape"):
+					bb.add(p.Shape.BoundBox)
+				else:
+					bb.add(p.Mesh.BoundBox)
+		c = bb.Center
+		# We want the Minimum Z height. Anything below 0 is translated to "objectSink" setting
+		c.z = bb.ZMin
+		return c
+
+	def settingsArgs(self, pos, offset=None):
+		'''The "-s key=value" arguments, with the part placed at pos
+
+		offset moves an overridden position, so the islands of a split
+		slice keep their places around it.'''
+		_tmpDic = self.Vars.copySettings()
+
+		# {nozzleTemp} & {bedTemp} in the start code are filled in by the post-processing
+
+		# Set the part placement
+		if not self.Vars.readMisc("OPPMODE"):
+			_tmpDic["posx"] = pos.x
+			_tmpDic["posy"] = pos.y
+			_tmpDic["objectSink"] = pos.z
+		elif offset is not None:
+			_tmpDic["posx"] += offset.x
+			_tmpDic["posy"] += offset.y
+
+		# Scaling and the settings of disabled features are handled by the schema
+		return argBuilder.build(_tmpDic, self.Vars.copyMisc())
+
+	def postValues(self):
+		'''Placeholder values for the post-processing'''
+		return {"nozzleTemp": self.Vars.readMisc("NozzleTemp"), "bedTemp": self.Vars.readMisc("BedTemp")}
+
+	def postStages(self):
+		return GcodePost.defaultStages(self.Vars.readMisc("PostPluginDir"))
+
+	def analyzerArgs(self):
+		return (self.Vars.readSetting("filamentDiameter"), self.Vars.readMisc("FilamentDensity"),
+				self.Vars.readMisc("PrintAcceleration"))
+
+	def analyzeGcode(self, gcodeFile, logFile, args=None):
+		'''Print time and filament of gcodeFile, also written next to logFile
+
+		The layer index is saved from the same pass over the file. Returns
+		None if the analysis fails, the G-code itself is fine then.'''
+		if args is None:
+			args = self.analyzerArgs()
+		try:
+			analyzer = GcodeAnalyzer.GcodeAnalyzer(*args, keepLayers=True)
+			stats = analyzer.analyzeFile(gcodeFile)
+			stats.writeReport(GcodeAnalyzer.reportFile(logFile))
+			LayerIndex.fromAnalyzer(gcodeFile, analyzer)
+		except Exception as e:
+			log.warn("Can't analyze %s: %s", gcodeFile, e)
+			return None
+		log.info("%s: %s", gcodeFile, stats.summary().rstrip().replace('\n', ', '))
+		return stats
+
+	def batchPost(self):
+		'''The post-processing of a batch job, it runs in the job's worker thread'''
+		values = self.postValues()
+		stages = self.postStages()
+		args = self.analyzerArgs()
+		def post(job):
+			# The G-code of an island is post-processed once it is merged
+			if job.island:
+				return
+			GcodePost.process(job.gcodeFile, values, stages)
+			job.stats = self.analyzeGcode(job.gcodeFile, job.logFile, args)
+		return post
+
+	def makeBatchJob(self, doc, partList, name, settings=None, shift=None, outBase=None, plate=None):
+		'''Export partList and build a BatchJob for it
+
+		settings overrides the stored settings, shift is subtracted from the
+		part position (eg to bring an overflow plate back onto the bed).
+		The output goes next to the document unless outBase (the path
+		without extension) is given. plate is the position of the whole
+		selection when partList is an island of a split slice.'''
+		if outBase is None:
+			docDir = doc.FileName.replace(doc.Label + ".fcstd", "")
+			outBase = docDir + doc.Label + "_" + name
+		stlParts = MeshExport.stlTempFile(doc.Label + "_" + name)
+		engine = self.getEngine()
+		engine.prepareMesh(partList, stlParts, self.getDeviation())
+		pos = self.partPosition(partList, MeshExport.tessCache.bounds)
+		if shift:
+			pos = pos - shift
+		offset = None
+		if plate is not None:
+			offset = pos - plate
+		args = self.settingsArgs(pos, offset)
+		if settings:
+			args = overrideSettings(args, settings)
+		job = BatchJob(name, engine.command(args, stlParts, outBase + ".gcode"), outBase + ".log", outBase + ".gcode", engine)
+		job.stlFile = stlParts
+		# The engine arguments on their own, for running the job elsewhere (SliceFarm)
+		job.args = args
+		job.island = plate is not None
+		return job
+
+	def copySets(self, islands, replicate=False):
+		'''Group the islands that are copies of each other, a list of lists of islands
+
+		Only single object islands with the same MeshExport.copyKey() are
+		copies, and only with replicate. Every other island is a set of
+		its own.'''
+		if not replicate:
+			return [[island] for island in islands]
+		deviation = self.getDeviation()
+		sets = []
+		byKey = {}
+		for island in islands:
+			if len(island) != 1:
+				sets.append([island])
+				continue
+			key = MeshExport.copyKey(island[0], deviation)
+			if key in byKey:
+				byKey[key].append(island)
+			else:
+				byKey[key] = [island]
+				sets.append(byKey[key])
+		return sets
+
+	def makeSplitJobs(self, doc, sets, name):
+		'''Export the first island of every set (see copySets) and build a BatchJob that slices it where it sits
+
+		The islands' G-code goes to a temp dir, mergeSplit() puts it
+		together. job.copies has the XY offsets of the set's islands from
+		the one that is sliced.'''
+		tmpDir = tempfile.mkdtemp(prefix="split_", dir=MeshExport.stlTempDir())
+		plate = self.partPosition(sum(sum(sets, []), []))
+		jobs = []
+		for n, islands in enumerate(sets):
+			job = self.makeBatchJob(doc, islands[0], "%s_%d" % (name, n + 1),
+									outBase=os.path.join(tmpDir, "island%d" % (n + 1)), plate=plate)
+			job.copies = [(0.0, 0.0)]
+			for island in islands[1:]:
+				offset = MeshExport.copyOrigin(island[0]) - MeshExport.copyOrigin(islands[0][0])
+				job.copies.append((offset.x, offset.y))
+			jobs.append(job)
+		return jobs
+
+	def writeSplitLog(self, jobs, logFile):
+		'''Put the engine logs of the islands together in logFile'''
+		out = open(logFile, 'w')
+		try:
+			for job in jobs:
+				out.write("==== %s: %s ====\n" % (job.name, job.status))
+				try:
+					f = open(job.logFile, 'r')
+					out.write(f.read())
+					f.close()
+				except IOError:
+					pass
+		finally:
+			out.close()
+
+	def mergeSplit(self, jobs, gcodeFile):
+		'''Merge the G-code of the finished islands into gcodeFile, returns the number of layers'''
+		retraction = None
+		if self.Vars.readMisc("RETRACTMODE"):
+			retraction = (self.Vars.readSetting("retractionAmount"), self.Vars.readSetting("retractionSpeed"))
+		return GcodeMerge.mergeFiles([job.gcodeFile for job in jobs], gcodeFile,
+									self.Vars.readSetting("moveSpeed"), retraction, [job.copies for job in jobs])
+
+	def removeSplit(self, jobs):
+		'''Remove the temp dir of split jobs'''
+		if jobs:
+			shutil.rmtree(os.path.dirname(jobs[0].gcodeFile), True)
+
+	def removeBatchFiles(self, batch):
+		'''Remove the temp meshes of a batch and the temp dir of its islands
+
+		Nothing is logged, so it can run in the batch thread.'''
+		for job in batch.jobs:
+			try:
+				os.remove(job.stlFile)
+			except OSError:
+				pass
+		self.removeSplit([job for job in batch.jobs if job.island])
+
+def overrideSettings(_cmdList, settings):
+	'''Replace the "-s key=value" pairs in _cmdList with the values (in CuraEngine units) in settings'''
+	_cmdList = list(_cmdList)
+	for i in range(len(_cmdList) - 1):
+		if _cmdList[i] == "-s":
+			key = _cmdList[i + 1].split("=", 1)[0]
+			if key in settings:
+				_cmdList[i + 1] = key + "=" + str(settings[key])
+	return _cmdList
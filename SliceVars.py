@@ -22,123 +22,333 @@
 #***************************************************************************
 
 import FreeCAD, Part
-from FreeCAD import Console
+from PluginLog import log
 import os,sys,string
 
 __title__="CuraEngine Slicer Plugin"
 __author__ = "cblt2l"
 __url__ = "http://www.freecadweb.org"
 
+def writeLogHeader(f, cmdList):
+	'''Write the settings banner that starts every CuraEngine log file'''
+	f.write("#############CURA PLUGIN SETTINGS#############\n")
+	for index in cmdList:
+		f.write(index + '\n')
+	f.write("###############END CURA SETTINGS##############\n")
+
+class ParamStore:
+	'''In memory copy of a FreeCAD parameter group
+
+	The group is read once when the store is created, reads are served from
+	memory and changed keys are written back in batches by flush().'''
+	# Flush on its own once this many keys are waiting
+	batchSize = 32
+
+	def __init__(self, path):
+		self.path = path
+		self.values = {}
+		self.types = {}
+		self.dirty = set()
+		self.load()
+
+	def load(self):
+		'''(Re)read the whole group, dropping anything not flushed'''
+		grp = FreeCAD.ParamGet(self.path)
+		self.values = {}
+		self.types = {}
+		self.dirty = set()
+		for key in grp.GetFloats():
+			self.values[key] = grp.GetFloat(key)
+			self.types[key] = "float"
+		for key in grp.GetStrings():
+			self.values[key] = grp.GetString(key)
+			self.types[key] = "string"
+
+	def has(self, key):
+		return key in self.values
+
+	def get(self, key, default):
+		return self.values.get(key, default)
+
+	def set(self, key, val, pt):
+		if pt == "float":
+			val = float(val)
+		if self.types.get(key) == pt and self.values.get(key) == val:
+			return
+		self.values[key] = val
+		self.types[key] = pt
+		self.dirty.add(key)
+		if len(self.dirty) >= self.batchSize:
+			self.flush()
+
+	def flush(self):
+		if not self.dirty:
+			return
+		grp = FreeCAD.ParamGet(self.path)
+		for key in self.dirty:
+			if self.types[key] == "string":
+				grp.SetString(key, self.values[key])
+			else:
+				grp.SetFloat(key, self.values[key])
+		self.dirty = set()
+
+class MemoryStore(ParamStore):
+	'''A ParamStore that starts from the saved group but is never written back
+
+	For settings that only apply to one run, like a profile loaded by the
+	command line slicer.'''
+	def flush(self):
+		self.dirty = set()
+
+def readProfile(fileName):
+	'''The values in a settings file written by writeSettingsFile, key -> (value, type)'''
+	import xml.etree.ElementTree as ElementTree
+	values = {}
+	for element in ElementTree.parse(fileName).getroot().iter():
+		name = element.get("Name")
+		if element.tag == "FCFloat":
+			values[name] = (float(element.get("Value")), "float")
+		elif element.tag == "FCText":
+			values[name] = (element.text or "", "string")
+	return values
+
+# One store per parameter group, shared by every panel
+stores = {}
+
+def getStore(path):
+	if path not in stores:
+		stores[path] = ParamStore(path)
+	return stores[path]
+
+cePath = "User parameter:BaseApp/Preferences/Mod/CuraEngine"
+
+# Version of the keys and defaults below. Bump it whenever keys are added,
+# removed or change meaning. SliceDef.migrate writes the defaults of new keys,
+# add a step to migrations only if stored values have to be converted (eg a
+# renamed key or a changed unit).
+schemaVersion = 8
+
+# version -> function(SliceDef) that brings a group from version - 1 up to version
+migrations = {}
+
+# Get user's home dir
+freecaddir = os.path.expanduser("~") + "/.FreeCAD/"
+
+defaultStartCode = \
+	"M109 S{nozzleTemp}     ;Set Nozzle Temp and Wait\n"\
+	"M190 S{bedTemp}      ;Set Bed Temp and Wait\n"\
+	"G21           ;metric values\n"\
+	"G90           ;absolute positioning\n"\
+	"G28           ;Home\n"\
+	"G1 Z15.0 F300 ;move the platform down 15mm\n"\
+	"G92 E0        ;zero the extruded length\n"\
+	"G1 F200 E5    ;extrude 5mm of feed stock\n"\
+	"G92 E0        ;zero the extruded length again\n"
+
+defaultEndCode = \
+	"M104 S0                     ;extruder heater off\n"\
+	"M140 S0                     ;heated bed heater off (if you have it)\n"\
+	"G91                         ;relative positioning\n"\
+	"G1 E-1 F300                    ;retract the filament a bit before lifting the nozzle, to release some of the pressure\n"\
+	"G1 Z+0.5 E-5 X-20 Y-20 F9000   ;move Z up a bit and retract filament even more\n"\
+	"G28 X0 Y0                      ;move X/Y to min endstops, so the head is out of the way\n"\
+	"M84                         ;steppers off\n"\
+	"G90                         ;absolute positioning\n"
+
+# Settings that are required by CuraEngine
+# (name, type, scale, feature toggle, default)
+# scale: CuraEngine takes lengths in microns, so mm values are multiplied by 1000
+# feature toggle: the Misc mode that must be on for the value to be passed, otherwise 0 is passed
+engineSchema = [
+	("filamentDiameter", "float", 1000, None, 3),
+	("initialLayerThickness", "float", 1000, None, 0.3),
+	("layerThickness", "float", 1000, None, 0.1),
+	("insetCount", "float", 1, None, 2),
+	("downSkinCount", "float", 1, None, 6),
+	("upSkinCount", "float", 1, None, 6),
+	("sparseInfillLineDistance", "float", 1000, None, 2),
+	("filamentFlow", "float", 1, None, 100),
+	# Better Way?? Should follow NozzleDiameter
+	("extrusionWidth", "float", 1000, None, .5),
+	("posx", "float", 1000, None, 100),
+	("posy", "float", 1000, None, 100),
+	("objectSink", "float", 1, None, 0),
+	("printSpeed", "float", 1, None, 50),
+	("moveSpeed", "float", 1, None, 200),
+	("infillSpeed", "float", 1, None, 50),
+	("inset0Speed", "float", 1, None, 50),
+	("insetXSpeed", "float", 1, None, 50),
+	("initialLayerSpeed", "float", 1, None, 20),
+	("minimalLayerTime", "float", 1, None, 5),
+	("fanSpeedMin", "float", 1, "FANMODE", 100),
+	("fanSpeedMax", "float", 1, "FANMODE", 100),
+	("fanFullOnLayerNr", "float", 1, "FANMODE", 2),
+	("retractionAmount", "float", 1000, "RETRACTMODE", 4.5),
+	("retractionSpeed", "float", 1, "RETRACTMODE", 45),
+	("retractionAmountExtruderSwitch", "float", 1000, "RETRACTMODE", 14.5),
+	("retractionMinimalDistance", "float", 1000, "RETRACTMODE", 1.5),
+	("minimalExtrusionBeforeRetraction", "float", 1000, "RETRACTMODE", 0.1),
+	("enableCombing", "float", 1, "RETRACTMODE", 0),
+	("skirtDistance", "float", 1000, "SKIRTMODE", 6),
+	("skirtLineCount", "float", 1, "SKIRTMODE", 1),
+	("skirtMinLength", "float", 1, "SKIRTMODE", 0),
+	("supportAngle", "float", 1, None, -1),
+	("supportEverywhere", "float", 1, "SUPPORTMODE", 0),
+	("supportLineDistance", "float", 1, "SUPPORTMODE", 0),
+	("supportExtruder", "float", 1, None, -1),
+	("supportXYDistance", "float", 1000, "SUPPORTMODE", 0.7),
+	("supportZDistance", "float", 1000, "SUPPORTMODE", 0.15),
+	("raftMargin", "float", 1000, "RAFTMODE", 5),
+	("raftLineSpacing", "float", 1000, "RAFTMODE", 1),
+	("raftBaseThickness", "float", 1, "RAFTMODE", 0),
+	("raftBaseLinewidth", "float", 1, "RAFTMODE", 0),
+	("raftInterfaceThickness", "float", 1, "RAFTMODE", 0),
+	("raftInterfaceLinewidth", "float", 1, "RAFTMODE", 0),
+	("spiralizeMode", "float", 1, None, 0),
+	("startCode", "string", 1, None, defaultStartCode),
+	("endCode", "string", 1, None, defaultEndCode),
+]
+
+# Settings that are not CuraEngine settings
+# (name, type, default)
+miscSchema = [
+	#("XStroke", "float", 300000), ("YStroke", "float", 300000), ("ZStroke", "float", 120000),
+	("NozzleTemp", "float", 185),
+	("BedTemp", "float", 60),
+	("NozzleDiameter", "float", 0.5),
+	("CuraPath", "string", "/usr/share/cura/CuraEngine"),
+	# CuraEngine, or Fake for FakeEngine.py, see SliceEngine
+	("SliceEngine", "string", "CuraEngine"),
+	("FakeLayers", "float", 0),
+	("FakeMoves", "float", 500),
+	("FakeLayerTime", "float", 0.01),
+	("FakePython", "string", ""),
+	("POSX", "float", 100),
+	("POSY", "float", 100),
+	("POSZ", "float", 0),
+	("OPPMODE", "float", False),
+	("FANMODE", "float", False),
+	("RETRACTMODE", "float", False),
+	("SKIRTMODE", "float", False),
+	("SUPPORTMODE", "float", False),
+	("RAFTMODE", "float", False),
+	("InfillDensity", "float", 20),
+	("SupportDensity", "float", 20),
+	("BatchWorkers", "float", 4),
+	("BatchRetries", "float", 1),
+	("AUTODEVIATION", "float", True),
+	("LinearDeviation", "float", 0.1),
+	("AngularDeviation", "float", 28.5),
+	("CACHEMODE", "float", True),
+	("CachePath", "string", freecaddir + "SliceCache"),
+	("CacheSize", "float", 500),
+	("SettingsPath", "string", freecaddir + "CESettings.ces"),
+	("PostPluginDir", "string", freecaddir + "PostProcessing"),
+	# Print time and filament estimates, g/cm^3 and mm/s^2
+	("FilamentDensity", "float", 1.24),
+	("PrintAcceleration", "float", 3000),
+	# Every run report is also appended to RunHistory when it is set, the last RunHistorySize are kept
+	("RunHistory", "string", ""),
+	("RunHistorySize", "float", 500),
+	# Slice again when the sliced objects change, after WatchDelay seconds of quiet
+	("WATCHMODE", "float", False),
+	("WatchDelay", "float", 2),
+	# Slice every object (or group) of a selection in a process of its own and merge the G-code
+	("SPLITMODE", "float", False),
+	# Slice identical objects of a selection once and copy the toolpath to the others
+	("REPLICATEMODE", "float", False),
+]
+
+paramTypes = {}
+for entry in engineSchema + miscSchema:
+	paramTypes[entry[0]] = entry[1]
+
+class ArgBuilder:
+	'''Turns a settings snapshot into CuraEngine's "-s key=value" arguments
+
+	The schema is compiled once into a list of (name, scale, toggle), so
+	building the arguments is a single pass over that list.'''
+	def __init__(self, schema):
+		self.entries = [(name, scale, toggle) for name, pt, scale, toggle, default in schema]
+
+	def build(self, settings, modes):
+		'''settings holds the engine settings, modes the Misc feature toggles'''
+		_cmdList = []
+		append = _cmdList.append
+		for name, scale, toggle in self.entries:
+			if toggle and not modes[toggle]:
+				val = 0
+			else:
+				val = settings[name]
+			append("-s")
+			append(name + "=" + str(val * scale))
+		return _cmdList
+
+argBuilder = ArgBuilder(engineSchema)
+
+def benchArgBuilder(iterations=10000):
+	'''Micro-benchmark: microseconds per argument list built from the defaults'''
+	import time
+	settings = dict([(e[0], e[4]) for e in engineSchema])
+	modes = dict([(e[0], True) for e in miscSchema])
+	start = time.time()
+	for i in range(iterations):
+		argBuilder.build(settings, modes)
+	return (time.time() - start) * 1e6 / iterations
+
 class SliceDef:
 	'''Variables That Describe Machine Parameters'''
-	def __init__(self):
-		# Get user's home dir
-		homedir = os.path.expanduser("~")
-		freecaddir = homedir + "/.FreeCAD/"
-
-		# Settings that are not CuraEngine settings. These will be replaced with a GUI at some point
-		self.MiscDict = {}
-		#self.MiscDict.update({"XStroke":300000, "YStroke":300000, "ZStroke":120000})
-		self.MiscDict.update({"NozzleTemp":185, "BedTemp":60})
-		self.MiscDict.update({"NozzleDiameter":0.5})
-		self.MiscDict.update({"CuraPath":"/usr/share/cura/CuraEngine"})
-		self.MiscDict.update({"POSX":100, "POSY":100, "POSZ":0})
-		self.MiscDict.update({"OPPMODE":False, "FANMODE":False, "RETRACTMODE":False, "SKIRTMODE":False, "SUPPORTMODE":False, "RAFTMODE":False})
-		self.MiscDict.update({"InfillDensity":20, "SupportDensity":20})
-		self.MiscDict.update({"SettingsPath":(freecaddir + "CESettings.ces")})
-
-		# Settings that are required by CuraEngine
-		self.settingsDict = {}
-		self.settingsDict.update({"filamentDiameter": 3, "initialLayerThickness": 0.3,"layerThickness": 0.1, "insetCount": 2, "downSkinCount": 6, "upSkinCount": 6, 
-									"sparseInfillLineDistance": 2, "filamentFlow": 100})
-		# Better Way??
-		#self.settingsDict.update({"extrusionWidth": self.MiscDict["NozzleDiameter"]})
-		self.settingsDict.update({"extrusionWidth": .5, "posx": 100, "posy":100, "objectSink": 0})
-		self.settingsDict.update({"printSpeed": 50, "moveSpeed": 200, "infillSpeed": 50, "inset0Speed": 50, "insetXSpeed": 50, "initialLayerSpeed": 20, "minimalLayerTime":5})
-		self.settingsDict.update({"fanSpeedMin": 100, "fanSpeedMax": 100, "fanFullOnLayerNr": 2})
-		self.settingsDict.update({"retractionAmount": 4.5, "retractionSpeed": 45, "retractionAmountExtruderSwitch": 14.5, "retractionMinimalDistance": 1.5, 
-									"minimalExtrusionBeforeRetraction": 0.1, "enableCombing": 0})
-		self.settingsDict.update({"skirtDistance": 6, "skirtLineCount": 1, "skirtMinLength": 0})
-		self.settingsDict.update({"supportAngle": -1, "supportEverywhere": 0,"supportLineDistance": 0, "supportExtruder": -1, "supportXYDistance": 0.7, "supportZDistance": 0.15})
-		self.settingsDict.update({"raftMargin": 5, "raftLineSpacing": 1, "raftBaseThickness": 0, "raftBaseLinewidth": 0, "raftInterfaceThickness": 0, "raftInterfaceLinewidth": 0})
-		self.settingsDict.update({"spiralizeMode":0})
-		self.settingsDict.update({"startCode": \
-		"M109 S{nozzleTemp}     ;Set Nozzle Temp and Wait\n"\
-		"M190 S{bedTemp}      ;Set Bed Temp and Wait\n"\
-		"G21           ;metric values\n"\
-		"G90           ;absolute positioning\n"\
-		"G28           ;Home\n"\
-		"G1 Z15.0 F300 ;move the platform down 15mm\n"\
-		"G92 E0        ;zero the extruded length\n"\
-		"G1 F200 E5    ;extrude 5mm of feed stock\n"\
-		"G92 E0        ;zero the extruded length again\n"})
-		self.settingsDict.update({"endCode": \
-		"M104 S0                     ;extruder heater off\n"\
-		"M140 S0                     ;heated bed heater off (if you have it)\n"\
-		"G91                         ;relative positioning\n"\
-		"G1 E-1 F300                    ;retract the filament a bit before lifting the nozzle, to release some of the pressure\n"\
-		"G1 Z+0.5 E-5 X-20 Y-20 F9000   ;move Z up a bit and retract filament even more\n"\
-		"G28 X0 Y0                      ;move X/Y to min endstops, so the head is out of the way\n"\
-		"M84                         ;steppers off\n"\
-		"G90                         ;absolute positioning\n"})
-		##################################################################################################
+	def __init__(self, store=None):
+		self.MiscDict = dict([(name, default) for name, pt, default in miscSchema])
+		self.settingsDict = dict([(e[0], e[4]) for e in engineSchema])
 
+		if store is None:
+			store = getStore(cePath)
+		self.store = store
+		# Only probe the keys when the stored settings are from another version
+		stored = int(self.store.get("SchemaVersion", 0))
+		if stored != schemaVersion:
+			self.migrate(stored)
+
+	def migrate(self, stored):
+		'''Upgrade the stored settings from version stored and fill in missing defaults'''
+		log.info("Updating CuraEngine settings from version %d to %d", stored, schemaVersion)
+		for version in range(stored + 1, schemaVersion + 1):
+			if version in migrations:
+				migrations[version](self)
 		for key, val in self.MiscDict.items():
 			if not self.checkSetting(key):
 				self.writeMisc(key, val)
 		for key, val in self.settingsDict.items():
 			if not self.checkSetting(key):
 				self.writeSetting(key, val)
-		#Console.PrintMessage(key + " is " + str(self.checkSetting(key)) + "\n")
+		self.store.set("SchemaVersion", schemaVersion, "float")
+		self.store.flush()
 
 	def getParamType(self, param):
-		if param in ["startCode","endCode","CuraPath","SettingsPath"]:
-			return "string"
-		else:
-			return "float"
+		return paramTypes.get(param, "float")
 
 	def checkSetting(self, key):
-		grp = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/CuraEngine")
-		pt = self.getParamType(key)
-		# Check to see if setting has been set in grp
-		if pt is "string":
-			return grp.GetString(key, "~~~~~") != "~~~~~"
-		if pt is "float":
-			return grp.GetFloat(key,-1e200) != -1e200
+		# Check to see if setting has been set in grp with the right type
+		return self.store.has(key) and self.store.types[key] == self.getParamType(key)
 
 	def readSetting(self, key):
-		grp = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/CuraEngine")
-		pt = self.getParamType(key)
-		if pt is "string":
-			return grp.GetString(key, self.settingsDict[key])
-		elif pt is "float":
-			return grp.GetFloat(key, self.settingsDict[key])
+		return self.store.get(key, self.settingsDict[key])
 
 	def writeSetting(self, key, val):
-		grp = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/CuraEngine")
-		pt = self.getParamType(key)
-		if pt is "string":
-			grp.SetString(key, val)
-		elif pt is "float":
-			grp.SetFloat(key, val)
-		Console.PrintMessage("Setting " + key + " to " + str(val) + '\n')
+		self.store.set(key, val, self.getParamType(key))
+		log.debug("Setting %s to %s", key, val)
 
 	def readMisc(self, key):
-		grp = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/CuraEngine")
-		pt = self.getParamType(key)
-		if pt is "string":
-			return grp.GetString(key, self.MiscDict[key])
-		elif pt is "float":
-			return grp.GetFloat(key, self.MiscDict[key])
+		return self.store.get(key, self.MiscDict[key])
 
 	def writeMisc(self, key, val):
-		grp = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/CuraEngine")
-		pt = self.getParamType(key)
-		if pt is "string":
-			grp.SetString(key, val)
-		elif pt is "float":
-			grp.SetFloat(key, val)
-		Console.PrintMessage("Setting " + key + " to " + str(val) + '\n')
+		self.store.set(key, val, self.getParamType(key))
+		log.debug("Setting %s to %s", key, val)
+
+	def flush(self):
+		'''Write all changed settings to the parameter group'''
+		self.store.flush()
 
 	def copySettings(self):
 		tmpDic = {}
@@ -153,11 +363,24 @@ class SliceDef:
 		return tmpDic
 
 	def writeSettingsFile(self, filename):
-		grp = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/CuraEngine")
+		self.store.flush()
+		grp = FreeCAD.ParamGet(cePath)
 		grp.Export(filename)
 
 
 	def importSettingsFile(self, filename):
-		grp = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/CuraEngine")
+		self.store.flush()
+		grp = FreeCAD.ParamGet(cePath)
 		grp.Import(filename)
+		self.store.load()
+
+	def applyProfile(self, filename):
+		'''Take the values from a settings file without importing it into the parameter group
+
+		Only lasts as long as the store, use it with a MemoryStore.'''
+		for key, (val, pt) in readProfile(filename).items():
+			self.store.set(key, val, pt)
+		stored = int(self.store.get("SchemaVersion", 0))
+		if stored != schemaVersion:
+			self.migrate(stored)
 
@@ -0,0 +1,125 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import FreeCAD
+from PySide import QtCore
+from PluginLog import log
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+class SliceWatch:
+	'''Slices a set of objects again after they have changed
+
+	Registered as a FreeCAD document observer. A change to a watched
+	object, or a recompute of its document, restarts a single shot timer,
+	so a burst of edits ends in one check once the document has been quiet
+	for the delay. The check compares currentKey(parts) with the key of the
+	last slice and only calls reslice(parts) when they differ. reslice
+	returns False if it can't start now, the check is then tried again
+	after another delay.'''
+	def __init__(self, delay, currentKey, reslice):
+		self.currentKey = currentKey
+		self.reslice = reslice
+		# (doc name, obj name) of the watched objects, in slicing order
+		self.objects = []
+		self.lastKey = None
+		self.observing = False
+		self.timer = QtCore.QTimer()
+		self.timer.setSingleShot(True)
+		self.setDelay(delay)
+		self.timer.timeout.connect(self.check)
+
+	def setDelay(self, seconds):
+		self.timer.setInterval(int(seconds * 1000))
+
+	def watch(self, partList, key):
+		'''Watch partList, key is what currentKey returned for the last slice of it'''
+		self.objects = [(p.Document.Name, p.Name) for p in partList]
+		self.lastKey = key
+		if not self.observing:
+			FreeCAD.addDocumentObserver(self)
+			self.observing = True
+		log.debug("Watching %d objects", len(self.objects))
+
+	def stop(self):
+		self.timer.stop()
+		if self.observing:
+			FreeCAD.removeDocumentObserver(self)
+			self.observing = False
+		self.objects = []
+
+	def isWatching(self):
+		return bool(self.objects)
+
+	def poke(self):
+		'''Check again once things are quiet, e.g. after a settings edit'''
+		if self.objects:
+			self.timer.start()
+
+	def partList(self):
+		'''The watched objects, None if any of them is gone'''
+		docs = FreeCAD.listDocuments()
+		parts = []
+		for docName, objName in self.objects:
+			doc = docs.get(docName)
+			obj = doc.getObject(objName) if doc else None
+			if obj is None:
+				return None
+			parts.append(obj)
+		return parts
+
+	def check(self):
+		parts = self.partList()
+		if parts is None:
+			log.info("A watched object was deleted, watching stopped")
+			self.stop()
+			return
+		key = self.currentKey(parts)
+		if key == self.lastKey:
+			log.debug("Watched objects unchanged")
+			return
+		if self.reslice(parts) is False:
+			self.timer.start()
+			return
+		self.lastKey = key
+
+	# Document observer callbacks
+	def slotChangedObject(self, obj, prop):
+		if (obj.Document.Name, obj.Name) in self.objects:
+			self.timer.start()
+
+	def slotRecomputedDocument(self, doc):
+		# Catches changes upstream of a watched object as well
+		for docName, objName in self.objects:
+			if docName == doc.Name:
+				self.timer.start()
+				return
+
+	def slotDeletedDocument(self, doc):
+		for docName, objName in self.objects:
+			if docName == doc.Name:
+				log.info("Document %s closed, watching stopped", doc.Label)
+				self.stop()
+				return
@@ -21,38 +21,71 @@
 #*                                                                         *
 #***************************************************************************
 
-import FreeCAD, Mesh
-import os,sys,string
-from FreeCAD import Console
+import FreeCAD, MeshExport, Arrange, MachineDef, GcodePost, SliceEngine, RunReport
+import os,sys,string,hashlib,threading
+from PluginLog import log
 from SliceVars import *
 from PySide.QtGui import QMessageBox
-from subprocess import call
 from math import fabs
+from SliceJob import SliceJob
+from SliceBatch import SliceBatch
+from SliceWatch import SliceWatch
+from SlicePipeline import SlicePipeline, splitIslands
 
 if FreeCAD.GuiUp:
 	import FreeCADGui
-	from FreeCADGui import PySideUic as uic
 	from PySide import QtCore, QtGui
+	import UiLoader
 	gui = True
 
+	class BatchSignals(QtCore.QObject):
+		'''Carries SliceBatch callbacks from the worker threads to the GUI thread'''
+		status = QtCore.Signal(object)
+		done = QtCore.Signal(object)
+
 __title__="CuraEngine Slicer Plugin"
 __author__ = "cblt2l"
 __url__ = "http://www.freecadweb.org"
 
 class SlicerPanel:
 	'''Slicer Settings Panel'''
+	# Milliseconds without an edit before the edits are committed
+	editDelay = 300
+
 	def __init__(self):
 		# Get the user's home directory.
 		self.homeDir = os.path.expanduser("~")
 
-		# Load the qt uic form. It _must_ be in ~/.FreeCAD/Mod/FreeCAD-CuraEngine-Plugin, Perhaps there is a better way...
-		self.form = uic.loadUi(self.homeDir + "/.FreeCAD/Mod/FreeCAD-CuraEngine-Plugin/Slicer.ui")
+		# Load the qt form from next to the plugin modules, precompiled when possible
+		self.form = UiLoader.loadForm("Slicer")
 
 		# Set the Default Values
 		self.Vars = SliceDef()
+		self.pipeline = SlicePipeline(self.Vars)
+		# Widget edits waiting to be committed, handler -> latest args
+		self.pendingEdits = {}
+		self.lineDistanceDirty = False
+		self.editTimer = QtCore.QTimer()
+		self.editTimer.setSingleShot(True)
+		self.editTimer.setInterval(self.editDelay)
+		self.editTimer.timeout.connect(self.commitEdits)
+		# The background CuraEngine job or batch, if one has been started
+		self.job = None
+		self.batch = None
+		# The thread that post-processes and analyzes the G-code of a single slice
+		self.postThread = None
+		# Objects of every plate after an arrange that needed more than one plate
+		self.plates = []
+		# Objects of the last slice, and the watch that slices them again when they change
+		self.slicedParts = []
+		self.watch = SliceWatch(self.Vars.readMisc("WatchDelay"), self.watchKey, self.watchReslice)
 		
 		# Tab 1
+		self.form.combo_1_ENGINE.addItems(SliceEngine.engineNames)
+		if self.Vars.readMisc("SliceEngine") in SliceEngine.engineNames:
+			self.form.combo_1_ENGINE.setCurrentIndex(SliceEngine.engineNames.index(self.Vars.readMisc("SliceEngine")))
 		self.form.input_1_curapath.setText(self.Vars.readMisc("CuraPath"))
+		self.form.input_1_curapath.setEnabled(self.Vars.readMisc("SliceEngine") == "CuraEngine")
 		self.initMisc(self.form.input_1_NOZDIA, "NozzleDiameter", self._nozzleDiameter)
 
 		self.initSetting(self.form.input_2_FILDIA, "filamentDiameter", self._filamentDiameter)
@@ -80,6 +113,26 @@ class SlicerPanel:
 		self.initSetting(self.form.input_4_FLFR, "initialLayerSpeed", self._initialLayerSpeed)
 		self.initSetting(self.form.input_5_MLT, "minimalLayerTime", self._minimalLayerTime)
 
+		self.initMisc(self.form.input_1_BW, "BatchWorkers", self._BatchWorkers)
+		self.initMisc(self.form.input_2_BR, "BatchRetries", self._BatchRetries)
+		if self.Vars.readMisc("SPLITMODE"):
+			self.form.checkbox_1_SPLIT.setChecked(True)
+		if self.Vars.readMisc("REPLICATEMODE"):
+			self.form.checkbox_2_REPLICATE.setChecked(True)
+		if not self.Vars.readMisc("CACHEMODE"):
+			self.form.Group_7_Cache.setChecked(False)
+		self.form.input_1_CP.setText(self.Vars.readMisc("CachePath"))
+		self.initMisc(self.form.input_2_CS, "CacheSize", self._CacheSize)
+		self.updateCacheStats()
+		if self.Vars.readMisc("AUTODEVIATION"):
+			self.form.checkbox_1_AUTODEV.setChecked(True)
+		self.initMisc(self.form.input_1_LDEV, "LinearDeviation", self._LinearDeviation)
+		self.initMisc(self.form.input_2_ADEV, "AngularDeviation", self._AngularDeviation)
+		self.form.input_1_LDEV.setEnabled(not self.Vars.readMisc("AUTODEVIATION"))
+		if not self.Vars.readMisc("WATCHMODE"):
+			self.form.Group_9_Watch.setChecked(False)
+		self.initMisc(self.form.input_1_WD, "WatchDelay", self._WatchDelay)
+
 		self.initMisc(self.form.input_1_NT, "NozzleTemp", self._NozzleTemp)
 		self.initMisc(self.form.input_2_BT, "BedTemp", self._BedTemp)
 
@@ -139,8 +192,19 @@ class SlicerPanel:
 		# Tab 1
 		self.form.button_1_filediag.clicked.connect(self.chooseOutputDir)
 		self.form.input_1_curapath.textChanged.connect(self.curaPathChange)
+		self.form.combo_1_ENGINE.currentIndexChanged.connect(self._sliceEngine)
 		self.form.button_1_ES.clicked.connect(self.exportSettingsFile)
 		self.form.button_2_IS.clicked.connect(self.importSettingsFile)
+		self.form.checkbox_1_SPLIT.clicked.connect(self._splitMode)
+		self.form.checkbox_2_REPLICATE.clicked.connect(self._replicateMode)
+		self.form.button_1_BATCH.clicked.connect(self.sliceBatch)
+		self.form.button_2_ARRANGE.clicked.connect(self.arrangeParts)
+		self.form.Group_7_Cache.clicked.connect(self._cacheMode)
+		self.form.input_1_CP.textChanged.connect(self.cachePathChange)
+		self.form.button_1_CCLEAR.clicked.connect(self.clearCache)
+		self.form.checkbox_1_AUTODEV.clicked.connect(self._autoDeviation)
+		self.form.button_1_DEVOVR.clicked.connect(self.addDeviationOverride)
+		self.form.Group_9_Watch.clicked.connect(self._watchMode)
 		# Tab 2
 		self.form.Group_0_EnableFan.clicked.connect(self._fanMode)
 		self.form.slider_1_MinFS.valueChanged.connect(self.form.input_1_MinFS.setValue)
@@ -157,68 +221,179 @@ class SlicerPanel:
 		self.form.Group_5_OPP.clicked.connect(self._oppMode)
 		# Tab 3
 		self.form.checkbox_1_SPI.clicked.connect(self._spiralize)
-		self.form.textEdit_startcode.textChanged.connect(self._startCode)
-		self.form.textEdit_endcode.textChanged.connect(self._endCode)
+		self.form.textEdit_startcode.textChanged.connect(lambda: self.queueEdit(self._startCode))
+		self.form.textEdit_endcode.textChanged.connect(lambda: self.queueEdit(self._endCode))
+		# Slice job
+		self.form.button_1_cancelslice.clicked.connect(self.cancelSlice)
 		##self.update()
 
+	def isBusy(self):
+		if self.job and self.job.isRunning():
+			return True
+		if self.postThread is not None and self.postThread.is_alive():
+			return True
+		return self.batch is not None and self.batch.isRunning()
+
 	def accept(self):
+		self.commitEdits()
+		self.Vars.flush()
+		if self.isBusy():
+			self.errorBox("A Slice is Already Running\n")
+			return False
 		# Verify the active document
 		actDoc = FreeCAD.ActiveDocument
 		if not actDoc:
 			self.errorBox("No Open Document\n")
 			return False
-		Console.PrintMessage("Accepted" + '\n')
-		docName = actDoc.Label
-		docDir = FreeCAD.ActiveDocument.FileName.replace(docName + ".fcstd", "")
+		log.debug("Accepted")
 		partList = FreeCADGui.Selection.getSelection()
 		# Verify at least one part is selected
 		if not partList:
 			self.errorBox("Select at Least One Part Object")
 			return False
-		stlParts = docDir + docName + ".stl"
-		Mesh.export(partList, stlParts)
-		self.pos = self.GetXYZPos(partList)
-		#Console.PrintMessage(str(self.pos) + '\n')
-		retVal = self.sliceParts(self.Vars.readMisc("CuraPath"), stlParts)
-		if retVal is True:
-			self.errorBox("Slice Failed!\n Check log file\n" + logFile)
+		if len(self.plates) > 1 and set([p.Name for p in partList]) == set([p.Name for p in sum(self.plates, [])]):
+			self.slicePlates(actDoc)
 			return False
+		self.sliceObjects(actDoc, partList)
+		# Keep the panel open while CuraEngine runs and to show the print statistics
+		return False
+
+	def sliceObjects(self, doc, partList):
+		'''Export partList and slice it to G-code next to doc's file'''
+		docName = doc.Label
+		docDir = doc.FileName.replace(docName + ".fcstd", "")
+		self.form.textEdit_log.clear()
+		engine = self.getEngine()
+		# Timing of every stage, written next to the G-code when the slice ends
+		self.run = RunReport.RunReport(docName, engine.name)
+		islands = splitIslands(partList)
+		sets = self.pipeline.copySets(islands, self.Vars.readMisc("REPLICATEMODE"))
+		if (self.Vars.readMisc("SPLITMODE") and len(islands) > 1) or len(sets) < len(islands):
+			self.run.info["objects"] = len(partList)
+			self.sliceSplit(doc, sets, docDir + docName)
 		else:
-			return True
+			# The mesh only lives as long as the slice, keep it out of the document directory
+			stlParts = MeshExport.stlTempFile(docName)
+			with self.run.span("export") as span:
+				self.run.info["triangles"] = int(engine.prepareMesh(partList, stlParts, self.getDeviation()))
+				span.bytes = RunReport.fileSize(stlParts)
+			self.run.info["objects"] = len(partList)
+			self._sliceLog(MeshExport.exportReport())
+			with self.run.span("position"):
+				self.pos = self.GetXYZPos(partList, MeshExport.tessCache.bounds)
+			#Console.PrintMessage(str(self.pos) + '\n')
+			self.sliceParts(engine, stlParts, docDir + docName)
+		self.slicedParts = partList
+		if self.Vars.readMisc("WATCHMODE"):
+			self.watch.watch(partList, self.watchKey(partList))
+
+	def watchKey(self, partList):
+		'''Hash of everything a slice of partList depends on
+
+		The geometry, placement and deviation of every object, then the
+		engine arguments and the post-processing values. The part position
+		arguments are left out, they follow from the geometry.'''
+		h = hashlib.sha1()
+		deviation = self.getDeviation()
+		for obj in partList:
+			h.update(MeshExport.objectKey(obj, deviation).encode("utf-8"))
+		args = self.getEngine().command(argBuilder.build(self.Vars.copySettings(), self.Vars.copyMisc()), "", "")
+		h.update(repr((args, sorted(self.postValues().items()))).encode("utf-8"))
+		return h.hexdigest()
+
+	def watchReslice(self, partList):
+		'''Slice the watched objects again, False while another slice is running'''
+		if self.isBusy():
+			return False
+		self.commitEdits()
+		log.info("Watched objects changed, slicing again")
+		self.sliceObjects(partList[0].Document, partList)
+		return True
 
 	def reject(self):
+		self.commitEdits()
+		self.Vars.flush()
+		self.watch.stop()
+		if self.job and self.job.isRunning():
+			# The form is going away, don't let the job report back to it
+			self.job.progress.disconnect(self._sliceProgress)
+			self.job.logText.disconnect(self._sliceLog)
+			self.job.finished.disconnect(self._sliceFinished)
+			self.job.cancel()
+			self.removeStl(self.stlFile)
+		if self.batch and self.batch.isRunning():
+			self.batchSignals.status.disconnect(self._batchStatus)
+			self.batchSignals.done.disconnect(self.batchDone)
+			# Nothing handles done any more, the batch removes its temp files itself
+			self.batch.cancel(self.pipeline.removeBatchFiles)
+		if self.postThread is not None and self.postThread.is_alive():
+			# It finishes the file on its own
+			self.postSignals.done.disconnect(self._postDone)
 		FreeCADGui.Control.closeDialog()
-		Console.PrintMessage("Rejected" + '\n')
+		log.debug("Rejected")
 		return True
 
 	def getStandardButtons(self):
 		return int(QtGui.QDialogButtonBox.Ok|QtGui.QDialogButtonBox.Cancel)
 
 	def chooseOutputDir(self):
-		print "chooseOutputDir"
-		Console.PrintMessage("Choose" + '\n')
+		log.debug("chooseOutputDir")
 		fileName, _ = QtGui.QFileDialog.getOpenFileName(None, 'Locate CuraEngine', self.Vars.readMisc("CuraPath"))
 		if(fileName):
-			Console.PrintMessage("Filename: " + fileName + '\n')
+			log.debug("Filename: %s", fileName)
 			self.form.input_1_curapath.setText(fileName)
 
 	def curaPathChange(self, _text):
 		self.Vars.writeMisc("CuraPath", _text)
 
+	def getEngine(self):
+		return self.pipeline.getEngine()
+
+	def cachePathChange(self, _text):
+		self.Vars.writeMisc("CachePath", _text)
+
+	def getCache(self):
+		return self.pipeline.getCache()
+
+	def updateCacheStats(self):
+		cache = self.getCache()
+		if cache:
+			self.form.label_3_CSTATS.setText(cache.summary())
+		else:
+			self.form.label_3_CSTATS.setText("")
+
+	def clearCache(self):
+		cache = self.getCache()
+		if cache:
+			cache.clear()
+		self.updateCacheStats()
+
+	def getDeviation(self):
+		return self.pipeline.getDeviation()
+
+	def addDeviationOverride(self):
+		partList = FreeCADGui.Selection.getSelection()
+		if not partList:
+			self.errorBox("Select at Least One Part Object")
+			return
+		for part in partList:
+			MeshExport.addDeviationOverride(part, self.getDeviation()[0])
+
 	def exportSettingsFile(self):
-		sett = self.Vars.readMisc("SettingsPath")
+		self.commitEdits()
 		fileName, _ = QtGui.QFileDialog.getSaveFileName(None, 'Save Settings File', self.Vars.readMisc("SettingsPath"))
 		if(fileName):
 			self.Vars.writeMisc("SettingsPath", fileName)
 			self.Vars.writeSettingsFile(fileName)
-			Console.PrintMessage("SettingsPath=" + self.Vars.readMisc("SettingsPath") + '\n')
+			log.info("Settings exported to %s", fileName)
 
 	def importSettingsFile(self):
+		self.commitEdits()
 		sett= self.Vars.readMisc("SettingsPath")
 		#Console.PrintMessage(sett + '\n')
 		fileName, _ = QtGui.QFileDialog.getOpenFileName(None, 'Select Settings File', sett, "CuraEngine Settings File .ces (*.ces)")
-		Console.PrintMessage(fileName + '\n')
 		if(fileName):
+			log.info("Importing settings from %s", fileName)
 			self.Vars.writeMisc("SettingsPath", fileName)
 			self.Vars.importSettingsFile(fileName)
 			self.errorBox("Import Complete. Please Restart Macro")
@@ -228,117 +403,360 @@ class SlicerPanel:
 		msgBox.setText(dialogText)
 		msgBox.exec_()
 
-	def GetXYZPos(self, partsList):
-		if len(partsList) is 1:
-			bb = partsList[0].Shape.BoundBox
+	def GetXYZPos(self, partsList, bb=None):
+		return self.pipeline.partPosition(partsList, bb)
+
+	def buildCommand(self, engine, _stlParts, gcodeFile):
+		return engine.command(self.getSettings(), _stlParts, gcodeFile)
+
+	def sliceParts(self, engine, _stlParts, _outBase):
+		self.engine = engine
+		self.stlFile = _stlParts
+		self.gcodeFile = _outBase + ".gcode"
+		self.logFile = _outBase + ".log"
+		with self.run.span("settings") as span:
+			_cmdList = self.buildCommand(engine, _stlParts, self.gcodeFile)
+			span.bytes = len("\n".join(_cmdList))
+		if log.isEnabledFor(log.DEBUG):
+			log.debug("%s command:\n%s", engine.name, "\n".join(_cmdList))
+		log.info("Slicing %s to %s", _stlParts, self.gcodeFile)
+		self.form.progress_1_slice.setRange(0, 100)
+		self.form.progress_1_slice.setValue(0)
+		self.form.progress_1_slice.setFormat("%p%")
+		# Reuse the result of an identical earlier slice if there is one
+		self.cacheKey = None
+		cache = self.getCache()
+		self.run.info["cached"] = False
+		if cache:
+			with self.run.span("cache") as span:
+				_args = [a for a in _cmdList[1:] if a not in (_stlParts, self.gcodeFile)]
+				self.cacheKey = cache.makeKey(_stlParts, _args, _cmdList[0])
+				hit = cache.lookup(self.cacheKey, self.gcodeFile, self.logFile)
+			if hit:
+				span.bytes = RunReport.fileSize(self.gcodeFile)
+				self.run.info["cached"] = True
+				self._sliceLog("Using cached result\n" + cache.summary() + '\n')
+				self.removeStl(_stlParts)
+				self.postProcess(self.gcodeFile)
+				return None
+		self.form.button_1_cancelslice.setEnabled(True)
+		self.engineSpan = self.run.span("engine")
+		self.job = SliceJob(_cmdList, self.logFile, engine=engine)
+		self.job.progress.connect(self._sliceProgress)
+		self.job.logText.connect(self._sliceLog)
+		self.job.finished.connect(self._sliceFinished)
+		self.job.start()
+		return self.job
+
+	def cancelSlice(self):
+		if self.job:
+			self.job.cancel()
+		if self.batch:
+			self.batch.cancel()
+
+	def _sliceProgress(self, val, stage):
+		self.form.progress_1_slice.setFormat(stage + " %p%")
+		self.form.progress_1_slice.setValue(val)
+
+	def _sliceLog(self, text):
+		self.form.textEdit_log.moveCursor(QtGui.QTextCursor.End)
+		self.form.textEdit_log.insertPlainText(text)
+		self.form.textEdit_log.ensureCursorVisible()
+
+	def removeStl(self, stlFile):
+		try:
+			os.remove(stlFile)
+		except OSError:
+			pass
+
+	def _sliceFinished(self, retVal):
+		self.engineSpan.stop(RunReport.fileSize(self.gcodeFile))
+		self.form.button_1_cancelslice.setEnabled(False)
+		self.removeStl(self.stlFile)
+		if self.job.cancelled:
+			self.form.progress_1_slice.setFormat("Cancelled")
+			self.form.progress_1_slice.setValue(0)
+			self.finishRun("cancelled")
+		elif retVal != 0:
+			self.form.progress_1_slice.setFormat("Failed")
+			self.finishRun("failed")
+			self.errorBox("Slice Failed!\n Check log file\n" + self.logFile)
 		else:
-			# Create a temporary fusion of the selected parts and get
-			# the bounding box to determine the center coordinates
-			f = FreeCAD.activeDocument().addObject("Part::MultiFuse","Fusion")
-			f.Shapes = partsList
-			# Must recompute first to get correct boundbox
-			FreeCAD.ActiveDocument.recompute()
-			bb = f.Shape.BoundBox
-			# Delete the temp fusion
-			FreeCAD.ActiveDocument.removeObject(f.Name)
-		c = bb.Center
-		# We want the Minimum Z height. Anything below 0 is translated to "objectSink" setting
-		c.z = bb.ZMin
-		#Unhide all of the selected parts that were hidden when making the fusion
-		for p in partsList:
-			p.ViewObject.Visibility=True
-		return c
-
-	def sliceParts(self, _curaBin, _stlParts):
-		gcodeFile = _stlParts.replace(".stl", ".gcode")
-		logFile = _stlParts.replace(".stl", ".log")
-		_cmdList = self.getSettings()
-		_cmdList.insert(0, _curaBin)
-		_cmdList.insert(1, "-v")
-		_cmdList.append("-o")
-		_cmdList.append(gcodeFile)
-		_cmdList.append(_stlParts)
-		f = open(logFile, 'w')
-		f.write("#############CURA PLUGIN SETTINGS#############\n")
-		for index in _cmdList:
-			f.write(index + '\n')
-			Console.PrintMessage(index + '\n')
-		f.write("###############END CURA SETTINGS##############\n")
-		retVal = call(_cmdList, stderr=f)
-		f.close()
-		return retVal
+			try:
+				self.engine.collectOutputs(self.gcodeFile)
+			except SliceEngine.EngineError as e:
+				self.form.progress_1_slice.setFormat("Failed")
+				self.finishRun("failed")
+				self.errorBox("Slice Failed!\n" + str(e))
+				return
+			cache = self.getCache()
+			# The cache keeps the raw engine output, post-processing runs on every use
+			if cache and self.cacheKey:
+				cache.store(self.cacheKey, self.gcodeFile, self.logFile)
+			self.postProcess(self.gcodeFile)
+
+	def postValues(self):
+		return self.pipeline.postValues()
+
+	def postStages(self):
+		return self.pipeline.postStages()
+
+	def postProcess(self, gcodeFile):
+		'''Post-process gcodeFile in place and analyze it, in a background thread
+
+		Each pass over a big file takes seconds, the panel stays usable
+		meanwhile. _postDone gets the result in the GUI thread.'''
+		self.form.progress_1_slice.setFormat("Post-processing")
+		values = self.postValues()
+		stages = self.postStages()
+		args = self.analyzerArgs()
+		logFile = self.logFile
+		run = self.run
+		signals = BatchSignals()
+		signals.done.connect(self._postDone)
+		def work():
+			# (error, post-processing context, analyzer stats)
+			try:
+				with run.span("post") as span:
+					context = GcodePost.process(gcodeFile, values, stages)
+					span.bytes = RunReport.fileSize(gcodeFile)
+			except Exception as e:
+				signals.done.emit((e, None, None))
+				return
+			with run.span("analyze") as span:
+				stats = self.analyzeGcode(gcodeFile, logFile, args)
+				span.bytes = RunReport.fileSize(gcodeFile)
+			signals.done.emit((None, context, stats))
+		self.postSignals = signals
+		self.postThread = threading.Thread(target=work)
+		self.postThread.daemon = True
+		self.postThread.start()
+
+	def _postDone(self, result):
+		error, context, stats = result
+		log.flushQueued()
+		if error is not None:
+			self.form.progress_1_slice.setFormat("Failed")
+			self.finishRun("failed")
+			self.errorBox("Post-processing Failed!\n" + str(error))
+			return
+		log.info("Post-processed %s: %d layers, %.1f mm of filament", self.gcodeFile,
+				context["stats"]["layers"], context["stats"]["filament"])
+		self._sliceSucceeded(stats)
+
+	def _sliceSucceeded(self, stats):
+		self.form.progress_1_slice.setFormat("Done")
+		self.form.progress_1_slice.setValue(100)
+		if stats:
+			self._sliceLog(stats.summary())
+			self.run.info.update({"printTime": float(stats.time), "filament": float(stats.filament), "layers": int(stats.layers)})
+		self.finishRun("done")
+		self._sliceLog(self.run.summary())
+
+	def finishRun(self, result):
+		'''Write the run report of the current slice'''
+		self.run.finish(result, self.gcodeFile, self.Vars.readMisc("RunHistory"), self.Vars.readMisc("RunHistorySize"))
+
+	def analyzerArgs(self):
+		return self.pipeline.analyzerArgs()
+
+	def analyzeGcode(self, gcodeFile, logFile, args=None):
+		return self.pipeline.analyzeGcode(gcodeFile, logFile, args)
+
+	def batchPost(self):
+		return self.pipeline.batchPost()
+
+	def sliceBatch(self):
+		'''Slice every selected part on its own, several CuraEngine processes at a time'''
+		self.commitEdits()
+		if self.isBusy():
+			self.errorBox("A Slice is Already Running\n")
+			return
+		actDoc = FreeCAD.ActiveDocument
+		if not actDoc:
+			self.errorBox("No Open Document\n")
+			return
+		partList = FreeCADGui.Selection.getSelection()
+		if not partList:
+			self.errorBox("Select at Least One Part Object")
+			return
+		self.form.textEdit_log.clear()
+		jobs = []
+		for part in partList:
+			jobs.append(self.makeBatchJob(actDoc, [part], part.Label))
+		self.runBatch(jobs)
+
+	def arrangeParts(self):
+		'''Pack the selection onto the bed, overflowing onto extra plates'''
+		self.commitEdits()
+		actDoc = FreeCAD.ActiveDocument
+		if not actDoc:
+			self.errorBox("No Open Document\n")
+			return
+		partList = FreeCADGui.Selection.getSelection()
+		if not partList:
+			self.errorBox("Select at Least One Part Object")
+			return
+		spacing = max(self.Vars.readSetting("skirtDistance"), 1.0)
+		actDoc.openTransaction("Arrange parts")
+		self.plates, unplaced = Arrange.arrange(partList, MachineDef.readSetting("bedx"), MachineDef.readSetting("bedy"),
+											MachineDef.readSetting("offsetx"), MachineDef.readSetting("offsety"), spacing)
+		actDoc.commitTransaction()
+		self._sliceLog("Arranged %d parts on %d plates\n" % (sum([len(plate) for plate in self.plates]), len(self.plates)))
+		if unplaced:
+			self.errorBox("Too Big For The Bed:\n" + "\n".join([p.Label for p in unplaced]))
+
+	def slicePlates(self, doc):
+		'''Slice every arranged plate as its own batch job'''
+		self.form.textEdit_log.clear()
+		pitch = Arrange.platePitch(MachineDef.readSetting("bedy"))
+		jobs = []
+		for index, plate in enumerate(self.plates):
+			shift = FreeCAD.Vector(0, index * pitch, 0)
+			jobs.append(self.makeBatchJob(doc, plate, "plate" + str(index + 1), shift=shift))
+		self.runBatch(jobs)
+
+	def makeBatchJob(self, doc, partList, name, settings=None, shift=None):
+		job = self.pipeline.makeBatchJob(doc, partList, name, settings, shift)
+		self._sliceLog(MeshExport.exportReport())
+		return job
+
+	def runBatch(self, jobs, done=None):
+		'''Run a list of BatchJobs in the background and report to the log view
+
+		done(batch) is called in the GUI thread when the batch is finished,
+		_batchDone by default.'''
+		self.form.progress_1_slice.setFormat("%v/%m jobs")
+		self.form.progress_1_slice.setRange(0, len(jobs))
+		self.form.progress_1_slice.setValue(0)
+		self.form.button_1_cancelslice.setEnabled(True)
+		self.batchSignals = BatchSignals()
+		self.batchSignals.status.connect(self._batchStatus)
+		# What the workers logged goes to the report view before the results
+		self.batchSignals.done.connect(lambda batch: log.flushQueued())
+		self.batchDone = done or self._batchDone
+		self.batchSignals.done.connect(self.batchDone)
+		self.batch = SliceBatch(jobs, self.Vars.readMisc("BatchWorkers"), self.Vars.readMisc("BatchRetries"),
+								self.batchSignals.status.emit, self.batchPost())
+		self.batch.start(self.batchSignals.done.emit)
+		return self.batch
+
+	def _batchStatus(self, job):
+		log.flushQueued()
+		self._sliceLog(job.name + ": " + job.status + " (attempt " + str(job.attempts) + ")\n")
+		finished = 0
+		for j in self.batch.jobs:
+			if j.status in ["done", "failed", "cancelled"]:
+				finished += 1
+		self.form.progress_1_slice.setValue(finished)
+
+	def _batchDone(self, batch):
+		self.form.button_1_cancelslice.setEnabled(False)
+		for job in batch.jobs:
+			self.removeStl(job.stlFile)
+		for job in batch.jobs:
+			if job.stats:
+				self._sliceLog(job.name + ":\n" + job.stats.summary())
+		report = batch.report()
+		self._sliceLog(report)
+		log.info("%s", report.rstrip())
+		if not batch.succeeded() and not batch.cancelled:
+			self.errorBox("Some Slices Failed!\n Check the log files\n")
+
+	def sliceSplit(self, doc, sets, _outBase):
+		'''Slice one island of every copy set in an engine process of its own, all at once
+
+		_splitDone merges their G-code into one print when they are done.'''
+		self.gcodeFile = _outBase + ".gcode"
+		self.logFile = _outBase + ".log"
+		with self.run.span("export") as span:
+			jobs = self.pipeline.makeSplitJobs(doc, sets, doc.Label)
+			span.bytes = sum([RunReport.fileSize(job.stlFile) for job in jobs])
+		self._sliceLog(MeshExport.exportReport())
+		self.run.info["islands"] = len(jobs)
+		self.run.info["copies"] = sum([len(job.copies) for job in jobs])
+		log.info("Slicing %d islands for %d copies to %s", len(jobs), self.run.info["copies"], self.gcodeFile)
+		self.engineSpan = self.run.span("engine")
+		self.runBatch(jobs, self._splitDone)
+
+	def _splitDone(self, batch):
+		self.engineSpan.stop(sum([RunReport.fileSize(job.gcodeFile) for job in batch.jobs]))
+		self.form.button_1_cancelslice.setEnabled(False)
+		for job in batch.jobs:
+			self.removeStl(job.stlFile)
+		self.form.progress_1_slice.setRange(0, 100)
+		self.pipeline.writeSplitLog(batch.jobs, self.logFile)
+		try:
+			if batch.cancelled:
+				self.form.progress_1_slice.setFormat("Cancelled")
+				self.form.progress_1_slice.setValue(0)
+				self.finishRun("cancelled")
+				return
+			if not batch.succeeded():
+				self.form.progress_1_slice.setFormat("Failed")
+				self.finishRun("failed")
+				self.errorBox("Slice Failed!\n Check log file\n" + self.logFile)
+				return
+			try:
+				with self.run.span("merge") as span:
+					layers = self.pipeline.mergeSplit(batch.jobs, self.gcodeFile)
+					span.bytes = RunReport.fileSize(self.gcodeFile)
+			except Exception as e:
+				self.form.progress_1_slice.setFormat("Failed")
+				self.finishRun("failed")
+				self.errorBox("Merging the G-code Failed!\n" + str(e))
+				return
+		finally:
+			self.pipeline.removeSplit(batch.jobs)
+		self._sliceLog("Merged %d islands into %d layers\n" % (sum([len(job.copies) for job in batch.jobs]), layers))
+		self.postProcess(self.gcodeFile)
 
 	def initSetting(self, widget, key, handel):
 		val = self.Vars.readSetting(key)
 		widget.setValue(val)
-		widget.valueChanged.connect(handel)
+		widget.valueChanged.connect(lambda v: self.queueEdit(handel, v))
 
 	def initMisc(self, widget, key, handel):
 		val = self.Vars.readMisc(key)
 		widget.setValue(val)
-		widget.valueChanged.connect(handel)
+		widget.valueChanged.connect(lambda v: self.queueEdit(handel, v))
+
+	def queueEdit(self, handel, *args):
+		'''Hold a widget edit back until the widgets have been quiet for editDelay'''
+		self.pendingEdits[handel] = args
+		self.editTimer.start()
+
+	def commitEdits(self):
+		'''Apply the latest value of every queued edit, then the derived settings'''
+		self.editTimer.stop()
+		edits = self.pendingEdits
+		self.pendingEdits = {}
+		for handel, args in edits.items():
+			handel(*args)
+		if self.lineDistanceDirty:
+			self._updateLineDistances()
+		if edits:
+			self.watch.poke()
 
 	def getSettings(self):
-		_cmdList = []
-		_tmpDic = self.Vars.copySettings()
-
-		# Certain parameters need to be scaled up X1000 when passed to CuraEngine
-		scaleDic = dict.fromkeys(["filamentDiameter", "posx", "posy", "initialLayerThickness", "layerThickness", "extrusionWidth", "skirtDistance", "sparseInfillLineDistance",
-								"supportXYDistance", "supportZDistance", "retractionAmount", "retractionAmountExtruderSwitch", "retractionMinimalDistance", 
-								"minimalExtrusionBeforeRetraction", "raftMargin", "raftLineSpacing"], 1000)
-
-		# Certain parameters are disabled in GUI and need to be set to zero
-		if not self.Vars.readMisc("FANMODE"):
-			_tmpDic.update(dict.fromkeys(["fanSpeedMin", "fanSpeedMax", "fanFullOnLayerNr"], 0))
-		if not self.Vars.readMisc("RETRACTMODE"):
-			_tmpDic.update(dict.fromkeys(["retractionAmount", "retractionSpeed", "retractionAmountExtruderSwitch", "retractionMinimalDistance",
-										"minimalExtrusionBeforeRetraction", "enableCombing"], 0))
-		if not self.Vars.readMisc("SKIRTMODE"):
-			_tmpDic.update(dict.fromkeys(["skirtDistance", "skirtLineCount", "skirtMinLength"], 0))
-		if not self.Vars.readMisc("SUPPORTMODE"):
-			_tmpDic.update(dict.fromkeys(["supportEverywhere", "supportLineDistance", "supportXYDistance", "supportZDistance"], 0))
-		if not self.Vars.readMisc("RAFTMODE"):
-			_tmpDic.update(dict.fromkeys(["raftMargin", "raftLineSpacing", "raftBaseThickness", "raftBaseLinewidth",
-										 "raftInterfaceThickness", "raftInterfaceLinewidth"], 0))
-
-		# Add the Nozzle & Bed temps to the startcode. Idealy this should be done at postprocessing stage
-		startcode = _tmpDic["startCode"]
-		startcode = startcode.replace("{nozzleTemp}", str(self.Vars.readMisc("NozzleTemp")))
-		startcode = startcode.replace("{bedTemp}", str(self.Vars.readMisc("BedTemp")))
-		_tmpDic["startCode"] = startcode
-
-		# Set the part placement
-		if not self.Vars.readMisc("OPPMODE"):
-			_tmpDic["posx"] = self.pos.x
-			_tmpDic["posy"] = self.pos.y
-			_tmpDic["objectSink"] = self.pos.z
-
-		for key, val in _tmpDic.items():
-			mult = scaleDic.get(key)
-			if not mult:
-				mult = 1
-			_cmdList.append("-s")
-			_cmdList.append(key + "="  + str(val * mult))
-		return _cmdList
-
-	def _setLineDistance(self, param, val):
-		if param is "extrusionWidth":
-			_infillden = self.Vars.readMisc("InfillDensity")
-			_supportden = self.Vars.readMisc("SupportDensity")
-			self.Vars.writeSetting("extrusionWidth", val)
-			self.Vars.writeSetting("sparseInfillLineDistance", val * 100 / _infillden)
-			self.Vars.writeSetting("supportLineDistance", val * 100 / _supportden)
-		elif param is "sparseInfillLineDistance":
-			_extwidth = self.Vars.readSetting("extrusionWidth")
-			self.Vars.writeSetting("sparseInfillLineDistance", _extwidth * 100 / val)
-		elif param is "supportLineDistance":
-			_extwidth = self.Vars.readSetting("extrusionWidth")
-			self.Vars.writeSetting("supportLineDistance", _extwidth * 100 / val)
+		return self.pipeline.settingsArgs(self.pos)
+
+	def _updateLineDistances(self):
+		'''Derive the infill and support line distances from the extrusion width and densities'''
+		self.lineDistanceDirty = False
+		_extwidth = self.Vars.readSetting("extrusionWidth")
+		for key, misc in [("sparseInfillLineDistance", "InfillDensity"), ("supportLineDistance", "SupportDensity")]:
+			_den = self.Vars.readMisc(misc)
+			if _den == 0:
+				self.Vars.writeSetting(key, -1)
+			else:
+				self.Vars.writeSetting(key, _extwidth * 100 / _den)
 
 	# Print setting slots
 	def _nozzleDiameter(self, val):
 		self.Vars.writeMisc("NozzleDiameter", val)
-		self._setLineDistance("extrusionWidth", val)
+		self.Vars.writeSetting("extrusionWidth", val)
+		self.lineDistanceDirty = True
 	def _filamentDiameter(self, val):
 		self.Vars.writeSetting("filamentDiameter", val)
 	def _initialLayerThickness(self, val):
@@ -353,12 +771,7 @@ class SlicerPanel:
 		self.Vars.writeSetting("upSkinCount", val)
 	def _InfillDensity(self, val):
 		self.Vars.writeMisc("InfillDensity", val)
-		if val == 0:
-			self.Vars.writeSetting("sparseInfillLineDistance", -1)
-		#elif val == 100:
-		#	self.Vars.writeSetting("sparseInfillLineDistance", 100)
-		else:
-			self._setLineDistance("sparseInfillLineDistance", val)
+		self.lineDistanceDirty = True
 	def _filamentFlow(self, val):
 		self.Vars.writeSetting("filamentFlow", val)
 	# Feedrate slots
@@ -380,6 +793,61 @@ class SlicerPanel:
 		self.Vars.writeMisc("NozzleTemp", val)
 	def _BedTemp(self, val):
 		self.Vars.writeMisc("BedTemp", val)
+	# Batch, split and replicate slots
+	def _BatchWorkers(self, val):
+		self.Vars.writeMisc("BatchWorkers", val)
+	def _BatchRetries(self, val):
+		self.Vars.writeMisc("BatchRetries", val)
+	def _splitMode(self):
+		state = self.form.checkbox_1_SPLIT.isChecked()
+		if state:
+			self.Vars.writeMisc("SPLITMODE", True)
+		else:
+			self.Vars.writeMisc("SPLITMODE", False)
+	def _replicateMode(self):
+		state = self.form.checkbox_2_REPLICATE.isChecked()
+		if state:
+			self.Vars.writeMisc("REPLICATEMODE", True)
+		else:
+			self.Vars.writeMisc("REPLICATEMODE", False)
+	# Cache slots
+	def _CacheSize(self, val):
+		self.Vars.writeMisc("CacheSize", val)
+	def _cacheMode(self):
+		state = self.form.Group_7_Cache.isChecked()
+		if state:
+			self.Vars.writeMisc("CACHEMODE", True)
+		else:
+			self.Vars.writeMisc("CACHEMODE", False)
+		self.updateCacheStats()
+	# Mesh export slots
+	def _autoDeviation(self):
+		state = self.form.checkbox_1_AUTODEV.isChecked()
+		if state:
+			self.Vars.writeMisc("AUTODEVIATION", True)
+		else:
+			self.Vars.writeMisc("AUTODEVIATION", False)
+		self.form.input_1_LDEV.setEnabled(not state)
+	def _LinearDeviation(self, val):
+		self.Vars.writeMisc("LinearDeviation", val)
+	def _AngularDeviation(self, val):
+		self.Vars.writeMisc("AngularDeviation", val)
+	# Engine and watch slots
+	def _sliceEngine(self, index):
+		self.Vars.writeMisc("SliceEngine", SliceEngine.engineNames[index])
+		self.form.input_1_curapath.setEnabled(SliceEngine.engineNames[index] == "CuraEngine")
+	def _watchMode(self):
+		state = self.form.Group_9_Watch.isChecked()
+		if state:
+			self.Vars.writeMisc("WATCHMODE", True)
+			if self.slicedParts:
+				self.watch.watch(self.slicedParts, self.watchKey(self.slicedParts))
+		else:
+			self.Vars.writeMisc("WATCHMODE", False)
+			self.watch.stop()
+	def _WatchDelay(self, val):
+		self.Vars.writeMisc("WatchDelay", val)
+		self.watch.setDelay(val)
 	# Fan slots
 	def _fanMode(self):
 		# https://bugreports.qt-project.org/browse/PYSIDE-104
@@ -445,10 +913,7 @@ class SlicerPanel:
 		self.Vars.writeSetting("supportEverywhere", 1)
 	def _SupportDensity(self, val):
 		self.Vars.writeMisc("SupportDensity", val)
-		if val == 0:
-			self.Vars.writeSetting("supportLineDistance", -1)
-		else:
-			self._setLineDistance("supportLineDistance", val)
+		self.lineDistanceDirty = True
 	#def _supportExtruder(self, val):
 	#	self.Vars.writeSetting("supportExtruder", val)
 	def _supportXYDistance(self, val):
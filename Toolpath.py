@@ -0,0 +1,362 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import FreeCAD, LayerIndex
+import os
+import numpy
+from PluginLog import log
+from pivy import coin
+
+if FreeCAD.GuiUp:
+	import FreeCADGui
+	from PySide import QtGui
+	import UiLoader
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+# File name -> (modification time, ToolpathData) of the files being previewed
+loaded = {}
+
+class ToolpathData:
+	'''The moves of a G-code file by layer
+
+	Layers are read from the file through its layer index when they are
+	asked for, the moves before the first layer (homing, priming) are left
+	out.'''
+	def __init__(self, fileName):
+		self.fileName = fileName
+		self.index = LayerIndex.getIndex(fileName)
+		self.layerCount = self.index.count
+
+	def moves(self, first, last):
+		'''Start points, end points and extruding flags of layers first to last'''
+		start, end, extruding, layer = self.index.segments(first, last)
+		return (start, end, extruding)
+
+def getData(fileName):
+	'''The ToolpathData of fileName, read again only if the file changed'''
+	mtime = os.path.getmtime(fileName)
+	if fileName not in loaded or loaded[fileName][0] != mtime:
+		loaded[fileName] = (mtime, ToolpathData(fileName))
+	return loaded[fileName][1]
+
+def polylines(start, end, step=1):
+	'''Vertex and SoIndexedLineSet coordIndex arrays of the runs of connected moves
+
+	A run starts wherever a move doesn't start where the previous one ended.
+	step > 1 keeps only every step-th vertex of a run, and its last one.'''
+	n = len(start)
+	if not n:
+		return (numpy.zeros((0, 3), numpy.float32), numpy.zeros(0, numpy.int32))
+	newRun = numpy.ones(n, dtype=bool)
+	newRun[1:] = (start[1:] != end[:-1]).any(axis=1)
+	runOfMove = numpy.cumsum(newRun) - 1
+	runs = int(runOfMove[-1]) + 1
+	# Every run is the start point of its first move and then the end points of all its moves
+	runFirst = numpy.flatnonzero(newRun) + numpy.arange(runs)
+	endAt = numpy.arange(n) + runOfMove + 1
+	verts = numpy.empty((n + runs, 3), numpy.float32)
+	verts[runFirst] = start[newRun]
+	verts[endAt] = end
+	runOfVert = numpy.empty(n + runs, numpy.int64)
+	runOfVert[runFirst] = numpy.arange(runs)
+	runOfVert[endAt] = runOfMove
+	if step > 1:
+		indexInRun = numpy.arange(n + runs) - runFirst[runOfVert]
+		last = numpy.ones(n + runs, dtype=bool)
+		last[:-1] = runOfVert[1:] != runOfVert[:-1]
+		keep = (indexInRun % step == 0) | last
+		verts = verts[keep]
+		runOfVert = runOfVert[keep]
+	# The vertex numbers with a -1 after every run
+	count = len(verts)
+	coordIndex = numpy.empty(count + runs, numpy.int32)
+	coordIndex.fill(-1)
+	coordIndex[numpy.arange(count) + runOfVert] = numpy.arange(count)
+	return (verts, coordIndex)
+
+def setValues(field, values):
+	'''Fill a Coin multiple value field from a numpy array'''
+	try:
+		field.setValues(0, len(values), values)
+	except (TypeError, ValueError):
+		# pivy built without numpy support
+		field.setValues(0, len(values), values.tolist())
+
+def lineSet(verts, coordIndex, color):
+	sep = coin.SoSeparator()
+	col = coin.SoBaseColor()
+	col.rgb.setValue(color[0], color[1], color[2])
+	coords = coin.SoCoordinate3()
+	setValues(coords.point, verts)
+	lines = coin.SoIndexedLineSet()
+	setValues(lines.coordIndex, coordIndex)
+	sep.addChild(col)
+	sep.addChild(coords)
+	sep.addChild(lines)
+	return sep
+
+def bandNode(data, first, last, vp):
+	'''Scene graph of layers first to last
+
+	An SoLOD switches to a copy with every Decimation-th vertex when the
+	camera is further than LodDistance from the band.'''
+	start, end, extruding = data.moves(first, last)
+	full = coin.SoSeparator()
+	coarse = coin.SoSeparator()
+	if extruding.any():
+		verts, coordIndex = polylines(start[extruding], end[extruding])
+		full.addChild(lineSet(verts, coordIndex, vp.Color))
+		verts, coordIndex = polylines(start[extruding], end[extruding], max(vp.Decimation, 1))
+		coarse.addChild(lineSet(verts, coordIndex, vp.Color))
+	if vp.ShowTravel and not extruding.all():
+		verts, coordIndex = polylines(start[~extruding], end[~extruding])
+		full.addChild(lineSet(verts, coordIndex, vp.TravelColor))
+	lod = coin.SoLOD()
+	if len(end):
+		center = (end.min(axis=0) + end.max(axis=0)) / 2.0
+		lod.center.setValue(float(center[0]), float(center[1]), float(center[2]))
+	lod.range.setValue(vp.LodDistance)
+	lod.addChild(full)
+	lod.addChild(coarse)
+	return lod
+
+def makeToolpath(fileName):
+	'''Add a preview of the G-code file fileName to the active document'''
+	doc = FreeCAD.ActiveDocument
+	obj = doc.addObject("App::FeaturePython", "Toolpath")
+	Toolpath(obj, fileName)
+	if FreeCAD.GuiUp:
+		ViewProviderToolpath(obj.ViewObject)
+	doc.recompute()
+	return obj
+
+class Toolpath:
+	'The Toolpath Object'
+	def __init__(self, obj, fileName):
+		obj.addProperty("App::PropertyFile", "File", "Toolpath", "The G-code file").File = fileName
+		obj.addProperty("App::PropertyInteger", "Layers", "Toolpath", "Number of layers in the file")
+		obj.addProperty("App::PropertyInteger", "LayerFrom", "Toolpath", "First layer shown")
+		obj.addProperty("App::PropertyInteger", "LayerTo", "Toolpath", "Last layer shown")
+		obj.setEditorMode("Layers", 1)
+		obj.Proxy = self
+		self.Type = "Toolpath"
+
+	def onChanged(self, fp, prop):
+		log.debug("Change property: %s", prop)
+
+	def execute(self, fp):
+		log.debug("Recompute Toolpath feature")
+		try:
+			layers = getData(fp.File).layerCount
+		except (OSError, IOError) as e:
+			log.warn("Can't read %s: %s", fp.File, e)
+			layers = 0
+		if layers != fp.Layers:
+			# A new file, show all of it
+			fp.Layers = layers
+			fp.LayerFrom = 0
+			fp.LayerTo = max(layers - 1, 0)
+
+	def __getstate__(self):
+		return self.Type
+
+	def __setstate__(self, state):
+		if state:
+			self.Type = state
+
+class ViewProviderToolpath:
+	'''The Toolpath View Provider Object
+
+	The layers are split into bands of BandSize layers, each behind an
+	SoSwitch. A band is only read from the file and built the first time it
+	is in the shown layer range. Bands that are only partly in the range get a one-off
+	node of their shown layers, so the range can be set to any layer.'''
+	def __init__(self, obj):
+		obj.addProperty("App::PropertyColor", "Color", "Toolpath", "Color of the extrusion moves").Color = (1.0, 0.5, 0.0)
+		obj.addProperty("App::PropertyColor", "TravelColor", "Toolpath", "Color of the travel moves").TravelColor = (0.2, 0.4, 1.0)
+		obj.addProperty("App::PropertyBool", "ShowTravel", "Toolpath", "Show the travel moves").ShowTravel = False
+		obj.addProperty("App::PropertyInteger", "BandSize", "Toolpath", "Layers per scene graph node").BandSize = 10
+		obj.addProperty("App::PropertyInteger", "Decimation", "Toolpath", "Keep every n-th vertex of distant layers").Decimation = 8
+		obj.addProperty("App::PropertyFloat", "LodDistance", "Toolpath", "Camera distance beyond which layers are decimated").LodDistance = 500.0
+		obj.Proxy = self
+
+	def attach(self, obj):
+		"'''Setup the scene sub-graph of the view provider, this method is mandatory'''"
+		self.vp = obj
+		self.lines = coin.SoGroup()
+		self.bands = coin.SoGroup()
+		self.edges = coin.SoGroup()
+		style = coin.SoDrawStyle()
+		style.lineWidth = 1
+		self.lines.addChild(style)
+		self.lines.addChild(self.bands)
+		self.lines.addChild(self.edges)
+		obj.addDisplayMode(self.lines, "Lines")
+		self.data = None
+
+	def reset(self):
+		'''Drop the built bands, they are built again as they are shown'''
+		self.bands.removeAllChildren()
+		self.edges.removeAllChildren()
+		self.data = None
+
+	def showLayers(self, fp):
+		if self.data is None:
+			try:
+				self.data = getData(fp.File)
+			except (OSError, IOError):
+				return
+			size = max(self.vp.BandSize, 1)
+			for lo in range(0, self.data.layerCount, size):
+				self.bands.addChild(coin.SoSwitch())
+		size = max(self.vp.BandSize, 1)
+		first = max(fp.LayerFrom, 0)
+		last = min(fp.LayerTo, self.data.layerCount - 1)
+		self.edges.removeAllChildren()
+		for band in range(self.bands.getNumChildren()):
+			sw = self.bands.getChild(band)
+			lo = band * size
+			hi = min(lo + size, self.data.layerCount) - 1
+			if lo >= first and hi <= last:
+				if not sw.getNumChildren():
+					sw.addChild(bandNode(self.data, lo, hi, self.vp))
+				sw.whichChild = 0
+			else:
+				sw.whichChild = coin.SO_SWITCH_NONE
+				if hi >= first and lo <= last:
+					self.edges.addChild(bandNode(self.data, max(lo, first), min(hi, last), self.vp))
+
+	def updateData(self, fp, prop):
+		"'''If a property of the handled feature has changed we have the chance to handle this here'''"
+		if prop == "File":
+			self.reset()
+		if prop in ("File", "Layers", "LayerFrom", "LayerTo"):
+			self.showLayers(fp)
+
+	def getDisplayModes(self,obj):
+		"'''Return a list of display modes.'''"
+		return ["Lines"]
+
+	def getDefaultDisplayMode(self):
+		"'''Return the name of the default display mode. It must be defined in getDisplayModes.'''"
+		return "Lines"
+
+	def setDisplayMode(self,mode):
+		return mode
+
+	def onChanged(self, vp, prop):
+		"'''Here we can do something when a single property got changed'''"
+		log.debug("Change property: %s", prop)
+		if prop in ("Color", "TravelColor", "ShowTravel", "BandSize", "Decimation", "LodDistance"):
+			if hasattr(self, "bands") and hasattr(vp.Object, "LayerTo"):
+				self.reset()
+				self.showLayers(vp.Object)
+
+	def doubleClicked(self, vobj):
+		FreeCADGui.ActiveDocument.setEdit(vobj.Object.Name)
+		return True
+
+	def setEdit(self, vobj, mode=0):
+		FreeCADGui.Control.showDialog(ToolpathPanel(vobj.Object))
+		return True
+
+	def unsetEdit(self, vobj, mode=0):
+		FreeCADGui.Control.closeDialog()
+		return True
+
+	def getIcon(self):
+		return ":/icons/PartDesign_Revolution.svg"
+
+	def __getstate__(self):
+		return None
+
+	def __setstate__(self,state):
+		return None
+
+class ToolpathPanel:
+	'''Layer range sliders of a Toolpath object'''
+	def __init__(self, obj):
+		self.obj = obj
+		self.form = UiLoader.loadForm("Toolpath")
+		top = max(obj.Layers - 1, 0)
+		self.form.slider_1_from.setRange(0, top)
+		self.form.slider_2_to.setRange(0, top)
+		self.form.slider_1_from.setValue(obj.LayerFrom)
+		self.form.slider_2_to.setValue(obj.LayerTo)
+		self.form.checkbox_1_travel.setChecked(obj.ViewObject.ShowTravel)
+		self._updateLabel()
+
+		self.form.slider_1_from.valueChanged.connect(self._layerFrom)
+		self.form.slider_2_to.valueChanged.connect(self._layerTo)
+		self.form.checkbox_1_travel.stateChanged.connect(self._showTravel)
+		self.form.button_1_resume.clicked.connect(self.writeResume)
+		self.form.button_2_extract.clicked.connect(self.extractLayers)
+
+	def accept(self):
+		FreeCADGui.ActiveDocument.resetEdit()
+		return True
+
+	def reject(self):
+		FreeCADGui.ActiveDocument.resetEdit()
+		return True
+
+	def getStandardButtons(self):
+		return int(QtGui.QDialogButtonBox.Close)
+
+	def outputBase(self):
+		return os.path.splitext(self.obj.File)[0]
+
+	def writeResume(self):
+		'''Write a copy of the G-code that starts at the first shown layer'''
+		index = getData(self.obj.File).index
+		fileName = self.outputBase() + "_from%d.gcode" % self.obj.LayerFrom
+		index.writeResume(self.obj.LayerFrom, fileName)
+		log.info("Wrote %s", fileName)
+
+	def extractLayers(self):
+		'''Write the shown layers to a file of their own'''
+		index = getData(self.obj.File).index
+		fileName = self.outputBase() + "_layers%d-%d.gcode" % (self.obj.LayerFrom, self.obj.LayerTo)
+		index.extractLayers(self.obj.LayerFrom, self.obj.LayerTo, fileName)
+		log.info("Wrote %s", fileName)
+
+	def _updateLabel(self):
+		self.form.label_3_range.setText("Layers %d to %d of %d" % (self.obj.LayerFrom, self.obj.LayerTo, self.obj.Layers))
+
+	def _layerFrom(self, val):
+		if val > self.form.slider_2_to.value():
+			self.form.slider_2_to.setValue(val)
+		self.obj.LayerFrom = val
+		self._updateLabel()
+
+	def _layerTo(self, val):
+		if val < self.form.slider_1_from.value():
+			self.form.slider_1_from.setValue(val)
+		self.obj.LayerTo = val
+		self._updateLabel()
+
+	def _showTravel(self):
+		self.obj.ViewObject.ShowTravel = self.form.checkbox_1_travel.isChecked()
@@ -0,0 +1,89 @@
+#***************************************************************************
+#*                                                                         *
+#*   Copyright (c) 2014                                                    *
+#*   cblt2l <cblt2l@users.sourceforge.net>                                 *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+import FreeCAD
+import os, imp
+from PluginLog import log
+from FreeCADGui import PySideUic as uic
+from PySide import QtGui
+
+__title__="CuraEngine Slicer Plugin"
+__author__ = "cblt2l"
+__url__ = "http://www.freecadweb.org"
+
+# The .ui files live next to this module
+uiDir = os.path.dirname(os.path.abspath(__file__))
+
+# Form name -> compiled Ui_ class, or None if it can't be compiled
+formClasses = {}
+
+def devMode():
+	'''In dev mode the commands reload the plugin modules on every activation'''
+	grp = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/CuraEngine")
+	return grp.GetBool("DevMode", False)
+
+def compileForm(uiFile, pyFile):
+	'''Compile a .ui file to a Python module with whichever uic is available'''
+	try:
+		from pysideuic import compileUi
+	except ImportError:
+		from pyside2uic import compileUi
+	out = open(pyFile + ".tmp", 'w')
+	try:
+		compileUi(open(uiFile), out)
+	finally:
+		out.close()
+	os.rename(pyFile + ".tmp", pyFile)
+
+def getFormClass(name):
+	'''Return the compiled Ui_ class of name.ui, compiling it if it is missing or stale'''
+	if name in formClasses and not devMode():
+		return formClasses[name]
+	uiFile = os.path.join(uiDir, name + ".ui")
+	pyFile = os.path.join(uiDir, "Ui_" + name + ".py")
+	formClass = None
+	try:
+		if not os.path.exists(pyFile) or os.path.getmtime(pyFile) < os.path.getmtime(uiFile):
+			compileForm(uiFile, pyFile)
+		module = imp.load_source("Ui_" + name, pyFile)
+		# uic names the class after the top level widget, eg Ui_Form
+		formClass = [v for k, v in vars(module).items() if k.startswith("Ui_")][0]
+	except Exception as e:
+		log.debug("Can't use a compiled %s form (%s), loading the .ui file", name, e)
+	formClasses[name] = formClass
+	return formClass
+
+def loadForm(name):
+	'''Build the widget described by name.ui
+
+	The widgets are reachable as attributes of the returned form, the same
+	as with uic.loadUi.'''
+	formClass = getFormClass(name)
+	if formClass is None:
+		return uic.loadUi(os.path.join(uiDir, name + ".ui"))
+	form = QtGui.QWidget()
+	ui = formClass()
+	ui.setupUi(form)
+	for key, val in vars(ui).items():
+		setattr(form, key, val)
+	return form